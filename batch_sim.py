@@ -0,0 +1,200 @@
+"""Пакетный прогон партий без окна для подбора баланса и расстановок.
+
+Каждая партия задаётся расстановкой башен, политикой улучшений, seed и
+набором чисел баланса (см. игра.BALANCE). Партии раздаются процессам
+ProcessPoolExecutor; результат не зависит от числа процессов, потому что
+каждая партия детерминирована своим seed, а порядок вывода - порядком задач.
+
+    python batch_sim.py --seeds 0-199 --layouts ring:12 ring:24 --policies none greedy \\
+        --param upgrade_damage=1.1,1.2,1.3 --param boss_health_multiplier=1.0,1.2 \\
+        --max-waves 30 --workers 8 -o sweep.npz
+
+Результат - столбцы NumPy в .npz (np.load), три таблицы:
+
+    games.*  - по строке на партию: параметры, пройдено волн, жизни, деньги
+    waves.*  - по строке на волну: потеряно жизней, жизни и деньги после волны
+    towers.* - по строке на башню и волну: уровень и урон за волну
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+
+import игра as game
+
+DEFAULT_BALANCE = dict(game.BALANCE)
+
+POLICIES = ("none", "greedy", "max")
+
+
+def parse_range(text):
+    # "0-99" или "1,5,7"
+    values = []
+    for part in text.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            values.extend(range(int(start), int(end) + 1))
+        else:
+            values.append(int(part))
+    return values
+
+
+def place_layout(sim, layout):
+    """ring:N - N башен кольцами вокруг пути; cells:x,y;x,y;... - явные клетки."""
+    kind, _, spec = layout.partition(":")
+    if kind == "ring":
+        game.auto_place_towers(sim, int(spec))
+    elif kind == "cells":
+        for cell in spec.split(";"):
+            cx, cy = (int(v) for v in cell.split(","))
+            if sim.place_tower(cx, cy, cost=0) is None:
+                raise ValueError(f"layout {layout!r}: cell ({cx}, {cy}) is not buildable")
+    else:
+        raise ValueError(f"unknown layout {layout!r}")
+
+
+def apply_policy(sim, policy):
+    # Вызывается между волнами
+    if policy == "greedy":
+        # Улучшаем самую слабую башню, пока хватает денег
+        while True:
+            candidates = [t for t in sim.towers if t.level < 5]
+            if not candidates:
+                return
+            tower = min(candidates, key=lambda t: t.level)
+            if not sim.upgrade_tower(tower):
+                return
+    elif policy == "max":
+        # Все башни сразу на 5-й уровень бесплатно (верхняя граница расстановки)
+        for tower in sim.towers:
+            while tower.upgrade():
+                pass
+
+
+def run_game(job):
+    """Одна партия; возвращает словарь со строками трёх таблиц."""
+    game_id, layout, policy, seed, params, max_waves, max_ticks = job
+    game.BALANCE.clear()
+    game.BALANCE.update(DEFAULT_BALANCE)
+    game.BALANCE.update(params)
+
+    sim = game.Simulation(seed=seed)
+    place_layout(sim, layout)
+    apply_policy(sim, policy)
+    waves, towers = [], []
+    lives_before = sim.lives
+    damage_before = [0] * len(sim.towers)
+    sim.start_wave_now()
+    while sim.tick_count < max_ticks:
+        sim.step(1)
+        finished = not sim.wave_in_progress or sim.game_over
+        if not finished:
+            continue
+        waves.append((game_id, sim.wave, lives_before - max(sim.lives, 0), max(sim.lives, 0),
+                      sim.money, sim.tick_count))
+        for i, tower in enumerate(sim.towers):
+            towers.append((game_id, sim.wave, i, tower.level, tower.damage_dealt - damage_before[i]))
+        if sim.game_over or sim.wave >= max_waves:
+            break
+        lives_before = sim.lives
+        damage_before = [tower.damage_dealt for tower in sim.towers]
+        apply_policy(sim, policy)
+        # Перерыв между волнами не влияет на исход - сразу следующая волна
+        sim.start_wave_now()
+
+    survived = sim.wave if not sim.game_over else sim.wave - 1
+    summary = (game_id, layout, policy, seed, json.dumps(params, sort_keys=True), survived,
+               max(sim.lives, 0), sim.money, sim.tick_count, len(sim.towers))
+    return {"game": summary, "waves": waves, "towers": towers}
+
+
+GAME_COLUMNS = ("game", "layout", "policy", "seed", "params", "waves_survived",
+                "lives", "money", "ticks", "tower_count")
+WAVE_COLUMNS = ("game", "wave", "lives_lost", "lives", "money", "tick")
+TOWER_COLUMNS = ("game", "wave", "tower", "level", "damage")
+
+
+def make_jobs(args):
+    grid = {}
+    for spec in args.param:
+        name, _, values = spec.partition("=")
+        if name not in DEFAULT_BALANCE:
+            raise SystemExit(f"unknown parameter {name!r}; known: {', '.join(DEFAULT_BALANCE)}")
+        grid[name] = [float(v) for v in values.split(",")]
+    names = sorted(grid)
+    param_sets = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+    jobs = []
+    for layout, policy, params, seed in itertools.product(args.layouts, args.policies,
+                                                          param_sets, parse_range(args.seeds)):
+        jobs.append((len(jobs), layout, policy, seed, params, args.max_waves, args.max_ticks))
+    return jobs
+
+
+def run_batch(jobs, workers):
+    if workers == 1:
+        try:
+            return [run_game(job) for job in jobs]
+        finally:
+            game.BALANCE.clear()
+            game.BALANCE.update(DEFAULT_BALANCE)
+    # Кусками, чтобы не гонять по одной партии через межпроцессную очередь
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_game, jobs, chunksize=chunksize))
+
+
+def to_columns(prefix, names, rows):
+    columns = {}
+    for i, name in enumerate(names):
+        values = [row[i] for row in rows]
+        columns[f"{prefix}.{name}"] = np.array(values) if values else np.array([], dtype=np.int64)
+    return columns
+
+
+def save(results, filename):
+    columns = {}
+    columns.update(to_columns("games", GAME_COLUMNS, [r["game"] for r in results]))
+    columns.update(to_columns("waves", WAVE_COLUMNS, [row for r in results for row in r["waves"]]))
+    columns.update(to_columns("towers", TOWER_COLUMNS, [row for r in results for row in r["towers"]]))
+    np.savez_compressed(filename, **columns)
+    return columns
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seeds", default="0-9", help="seed партий: 0-99 или 1,5,7")
+    parser.add_argument("--layouts", nargs="+", default=["ring:12"],
+                        help="ring:N или cells:x,y;x,y;...")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=["greedy"])
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="перебрать значения числа из игра.BALANCE (можно несколько раз)")
+    parser.add_argument("--max-waves", type=int, default=30)
+    parser.add_argument("--max-ticks", type=int, default=200000,
+                        help="ограничение длины партии в тиках")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="число процессов (1 - без пула)")
+    parser.add_argument("-o", "--output", default="batch.npz")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = make_jobs(args)
+    started = time.perf_counter()
+    results = run_batch(jobs, args.workers)
+    elapsed = time.perf_counter() - started
+    columns = save(results, args.output)
+    waves = columns["games.waves_survived"]
+    print(f"{len(jobs)} games in {elapsed:.1f} s on {args.workers} worker(s) "
+          f"({len(jobs) / elapsed:.1f} games/s), waves survived: "
+          f"mean {waves.mean():.1f}, min {waves.min()}, max {waves.max()} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Отчёт по памяти и сборщику мусора на 50-й волне: с пулом объектов и без.
+
+Доводит партию до нужной волны, затем прогоняет её целиком и считает, сколько
+врагов и снарядов создано за тик, сколько было сборок мусора и сколько
+занимает один объект.
+
+    python benchmarks/bench_alloc.py --wave 50 --towers 150
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+
+
+class CountingPool(game.EntityPool):
+    # Пул, который ничего не хранит: так же считает создания, но каждый раз
+    # создаёт новый объект - поведение до появления пула
+    def release(self, obj):
+        pass
+
+
+def play_wave(pooling, wave, towers, tower_level, seed):
+    sim = game.Simulation(seed=seed)
+    if not pooling:
+        sim.pool = CountingPool()
+    sim.lives = 10 ** 9
+    game.auto_place_towers(sim, towers, tower_level)
+    sim.wave = wave - 1
+    sim.start_wave()
+
+    collections = [0, 0, 0]
+    gc_time = [0.0]
+    started = []
+
+    def on_gc(phase, info):
+        if phase == "start":
+            started.append(time.perf_counter())
+        else:
+            collections[info["generation"]] += 1
+            gc_time[0] += time.perf_counter() - started.pop()
+
+    gc.collect()
+    created_before = sim.pool.created
+    tracemalloc.start()
+    gc.callbacks.append(on_gc)
+    ticks = 0
+    t0 = time.perf_counter()
+    try:
+        while sim.wave == wave and (sim.wave_in_progress or ticks == 0):
+            sim.tick()
+            ticks += 1
+    finally:
+        elapsed = time.perf_counter() - t0
+        gc.callbacks.remove(on_gc)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "ticks": ticks,
+        "created_per_tick": (sim.pool.created - created_before) / ticks,
+        "reused": sim.pool.reused,
+        "gc": collections,
+        "gc_ms": gc_time[0] * 1000,
+        "peak_kib": peak / 1024,
+        "ms_per_tick": elapsed * 1000 / ticks,
+        "state": (sim.money, sim.lives, sim.tick_count),
+    }
+
+
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wave", type=int, default=50)
+    parser.add_argument("--towers", type=int, default=150)
+    parser.add_argument("--tower-level", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for pooling in (False, True):
+        results[pooling] = play_wave(pooling, args.wave, args.towers, args.tower_level, args.seed)
+    if results[False]["state"] != results[True]["state"]:
+        raise AssertionError("pooling changed the outcome of the wave")
+
+    print(f"wave {args.wave}, {args.towers} towers (level {args.tower_level}), "
+          f"{results[True]['ticks']} ticks")
+    for pooling, r in results.items():
+        label = "pool   " if pooling else "no pool"
+        print(f"  {label}: {r['created_per_tick']:6.3f} new entities/tick, "
+              f"reused {r['reused']:6d}, gc collections (gen0/1/2) {r['gc']}, "
+              f"gc {r['gc_ms']:6.1f} ms, peak traced {r['peak_kib']:8.1f} KiB, "
+              f"{r['ms_per_tick']:.3f} ms/tick")
+
+    path = game.path
+    print(f"  per-object size: Enemy {object_size(game.Enemy(path))} B, "
+          f"Bullet {object_size(game.Bullet(0, 0, None))} B, "
+          f"Tower {object_size(game.Tower(0, 0))} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Стоимость отрисовки стволов башен: поворот каждый кадр против атласа.
+
+Если textures/base_dulo.png нет, используется синтетический ствол того же
+порядка размера. Цели у башен крутятся по кругу, чтобы углы всё время менялись.
+
+    python benchmarks/bench_barrels.py --towers 50 200 500 --steps 64 128 360
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import игра as game
+
+
+class Orbiting:
+    # Минимальная замена врага: у draw_turret_barrel есть только x, y и alive
+    __slots__ = ("x", "y", "alive")
+
+    def __init__(self):
+        self.x = self.y = 0.0
+        self.alive = True
+
+
+def make_towers(count):
+    towers = []
+    cols = max(1, game.WIDTH // game.CELL_SIZE)
+    for i in range(count):
+        cx, cy = i % cols, (i // cols) % max(1, game.HEIGHT // game.CELL_SIZE)
+        tower = game.Tower(*game.cell_center(cx, cy))
+        tower.current_target = Orbiting()
+        towers.append(tower)
+    return towers
+
+
+def frame_time(towers, frames):
+    surface = game.screen
+    started = time.perf_counter()
+    for frame in range(frames):
+        for i, tower in enumerate(towers):
+            phase = (frame * 0.05 + i * 0.37)
+            tower.current_target.x = tower.x + math.cos(phase) * 100
+            tower.current_target.y = tower.y + math.sin(phase) * 100
+            tower.draw_turret_barrel(surface)
+    return (time.perf_counter() - started) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--towers", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--steps", type=int, nargs="+", default=[64, 128, 360])
+    parser.add_argument("--frames", type=int, default=120)
+    args = parser.parse_args()
+
+    game.init_display(headless=True)
+    game.load_assets()
+    if game.base_dulo_image is None:
+        barrel = pygame.Surface((40, 14), pygame.SRCALPHA).convert_alpha()
+        barrel.fill((60, 60, 60, 255), pygame.Rect(20, 3, 20, 8))
+        game.base_dulo_image = barrel
+
+    for count in args.towers:
+        towers = make_towers(count)
+        game.barrel_atlas = None
+        baseline = frame_time(towers, args.frames)
+        line = f"{count:4d} towers: rotate {baseline * 1000:7.3f} ms/frame"
+        for steps in args.steps:
+            game.barrel_atlas = game.RotationAtlas(game.base_dulo_image, steps)
+            started = time.perf_counter()
+            game.barrel_atlas.prebuild()
+            build = time.perf_counter() - started
+            cached = frame_time(towers, args.frames)
+            line += (f" | atlas {steps:3d}: {cached * 1000:6.3f} ms/frame "
+                     f"({baseline / cached:4.1f}x, build {build * 1000:5.1f} ms)")
+        print(line)
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
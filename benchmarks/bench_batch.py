@@ -0,0 +1,53 @@
+"""Масштабирование batch_sim.py по процессам и совпадение с прогоном в одном процессе.
+
+Одни и те же партии гоняются в одном процессе и в пулах разного размера;
+результаты должны совпасть полностью, а время - падать почти линейно, пока
+процессов не больше ядер.
+
+    python benchmarks/bench_batch.py --games 64 --workers 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_sim
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=32)
+    parser.add_argument("--max-waves", type=int, default=12)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({2, 4, os.cpu_count() or 1} - {1}))
+    args = parser.parse_args()
+
+    jobs = batch_sim.make_jobs(batch_sim.parse_args([
+        "--seeds", f"0-{args.games // 2 - 1}", "--layouts", "ring:16",
+        "--policies", "none", "greedy", "--max-waves", str(args.max_waves)]))
+    print(f"{len(jobs)} games, {os.cpu_count()} CPU(s)")
+
+    started = time.perf_counter()
+    reference = batch_sim.run_batch(jobs, 1)
+    single = time.perf_counter() - started
+    print(f"  1 process : {single:7.2f} s")
+
+    ok = True
+    for workers in args.workers:
+        started = time.perf_counter()
+        results = batch_sim.run_batch(jobs, workers)
+        elapsed = time.perf_counter() - started
+        same = results == reference
+        ok &= same
+        speedup = single / elapsed
+        print(f"  {workers} processes: {elapsed:7.2f} s, speedup {speedup:4.2f}x "
+              f"({speedup / min(workers, os.cpu_count() or 1):.0%} per core), "
+              f"{'same results' if same else 'RESULTS DIFFER'}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Массовая постановка башен и выбор башни мышью: перебор списков против Board.
+
+Старые проверки (поиск клетки в path_cells, перебор башен, Rect на каждую
+башню при клике) воспроизведены здесь же. Результаты обоих вариантов
+сверяются: те же башни на тех же клетках и те же ответы на клики.
+
+    python benchmarks/bench_board.py --towers 100 500 1000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import игра as game
+
+
+class LegacySimulation(game.Simulation):
+
+    def can_place_tower(self, cx, cy):
+        if (cx, cy) in game.path_cells:
+            return False
+        x, y = game.cell_center(cx, cy)
+        for tower in self.towers:
+            if tower.x == x and tower.y == y:
+                return False
+        return True
+
+    def tower_at(self, x, y):
+        for tower in self.towers:
+            rect = pygame.Rect(0, 0, tower.size, tower.size)
+            rect.center = (tower.x, tower.y)
+            if rect.collidepoint(x, y):
+                return tower
+        return None
+
+
+def measure(cls, towers, clicks):
+    sim = cls(seed=1)
+    started = time.perf_counter()
+    game.auto_place_towers(sim, towers)
+    placed = time.perf_counter() - started
+    started = time.perf_counter()
+    picked = [sim.tower_at(x, y) for x, y in clicks]
+    picking = time.perf_counter() - started
+    layout = [(t.x, t.y) for t in sim.towers]
+    answers = [None if t is None else (t.x, t.y) for t in picked]
+    return placed, picking, layout, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--towers", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--clicks", type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    span = 60 * game.CELL_SIZE
+    clicks = [(rng.randrange(span), rng.randrange(span)) for _ in range(args.clicks)]
+    for towers in args.towers:
+        old_place, old_pick, old_layout, old_answers = measure(LegacySimulation, towers, clicks)
+        new_place, new_pick, new_layout, new_answers = measure(game.Simulation, towers, clicks)
+        if old_layout != new_layout or old_answers != new_answers:
+            print(f"{towers} towers: results differ")
+            sys.exit(1)
+        print(f"{towers:5d} towers  place: {old_place * 1000:8.1f} -> {new_place * 1000:6.1f} ms   "
+              f"{args.clicks} clicks: {old_pick * 1000:8.1f} -> {new_pick * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
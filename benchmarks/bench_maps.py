@@ -0,0 +1,93 @@
+"""Загрузка карт: разбор JSON с расчётом геометрии против скомпилированной .tdmap.
+
+Проверяет, что скомпилированная карта совпадает с разобранной (точки,
+длины, направления, маска занятости), что maps/classic.json даёт ту же
+партию, что встроенная карта, и что правка исходника пересобирает кэш.
+
+    python benchmarks/bench_maps.py --repeat 200
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import игра as game
+
+
+def same_map(a, b):
+    if (a.cols, a.rows, a.cell_size, a.path_cells, a.blocked, list(a.mask)) != \
+            (b.cols, b.rows, b.cell_size, b.path_cells, b.blocked, list(b.mask)):
+        return False
+    return all(list(p.points) == list(q.points) and list(p.cumulative) == list(q.cumulative)
+               and list(p.directions) == list(q.directions)
+               for p, q in zip(a.paths, b.paths))
+
+
+def play(game_map, ticks=6000):
+    sim = game.Simulation(seed=99, game_map=game_map)
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, 30, (1, 2))
+    sim.step(ticks)
+    return sim.state_digest()
+
+
+def check_rebuild(source):
+    folder = tempfile.mkdtemp(prefix="td-maps-")
+    try:
+        copy = os.path.join(folder, os.path.basename(source))
+        shutil.copy(source, copy)
+        first = game.load_map(copy)
+        compiled = game.CompiledMap.cache_name(copy)
+        with open(copy, encoding="utf-8") as f:
+            text = f.read()
+        with open(copy, "w", encoding="utf-8") as f:
+            f.write(text.replace(f'"cell_size": {first.cell_size}', f'"cell_size": {first.cell_size + 2}'))
+        second = game.load_map(copy)
+        return os.path.exists(compiled) and second.cell_size == first.cell_size + 2
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    ok = True
+    for source in sorted(glob.glob(os.path.join(ROOT, game.MAPS_DIR, "*.json"))):
+        parsed = game.parse_map(source)
+        game.load_map(source)   # компилирует при необходимости
+        compiled = game.CompiledMap.read(game.CompiledMap.cache_name(source), os.stat(source))
+        same = compiled is not None and same_map(parsed, compiled)
+        ok &= same
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            game.parse_map(source)
+        parse_ms = (time.perf_counter() - started) * 1000 / args.repeat
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            game.load_map(source)
+        load_ms = (time.perf_counter() - started) * 1000 / args.repeat
+        print(f"{os.path.basename(source):16s} {len(parsed.paths)} path(s), "
+              f"{parsed.cols}x{parsed.rows}: parse {parse_ms:.3f} ms, compiled {load_ms:.3f} ms "
+              f"[{'same' if same else 'DIFFERENT'}]")
+
+    classic = game.load_map(os.path.join(ROOT, game.MAPS_DIR, "classic.json"))
+    same_game = play(classic) == play(game.current_map)
+    print(f"classic.json plays like the built-in map: {same_game}")
+    rebuilt = check_rebuild(os.path.join(ROOT, game.MAPS_DIR, "classic.json"))
+    print(f"edited source rebuilds the compiled map: {rebuilt}")
+    if not (ok and same_game and rebuilt):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
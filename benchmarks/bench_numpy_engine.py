@@ -0,0 +1,101 @@
+"""Сравнение объектного движка (Simulation) и векторизованного (NumpySimulation).
+
+Сначала прогоняет обе реализации с одинаковым seed и проверяет, что партии
+совпадают тик в тик, затем меряет время тика при 1k/10k/50k врагов и снарядов.
+
+    python benchmarks/bench_numpy_engine.py --sizes 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+from numpy_engine import NumpySimulation
+
+
+def summary(sim):
+    if isinstance(sim, NumpySimulation):
+        n = sim.n_enemies
+        positions = list(zip(sim.enemy_x[:n].tolist(), sim.enemy_y[:n].tolist()))
+        health = sim.enemy_health[:n].tolist()
+        bullets = list(zip(sim.bullet_x[:sim.n_bullets].tolist(), sim.bullet_y[:sim.n_bullets].tolist()))
+    else:
+        positions = [(e.x, e.y) for e in sim.enemies]
+        health = [e.health for e in sim.enemies]
+        bullets = [(b.x, b.y) for b in sim.bullets]
+    return sim.wave, sim.money, sim.lives, positions, health, bullets
+
+
+def check_same_game(ticks, n_towers, seed):
+    sims = []
+    for cls in (game.Simulation, NumpySimulation):
+        sim = cls(seed=seed)
+        sim.lives = 10 ** 6
+        game.auto_place_towers(sim, n_towers)
+        sim.start_wave()
+        sims.append(sim)
+    objects, arrays = sims
+    for tick in range(ticks):
+        objects.step(1)
+        arrays.step(1)
+        if summary(objects) != summary(arrays):
+            raise AssertionError(f"engines diverge at tick {tick + 1} (seed {seed})")
+
+
+def populate(sim, size, seed):
+    # size врагов вдоль всего пути (с запасом здоровья, чтобы не умирали сразу)
+    # и size снарядов, летящих в случайных врагов
+    rng = random.Random(seed)
+    game.auto_place_towers(sim, 100)
+    enemies = []
+    for _ in range(size):
+        enemy = rng.choice((game.Enemy, game.FastEnemy))(sim.path)
+        enemy.health = enemy.max_health = 10 ** 6
+        enemy.place_at(rng.uniform(0, sim.path.length * 0.9))
+        sim.add_enemy(enemy)
+        enemies.append(enemy)
+    for _ in range(size):
+        target = rng.randrange(size)
+        x, y = rng.uniform(0, 1300), rng.uniform(0, 950)
+        if isinstance(sim, NumpySimulation):
+            sim.add_bullets(x, y, 15, target)
+        else:
+            sim.bullets.append(game.Bullet(x, y, enemies[target]))
+
+
+def bench(cls, size, ticks, seed):
+    sim = cls(seed=seed)
+    populate(sim, size, seed)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        sim.tick()
+    return (time.perf_counter() - started) / ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-check", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_check:
+        for seed in range(args.seed, args.seed + 3):
+            check_same_game(30000, 40, seed)
+        print("engines produce identical games")
+
+    for size in args.sizes:
+        objects = bench(game.Simulation, size, args.ticks, args.seed)
+        arrays = bench(NumpySimulation, size, args.ticks, args.seed)
+        print(f"{size:6d} enemies + {size} bullets: objects {objects * 1000:9.2f} ms/tick, "
+              f"numpy {arrays * 1000:8.2f} ms/tick ({objects / arrays:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Отрисовка в потоке RenderPipeline против однопоточного цикла.
+
+1. Точность: та же партия рисуется по кадру на тик в одном потоке и через
+   конвейер; отпечатки холста всех кадров должны совпасть.
+2. Пропускная способность: кадров в секунду (тик + отрисовка + вывод) в
+   одном потоке и с конвейером при разном числе врагов, и сколько стоит
+   снимок RenderFrame. Конвейер включается принудительно, даже если
+   RenderPipeline.available() говорит, что ядро одно, - на одном ядре
+   выигрыша нет, и замер это покажет.
+
+    python benchmarks/bench_pipeline.py --enemies 200 1000 3000 --frames 300
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import игра as game
+from common import crowded
+
+SEED = 25
+
+
+def busy_game(enemies):
+    sim = crowded(game.Simulation(seed=SEED), enemies, 80)
+    sim.step(30)
+    return sim
+
+
+def canvas_digest():
+    return hashlib.md5(pygame.image.tobytes(game.screen, "RGB")).hexdigest()
+
+
+def single_threaded(mode, enemies, frames, digests=None):
+    sim = busy_game(enemies)
+    renderer = game.GameRenderer(mode)
+    selected = sim.towers[0]
+    started = time.perf_counter()
+    for _ in range(frames):
+        sim.step(1)
+        renderer.draw(game.screen, sim, selected)
+        renderer.present()
+        if digests is not None:
+            digests.append(canvas_digest())
+    return frames / (time.perf_counter() - started)
+
+
+def pipelined(mode, enemies, frames, digests=None):
+    sim = busy_game(enemies)
+    renderer = game.GameRenderer(mode)
+    selected = sim.towers[0]
+    pipeline = game.RenderPipeline(renderer, game.screen)
+    capture = 0.0
+    started = time.perf_counter()
+    for _ in range(frames + 1):
+        if sim.tick_count < 30 + frames:
+            sim.step(1)
+            t = time.perf_counter()
+            frame = game.RenderFrame.capture(sim, selected)
+            capture += time.perf_counter() - t
+        else:
+            frame = None
+        if pipeline.finish():
+            renderer.present()
+            if digests is not None:
+                digests.append(canvas_digest())
+        if pipeline.error is not None:
+            raise pipeline.error
+        if frame is not None:
+            pipeline.submit(frame)
+    elapsed = time.perf_counter() - started
+    pipeline.close()
+    return frames / elapsed, capture * 1000 / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--enemies", type=int, nargs="+", default=[200, 1000, 3000])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--check-frames", type=int, default=120)
+    args = parser.parse_args()
+
+    game.init_display(headless=True)
+    game.load_assets()
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count()
+    print(f"cores available: {cores}, RenderPipeline.available(): {game.RenderPipeline.available()}")
+
+    ok = True
+    for mode in ("dirty", "full"):
+        expected, actual = [], []
+        single_threaded(mode, 300, args.check_frames, expected)
+        pipelined(mode, 300, args.check_frames, actual)
+        same = expected == actual
+        ok &= same
+        print(f"{mode:5s} renderer: {len(actual)} frames drawn from snapshots, "
+              f"identical to single-threaded: {same}")
+
+    for mode in ("dirty", "full"):
+        for enemies in args.enemies:
+            serial = single_threaded(mode, enemies, args.frames)
+            piped, capture_ms = pipelined(mode, enemies, args.frames)
+            print(f"{mode:5s} {enemies:5d} enemies: single-threaded {serial:6.1f} fps, "
+                  f"pipelined {piped:6.1f} fps ({piped / serial:4.2f}x), "
+                  f"snapshot {capture_ms:5.2f} ms/frame")
+    pygame.quit()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Снаряды с наведением против попаданий по расписанию (projectiles="analytic").
+
+1. Время полёта одного выстрела: башня стреляет в одиночного врага каждого
+   класса из разных точек её радиуса, сравниваются тики попадания.
+2. Партия целиком: тики убийств врагов (по порядку выхода), утечки и
+   итог волн в обоих режимах.
+3. Отмена: урон, записанный башням, равен здоровью, потерянному врагами, -
+   попадание в уже убитую цель не проходит ни в одном режиме, и пул врагов
+   не отдаёт цель попадания из очереди новому врагу.
+4. Время фаз снарядов и башен при тысячах снарядов в полёте.
+
+    python benchmarks/bench_projectiles.py --ticks 20000 --horde 3000
+"""
+import argparse
+import os
+import sys
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+from common import fill_path
+
+SEED = 31
+MODES = ("homing", "analytic")
+
+
+class TrackedSimulation(game.Simulation):
+    # Запоминает тик выхода и тик смерти каждого врага
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spawned = []
+        self.killed_at = {}
+
+    def add_enemy(self, enemy):
+        self.spawned.append(enemy)
+        super().add_enemy(enemy)
+
+    def update_enemies(self):
+        for enemy in self.enemies:
+            if enemy.health <= 0 and enemy not in self.killed_at:
+                self.killed_at[enemy] = self.tick_count
+        super().update_enemies()
+
+
+def single_shot(mode, cls, angle_steps=16):
+    # Тик попадания первого выстрела для врагов, входящих в радиус с разных сторон
+    ticks = []
+    probe = game.Simulation(seed=SEED)
+    tower_cells = [(cx, cy) for cx in range(0, 26, 3) for cy in range(0, 19, 3)
+                   if probe.can_place_tower(cx, cy)][:angle_steps]
+    for cx, cy in tower_cells:
+        sim = game.Simulation(seed=SEED, projectiles=mode, pooling=False)
+        sim.money = 10 ** 6
+        tower = sim.place_tower(cx, cy)
+        if not tower.coverage:
+            continue
+        enemy = game.make_enemy(cls, sim.path, 5)
+        enemy.health = enemy.max_health = 10 ** 6
+        # Враг появляется чуть раньше своего входа в радиус башни
+        enemy.place_at(max(tower.coverage[0][0] - enemy.speed * 3, 0.0))
+        sim.add_enemy(enemy)
+        fired = None
+        for _ in range(600):
+            sim.tick()
+            if fired is None and tower.reload_counter:
+                fired = sim.tick_count
+            if enemy.health < enemy.max_health:
+                ticks.append(sim.tick_count - fired)
+                break
+    return ticks
+
+
+def play(mode, ticks, pooling=False):
+    sim = TrackedSimulation(seed=SEED, projectiles=mode, pooling=pooling)
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, 30, (1, 2, 3))
+    sim.step(ticks)
+    return sim
+
+
+def horde(mode, count, ticks):
+    sim = game.Simulation(seed=SEED, projectiles=mode)
+    sim.lives = 10 ** 9
+    # Стрельба каждые 3 тика: в воздухе тысячи снарядов
+    for tower in game.auto_place_towers(sim, 150, (1, 3, 5)):
+        tower.reload_time = 3
+    sim.start_wave()
+    fill_path(sim, count, (game.FastEnemy, game.Enemy), 0.95, 10 ** 7)
+    sim.step(60)
+    sim.timer = game.PhaseTimer()
+    in_flight = 0
+    for _ in range(ticks):
+        sim.step(1)
+        in_flight += sim.bullet_count()
+    report = sim.timer.report(ticks)
+    return report.get("bullets", 0.0), report.get("towers", 0.0), in_flight / ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=20000)
+    parser.add_argument("--horde", type=int, default=3000)
+    parser.add_argument("--horde-ticks", type=int, default=300)
+    args = parser.parse_args()
+    ok = True
+
+    print("1. flight time of a single shot, ticks (homing -> analytic):")
+    for cls in (game.Enemy, game.FastEnemy, game.BossEnemy):
+        homing, analytic = (single_shot(mode, cls) for mode in MODES)
+        diffs = [h - a for h, a in zip(homing, analytic)]
+        print(f"   {cls.__name__:10s} {len(diffs)} shots: mean {sum(homing) / len(homing):5.2f} -> "
+              f"{sum(analytic) / len(analytic):5.2f}, analytic earlier by 0..{max(diffs)} ticks, "
+              f"never later: {min(diffs) >= 0}")
+        ok &= min(diffs) >= 0
+
+    print("2. whole game:")
+    games = {mode: play(mode, args.ticks) for mode in MODES}
+    for mode, sim in games.items():
+        kills = [e for e in sim.spawned if e in sim.killed_at]
+        print(f"   {mode:8s} wave {sim.wave}, spawned {len(sim.spawned)}, killed {len(kills)}, "
+              f"leaked {10 ** 6 - sim.lives}, money {sim.money}")
+    homing, analytic = games["homing"], games["analytic"]
+    deltas = []
+    for a, b in zip(homing.spawned, analytic.spawned):
+        if a in homing.killed_at and b in analytic.killed_at:
+            deltas.append(homing.killed_at[a] - analytic.killed_at[b])
+    if deltas:
+        same = sum(1 for d in deltas if d == 0)
+        print(f"   kill tick of the same enemy, homing - analytic: mean {sum(deltas) / len(deltas):+.2f}, "
+              f"min {min(deltas):+d}, max {max(deltas):+d}, identical {same}/{len(deltas)}")
+
+    print("3. cancellation:")
+    for mode in MODES:
+        sim = play(mode, args.ticks)
+        dealt = sum(t.damage_dealt for t in sim.towers)
+        lost = sum(e.max_health - e.health for e in sim.spawned)
+        print(f"   {mode:8s} damage dealt by towers {dealt}, health lost by enemies {lost}: {dealt == lost}")
+        ok &= dealt == lost
+    pooled = play("analytic", args.ticks, pooling=True)
+    unpooled = games["analytic"]
+    same_game = (pooled.tick_count, pooled.wave, pooled.lives, pooled.money) == \
+        (unpooled.tick_count, unpooled.wave, unpooled.lives, unpooled.money)
+    # Враг из пула - тот же объект, что уже выходил раньше
+    reused = len(pooled.spawned) - len({id(enemy) for enemy in pooled.spawned})
+    print(f"   analytic with and without the enemy pool play the same game: {same_game}, "
+          f"enemies reused from the pool: {reused} of {len(pooled.spawned)}")
+    ok &= same_game and reused > 0
+
+    print(f"4. {args.horde} tough enemies, 150 towers, per tick:")
+    for mode in MODES:
+        bullets_ms, towers_ms, in_flight = horde(mode, args.horde, args.horde_ticks)
+        print(f"   {mode:8s} {in_flight:7.0f} shots in flight: bullets {bullets_ms:6.2f} ms, "
+              f"towers {towers_ms:6.2f} ms")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Снимки партии (Snapshot): размер, время сохранения и загрузки, точность.
+
+Партия разгоняется до нужного числа врагов и снарядов, снимается и
+восстанавливается в новую партию. Обе партии продолжаются одинаковое число
+тиков; отпечатки состояния должны совпасть. Так же проверяются векторный
+движок и перенос снимка между движками.
+
+    python benchmarks/bench_snapshot.py --entities 1000 10000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+from common import crowded
+
+SEED = 21
+TOWERS = 200
+
+
+def busy_game(make, entities):
+    # Колонна врагов вдоль пути и башни, которые сразу начинают стрелять:
+    # примерно половина сущностей - враги, половина - снаряды в полёте
+    enemies = entities // 2
+    sim = crowded(make(), enemies, TOWERS, (1, 3, 5))
+    while sim.bullet_count() < entities - enemies and sim.tick_count < 2000:
+        for tower in sim.towers:
+            tower.reload_time = 1
+        sim.step(1)
+    return sim
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - started) * 1000 / repeat
+
+
+def continued_digest(sim, ticks):
+    sim.step(ticks)
+    return sim.tick_count, sim.lives, sim.money, sim.enemy_count(), sim.bullet_count(), \
+        sim.state_digest()
+
+
+def check(name, make, entities, repeat, ticks):
+    sim = busy_game(make, entities)
+    enemies, bullets = sim.enemy_count(), sim.bullet_count()
+    data, save_ms = timed(lambda: game.Snapshot.capture(sim), repeat)
+    # Загрузка в уже идущую партию (F9, автосейв) и развилка в новую
+    target = game.Snapshot.restore(make(), data)
+    _, load_ms = timed(lambda: game.Snapshot.restore(target, data), repeat)
+    _, fork_ms = timed(lambda: game.Snapshot.restore(make(), data), repeat)
+    fork = game.Snapshot.restore(make(), data)
+    same = game.Snapshot.capture(fork) == data
+    same &= continued_digest(fork, ticks) == continued_digest(sim, ticks)
+    print(f"{name:8s} {enemies + bullets:6d} entities ({enemies} enemies, {bullets} bullets, "
+          f"{len(sim.towers)} towers): {len(data) / 1024:6.1f} KiB, save {save_ms:6.2f} ms, "
+          f"load {load_ms:6.2f} ms, fork {fork_ms:6.2f} ms [{'same' if same else 'DIFFERENT'}]")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--ticks", type=int, default=600,
+                        help="сколько тиков продолжать партии после восстановления")
+    args = parser.parse_args()
+
+    engines = {"objects": lambda: game.Simulation(seed=SEED)}
+    try:
+        from numpy_engine import NumpySimulation
+        engines["numpy"] = lambda: NumpySimulation(seed=SEED)
+    except ImportError:
+        print("numpy не установлен - только объектный движок")
+
+    ok = True
+    for entities in args.entities:
+        for name, make in engines.items():
+            ok &= check(name, make, entities, args.repeat, args.ticks)
+
+    if "numpy" in engines:
+        # Снимок объектной партии продолжается в векторном движке так же
+        sim = busy_game(engines["objects"], 2000)
+        data = game.Snapshot.capture(sim)
+        other = game.Snapshot.restore(engines["numpy"](), data)
+        sim.step(args.ticks)
+        other.step(args.ticks)
+        portable = (sim.tick_count, sim.lives, sim.money, sim.enemy_count(), sim.bullet_count()) == \
+            (other.tick_count, other.lives, other.money, other.enemy_count(), other.bullet_count())
+        ok &= portable
+        print(f"objects snapshot continues the same in numpy engine: {portable}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Звуки при сотнях башен: прямой play_sound на каждый запрос против SoundScheduler.
+
+Звуки синтезируются (короткие тоны), микшер работает через dummy-драйвер
+SDL. Партия одна и та же; замеряется только время, ушедшее на звук, и
+число вызовов микшера.
+
+    python benchmarks/bench_sound.py --towers 300 --ticks 1200
+"""
+import argparse
+import array
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import игра as game
+from common import fill_path
+
+SEED = 7
+
+
+def tone(frequency, seconds):
+    rate, _, channels = pygame.mixer.get_init()
+    samples = array.array("h")
+    for i in range(int(rate * seconds)):
+        value = int(8000 * math.sin(2 * math.pi * frequency * i / rate))
+        samples.extend([value] * channels)
+    return pygame.mixer.Sound(buffer=samples.tobytes())
+
+
+def legacy_play(sound):
+    # Старый play_sound: ищем свободный канал, иначе занимаем нулевой
+    for ch in game.channels:
+        if not ch.get_busy():
+            ch.play(sound)
+            return
+    game.channels[0].play(sound)
+
+
+class LegacyScheduler:
+    # Та же точка вызова, но каждый запрос сразу идёт в микшер
+    def __init__(self):
+        self.requested = 0
+
+    def request(self, name):
+        self.requested += 1
+        legacy_play(getattr(game, name))
+
+    def flush(self):
+        pass
+
+
+def run(scheduler, towers, ticks):
+    game.sound_scheduler = scheduler
+    sim = game.Simulation(seed=SEED)
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, towers, (1, 2, 3))
+    sim.start_wave()
+    # Плотная колонна крепких врагов вдоль пути: стреляют все башни сразу
+    fill_path(sim, 2000, (game.Enemy,), 0.95)
+    sound_time = 0.0
+    started = time.perf_counter()
+    for _ in range(ticks):
+        sim.step(1)
+        t = time.perf_counter()
+        scheduler.flush()
+        sound_time += time.perf_counter() - t
+    total = time.perf_counter() - started
+    for ch in game.channels:
+        ch.stop()
+    return total, sound_time, sim.state_digest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--towers", type=int, default=300)
+    parser.add_argument("--ticks", type=int, default=1200)
+    args = parser.parse_args()
+
+    game.init_display(headless=True)
+    game.load_images()
+    game.init_audio()
+    game.shoot_sound = tone(880, 0.15)
+    game.hit_sound = tone(220, 0.2)
+
+    legacy = LegacyScheduler()
+    total, _, legacy_digest = run(legacy, args.towers, args.ticks)
+    print(f"play_sound     {total * 1000:8.1f} ms total, {legacy.requested} mixer plays "
+          f"({legacy.requested / args.ticks:.1f} per tick)")
+
+    scheduler = game.SoundScheduler()
+    total, sound_time, digest = run(scheduler, args.towers, args.ticks)
+    report = scheduler.report()
+    print(f"SoundScheduler {total * 1000:8.1f} ms total, {sound_time * 1000:.1f} ms in flush, "
+          f"{report['played']} mixer plays ({report['played'] / args.ticks:.2f} per tick)")
+    print(f"  requested {report['requested']}, merged {report['merged']}, dropped {report['dropped']}")
+    if digest != legacy_digest:
+        print("game state differs between runs")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
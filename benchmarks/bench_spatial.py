@@ -0,0 +1,117 @@
+"""Запросы к сетке врагов (SpatialHash) против перебора списка enemies.
+
+Для нескольких чисел врагов сверяет ответы query_radius, nearest и
+at_point с полным перебором и меряет время одного запроса и перестройки
+сетки. Затем проверяет, что партия с targeting="spatial" идёт так же, как
+с перебором и с интервалами покрытия, в том числе на карте с двумя путями.
+
+    python benchmarks/bench_spatial.py --enemies 100 1000 5000 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import игра as game
+
+QUERIES = 500
+
+
+def brute_radius(enemies, x, y, radius):
+    return [e for e in enemies if (e.x - x) ** 2 + (e.y - y) ** 2 <= radius * radius]
+
+
+def brute_nearest(enemies, x, y):
+    best, best_sq = None, None
+    for enemy in enemies:
+        d_sq = (enemy.x - x) ** 2 + (enemy.y - y) ** 2
+        if best is None or d_sq < best_sq:
+            best, best_sq = enemy, d_sq
+    return best
+
+
+def brute_at_point(enemies, x, y):
+    return [e for e in enemies if (e.x - x) ** 2 + (e.y - y) ** 2 <= e.radius * e.radius]
+
+
+def make_enemies(count, rng):
+    sim = game.Simulation(seed=1)
+    kinds = (game.Enemy, game.FastEnemy, game.BossEnemy)
+    for _ in range(count):
+        cls = rng.choice(kinds)
+        enemy = cls(sim.path, 1) if cls is game.BossEnemy else cls(sim.path)
+        enemy.place_at(rng.uniform(0, sim.path.length))
+        sim.enemies.append(enemy)
+    return sim.enemies
+
+
+def timed(fn, points):
+    started = time.perf_counter()
+    results = [fn(x, y) for x, y in points]
+    return results, (time.perf_counter() - started) * 1e6 / len(points)
+
+
+def compare(count, rng):
+    enemies = make_enemies(count, rng)
+    points = [(rng.uniform(0, game.WIDTH), rng.uniform(0, game.HEIGHT)) for _ in range(QUERIES)]
+    radius = game.CELL_SIZE * 3
+
+    spatial = game.SpatialHash()
+    started = time.perf_counter()
+    spatial.update(enemies)
+    rebuild = (time.perf_counter() - started) * 1000
+
+    rows = []
+    for name, fast, slow in (
+        ("query_radius", lambda x, y: spatial.query_radius(x, y, radius),
+         lambda x, y: brute_radius(enemies, x, y, radius)),
+        ("nearest", spatial.nearest, lambda x, y: brute_nearest(enemies, x, y)),
+        ("at_point", spatial.at_point, lambda x, y: brute_at_point(enemies, x, y)),
+    ):
+        fast_results, fast_us = timed(fast, points)
+        slow_results, slow_us = timed(slow, points)
+        if fast_results != slow_results:
+            raise AssertionError(f"{name} differs from brute force at {count} enemies")
+        rows.append(f"{name} {slow_us:8.1f} -> {fast_us:6.1f} us")
+    print(f"{count:6d} enemies  rebuild {rebuild:6.2f} ms  " + "  ".join(rows))
+
+
+def play(targeting, game_map, ticks=8000):
+    sim = game.Simulation(targeting=targeting, seed=5, game_map=game_map)
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, 40, (1, 3, 5))
+    for _ in range(8):
+        sim.start_wave()
+    sim.step(ticks)
+    return sim.state_digest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--enemies", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    print(f"per-query time over {QUERIES} random points, brute force -> spatial hash:")
+    for count in args.enemies:
+        compare(count, rng)
+
+    ok = True
+    maps = {"built-in": game.current_map,
+            "crossroads": game.load_map(os.path.join(ROOT, game.MAPS_DIR, "crossroads.json"))}
+    for name, game_map in maps.items():
+        digests = {targeting: play(targeting, game_map) for targeting in (False, True, "spatial")}
+        same = len(set(digests.values())) == 1
+        ok &= same
+        print(f"{name} map: brute / default / spatial targeting play the same game: {same}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Время холодного запуска до первого кадра меню.
+
+Каждый запуск - отдельный процесс, так что импорт pygame и игры честно
+входит в замер. Сравниваются три варианта:
+
+    legacy - как было: pygame.init(), микшер, SysFont, PNG и звуки по очереди
+    cold   - выборочная инициализация, звуки в фоне, кэш картинок пуст
+    warm   - то же с готовым кэшем картинок (обычный повторный запуск)
+
+С --synthetic картинки из манифеста подменяются сгенерированными PNG
+заданного размера во временной папке, чтобы было что декодировать.
+
+    python benchmarks/bench_startup.py --runs 5 --synthetic 256
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(mode, textures):
+    started = time.perf_counter()
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    sys.path.insert(0, ROOT)
+    import pygame
+    import игра as game
+    if textures:
+        game.TEXTURES_DIR = textures
+        game.ASSET_CACHE_FILE = os.path.join(textures, ".cache.bin")
+    imported = time.perf_counter()
+
+    sound_thread = None
+    if mode == "legacy":
+        pygame.init()
+        pygame.mixer.init()
+        game.screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+        game.font = pygame.font.SysFont(None, 40)
+        game.info_font = pygame.font.SysFont(None, 24)
+        game.start_button = game.get_start_button()
+        displayed = time.perf_counter()
+        game.load_images(use_cache=False)
+        game.load_sounds()
+    else:
+        game.init_display(headless=True)
+        displayed = time.perf_counter()
+        sound_thread = game.load_assets(background_sounds=True)
+    loaded = time.perf_counter()
+    game.main_menu()
+    menu = time.perf_counter()
+    if sound_thread is not None:
+        sound_thread.join()
+    sounds = time.perf_counter()
+    print(json.dumps({
+        "import": imported - started,
+        "display": displayed - imported,
+        "assets": loaded - displayed,
+        "menu": menu - started,
+        "sounds_ready": sounds - started,
+    }))
+
+
+def make_synthetic_textures(size):
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    sys.path.insert(0, ROOT)
+    import pygame
+    import игра as game
+    folder = tempfile.mkdtemp(prefix="td-textures-")
+    for i, (filename, _) in enumerate(game.IMAGE_MANIFEST.values()):
+        surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        for y in range(0, size, 4):
+            pygame.draw.line(surface, ((i * 40 + y) % 256, y % 256, 255 - y % 256, 200),
+                             (0, y), (size, size - y), 3)
+        pygame.image.save(surface, os.path.join(folder, filename))
+    return folder
+
+
+def run(mode, textures):
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode]
+    if textures:
+        command += ["--textures", textures]
+    output = subprocess.check_output(command, cwd=ROOT, text=True, stderr=subprocess.DEVNULL)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, metavar="PX", default=0,
+                        help="сгенерировать картинки PX x PX вместо textures/")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--textures", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.textures)
+        return
+
+    textures = make_synthetic_textures(args.synthetic) if args.synthetic else None
+    cache_file = os.path.join(textures or os.path.join(ROOT, "textures"), ".cache.bin")
+    try:
+        for mode in ("legacy", "cold", "warm"):
+            samples = []
+            for _ in range(args.runs):
+                if mode == "cold" and os.path.exists(cache_file):
+                    os.remove(cache_file)
+                samples.append(run(mode, textures))
+            summary = {key: statistics.median(s[key] for s in samples) * 1000 for key in samples[0]}
+            print(f"{mode:6s} " + "  ".join(f"{key} {ms:7.1f} ms" for key, ms in summary.items()))
+    finally:
+        if textures:
+            shutil.rmtree(textures, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Сравнение выбора цели: полный перебор против интервалов покрытия пути.
+
+Сначала проверяет, что TargetingEngine выбирает ровно тех же врагов, что и
+Tower.find_target, затем меряет время выбора целей для всех башен - в том
+числе для пачки врагов одного класса, идущих вровень (burst в описании волны).
+
+    python benchmarks/bench_targeting.py --enemies 500 --towers 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+
+
+def make_world(n_enemies, n_towers, seed):
+    rng = random.Random(seed)
+    sim = game.Simulation()
+    game.auto_place_towers(sim, n_towers)
+    for tower in sim.towers:
+        for _ in range(rng.randrange(5)):
+            tower.upgrade()
+
+    classes = [game.Enemy, game.FastEnemy]
+    for _ in range(n_enemies):
+        enemy = rng.choice(classes)(sim.path)
+        # Часть врагов ставим в одну точку, чтобы проверить разбор ничьих
+        if sim.enemies and rng.random() < 0.1:
+            steps = int(sim.enemies[-1].distance)
+        else:
+            steps = rng.randrange(int(sim.path.length))
+        enemy.distance = float(steps - 1)
+        enemy.pos_index = sim.path.segment_at(enemy.distance)
+        enemy.move()
+        sim.enemies.append(enemy)
+    return sim
+
+
+def burst_world(n_enemies, n_towers):
+    # Пачка вышла в одном тике: все враги на одной дистанции, сплошная ничья
+    sim = game.Simulation()
+    game.auto_place_towers(sim, n_towers)
+    for _ in range(n_enemies):
+        enemy = game.Enemy(sim.path)
+        enemy.distance = sim.path.length / 2 - 1
+        enemy.pos_index = sim.path.segment_at(enemy.distance)
+        enemy.move()
+        sim.enemies.append(enemy)
+    return sim
+
+
+def check_world(sim):
+    engine = game.TargetingEngine()
+    engine.update(sim.enemies)
+    for tower in sim.towers:
+        expected = tower.find_target(sim.enemies)
+        actual = engine.find_target(tower)
+        if expected is not actual:
+            raise AssertionError(f"tower at {(tower.x, tower.y)}: {actual!r} != {expected!r}")
+
+
+def check_simulation(ticks, n_towers, seed):
+    # Две партии с одинаковым seed должны пройти одинаково с движком и без
+    traces = []
+    for targeting in (False, True):
+        sim = game.Simulation(targeting=targeting, seed=seed)
+        sim.lives = 10 ** 6
+        game.auto_place_towers(sim, n_towers)
+        sim.start_wave()
+        trace = []
+        for _ in range(ticks):
+            sim.step(1)
+            trace.append((sim.wave, sim.money, sim.lives, len(sim.enemies), len(sim.bullets),
+                          tuple(sim.enemies.index(t.current_target) if t.current_target in sim.enemies else -1
+                                for t in sim.towers)))
+        traces.append(trace)
+    if traces[0] != traces[1]:
+        first = next(i for i, (a, b) in enumerate(zip(*traces)) if a != b)
+        raise AssertionError(f"simulations diverge at tick {first + 1}")
+
+
+def bench(sim, repeat):
+    engine = game.TargetingEngine()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for tower in sim.towers:
+            tower.find_target(sim.enemies)
+    brute = (time.perf_counter() - started) / repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        engine.update(sim.enemies)
+        for tower in sim.towers:
+            engine.find_target(tower)
+    indexed = (time.perf_counter() - started) / repeat
+    return brute, indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--enemies", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--towers", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--burst", type=int, default=600)
+    args = parser.parse_args()
+
+    for seed in range(args.seed, args.seed + 20):
+        check_world(make_world(300, args.towers, seed))
+    check_simulation(6000, 30, args.seed)
+    print("targets match brute force")
+
+    for n in args.enemies:
+        brute, indexed = bench(make_world(n, args.towers, args.seed), args.repeat)
+        print(f"{n:6d} enemies x {args.towers} towers: brute {brute * 1000:8.3f} ms/tick, "
+              f"intervals {indexed * 1000:8.3f} ms/tick ({brute / indexed:5.1f}x)")
+
+    sim = burst_world(args.burst, args.towers)
+    check_world(sim)
+    brute, indexed = bench(sim, args.repeat)
+    print(f"burst of {args.burst} tied enemies x {args.towers} towers: brute {brute * 1000:8.3f} ms/tick, "
+          f"intervals {indexed * 1000:8.3f} ms/tick ({brute / indexed:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Ускорение 1x/2x/4x/max: детерминизм и реальная скорость с отрисовкой.
+
+Сначала проверяет, что при любой скорости и любом (случайно скачущем)
+времени кадра партия проходит так же, как при простом step(1) подряд:
+отпечатки состояния сравниваются каждые CHECKPOINT тиков. Затем для каждой
+скорости гоняет цикл, как в main(), с отрисовкой через dummy-драйвер SDL и
+печатает тики и кадры в секунду, пропущенные кадры и сброшенные тики.
+
+    python benchmarks/bench_time_scale.py --ticks 20000 --seconds 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import игра as game
+
+SEED = 2024
+CHECKPOINT = 1000
+
+
+class CheckpointSimulation(game.Simulation):
+    # Запоминает отпечаток состояния каждые CHECKPOINT тиков
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.digests = []
+
+    def tick(self):
+        super().tick()
+        if self.tick_count % CHECKPOINT == 0:
+            self.digests.append(self.state_digest())
+
+
+def make_sim():
+    sim = CheckpointSimulation(seed=SEED)
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, 40, (1, 2, 3))
+    sim.start_wave()
+    return sim
+
+
+def run_with_clock(scale, ticks, frame_times):
+    sim = make_sim()
+    clock = game.SimClock(scale)
+    while sim.tick_count < ticks:
+        clock.advance(sim, frame_times.uniform(0.004, 0.12))
+    return sim.digests[:ticks // CHECKPOINT]
+
+
+def check_determinism(ticks):
+    reference = make_sim()
+    reference.step(ticks)
+    expected = reference.digests
+    ok = True
+    for scale in game.SimClock.SCALES:
+        digests = run_with_clock(scale, ticks, random.Random(scale or 0))
+        same = digests == expected
+        ok &= same
+        label = "max" if scale is None else f"{scale}x"
+        print(f"  {label:4s} {len(digests)} checkpoints: {'same' if same else 'DIFFERENT'}")
+    return ok
+
+
+def measure(scale, seconds, renderer):
+    sim = make_sim()
+    clock = game.SimClock(scale)
+    pg_clock = pygame.time.Clock()
+    elapsed = 1 / game.TICKS_PER_SECOND
+    frames = skipped = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        pygame.event.pump()
+        if clock.advance(sim, elapsed):
+            renderer.draw(game.screen, sim)
+            renderer.present()
+            frames += 1
+        else:
+            skipped += 1
+        elapsed = pg_clock.tick(game.TICKS_PER_SECOND if scale is not None else 0) / 1000
+    wall = time.perf_counter() - started
+    return sim.tick_count / wall, frames / wall, skipped, clock.dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    game.init_display(headless=True)
+    game.load_assets()
+
+    print("determinism against step(1):")
+    if not check_determinism(args.ticks):
+        sys.exit(1)
+
+    print("main-loop speed with rendering:")
+    for scale in game.SimClock.SCALES:
+        renderer = game.GameRenderer()
+        tps, fps, skipped, dropped = measure(scale, args.seconds, renderer)
+        label = "max" if scale is None else f"{scale}x"
+        print(f"  {label:4s} {tps:9.1f} ticks/s {fps:7.1f} frames/s "
+              f"skipped {skipped} frames, dropped {dropped} ticks")
+
+
+if __name__ == "__main__":
+    main()
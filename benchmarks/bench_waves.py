@@ -0,0 +1,149 @@
+"""Волны по расписанию (compile_wave + куча событий) против опроса spawn_timer.
+
+Старый спавн (таймер на каждом тике, состав волны в коде) воспроизведён
+здесь же. Обе партии должны выпустить тех же врагов в те же тики и дойти
+до того же исхода. Затем меряется раскладка и выпуск очень больших волн с
+пачками врагов в одном тике и сверяется предпросмотр волны с тем, что
+реально вышло.
+
+    python benchmarks/bench_waves.py --ticks 30000 --big 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+
+SEED = 17
+
+
+def legacy_spawn_enemy_for_wave(wave, path, pool=None, rng=random):
+    chance_fast_enemy = min(game.BALANCE["fast_chance_base"] + game.BALANCE["fast_chance_per_wave"] * wave,
+                            game.BALANCE["fast_chance_max"])
+    cls = game.FastEnemy if rng.random() < chance_fast_enemy else game.Enemy
+    enemy = pool.acquire(cls, path) if pool is not None else cls(path)
+    if wave % 10 == 0:
+        enemy.health = int(enemy.health * game.BALANCE["tenth_wave_health"])
+        enemy.max_health = enemy.health
+    return enemy
+
+
+class RecordingSimulation(game.Simulation):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spawn_log = []
+
+    def add_enemy(self, enemy):
+        self.spawn_log.append((self.tick_count, type(enemy).__name__, enemy.health))
+        super().add_enemy(enemy)
+
+
+class LegacySimulation(RecordingSimulation):
+
+    def start_wave(self):
+        self.wave += 1
+        self.wave_in_progress = True
+        self.enemies_to_spawn = 3 + self.wave * 2
+        if self.wave % 5 == 0:
+            self.enemies_to_spawn += 1
+        self.spawned_enemies = 0
+        self.spawn_timer = 0
+
+    def update_waves(self):
+        if self.wave_in_progress:
+            self.spawn_timer += 1
+            if self.spawn_timer >= game.spawn_interval and self.spawned_enemies < self.enemies_to_spawn:
+                spawn_path = self.paths[self.spawned_enemies % len(self.paths)]
+                if self.wave % 5 == 0 and self.spawned_enemies == self.enemies_to_spawn - 1:
+                    self.add_enemy(self.pool.acquire(game.BossEnemy, spawn_path, self.wave))
+                else:
+                    self.add_enemy(legacy_spawn_enemy_for_wave(self.wave, spawn_path, self.pool, self.rng))
+                self.spawned_enemies += 1
+                self.spawn_timer = 0
+            if self.spawned_enemies == self.enemies_to_spawn and self.enemy_count() == 0:
+                self.wave_in_progress = False
+                self.wave_break_timer = 0
+        else:
+            self.wave_break_timer += 1
+            if self.wave_break_timer >= game.wave_break:
+                self.start_wave()
+
+
+def play(cls, ticks, game_map=None):
+    sim = cls(seed=SEED, game_map=game_map)
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, 25, (1, 2, 3))
+    started = time.perf_counter()
+    sim.step(ticks)
+    elapsed = time.perf_counter() - started
+    outcome = (sim.tick_count, sim.wave, sim.lives, sim.money,
+               [(type(e).__name__, e.distance, e.health) for e in sim.enemies])
+    return sim.spawn_log, outcome, elapsed
+
+
+def big_wave(count):
+    # Две группы одновременно: пачки по 50 обычных врагов раз в 2 тика и
+    # быстрые враги по одному каждый тик
+    groups = [{"enemy": "mixed", "count": count, "interval": 2, "burst": 50},
+              {"enemy": "fast", "count": count // 10, "interval": 1, "at": 0, "health": 0.5}]
+    game.wave_definitions[1] = groups
+    try:
+        sim = RecordingSimulation(seed=SEED)
+        sim.lives = 10 ** 9
+        preview = sim.preview_wave(1)
+        started = time.perf_counter()
+        sim.start_wave()
+        compiled = time.perf_counter() - started
+        started = time.perf_counter()
+        # Выпуск без движения врагов: меряется только спавн
+        last = max(event[0] for event in sim.timeline)
+        while sim.timeline:
+            sim.tick_count += 1
+            sim.update_waves()
+        spawning = time.perf_counter() - started
+    finally:
+        del game.wave_definitions[1]
+    spawned = sum(health for _, _, health in sim.spawn_log)
+    same = (preview["count"], preview["health"]) == (len(sim.spawn_log), spawned)
+    print(f"wave of {preview['count']} enemies, {preview['health']} HP over {last} ticks: "
+          f"compile {compiled * 1000:.1f} ms, spawn {spawning * 1000:.1f} ms "
+          f"({spawning * 1e6 / last:.1f} us/tick); preview matches spawned: {same}")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=30000)
+    parser.add_argument("--big", type=int, default=200000)
+    args = parser.parse_args()
+
+    ok = True
+    maps = {"built-in": game.current_map,
+            "crossroads": game.load_map(os.path.join(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__))), game.MAPS_DIR, "crossroads.json"))}
+    for name, game_map in maps.items():
+        old_log, old_outcome, old_time = play(LegacySimulation, args.ticks, game_map)
+        new_log, new_outcome, new_time = play(RecordingSimulation, args.ticks, game_map)
+        same = old_log == new_log and old_outcome == new_outcome
+        ok &= same
+        print(f"{name:10s} {len(new_log)} spawns in {args.ticks} ticks (wave {new_outcome[1]}): "
+              f"polling {old_time:.2f} s, timeline {new_time:.2f} s, same spawns and outcome: {same}")
+
+    ok &= big_wave(args.big)
+    try:
+        game.validate_wave([{"enemy": "dragon", "count": 3}])
+        ok = False
+    except ValueError as e:
+        print(f"invalid wave rejected: {e}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
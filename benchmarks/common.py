@@ -0,0 +1,24 @@
+"""Общие заготовки партий для бенчмарков."""
+import игра as game
+
+
+def fill_path(sim, count, kinds=(game.FastEnemy, game.Enemy, game.Enemy), spread=0.9,
+              health=10 ** 6):
+    """count врагов равномерно по первым spread пути, классы kinds по кругу.
+
+    Здоровье с запасом, чтобы башни не выбивали врагов за первые тики.
+    """
+    for i in range(count):
+        enemy = game.make_enemy(kinds[i % len(kinds)], sim.path, max(sim.wave, 1))
+        enemy.health = enemy.max_health = health
+        enemy.place_at(sim.path.length * spread * i / count)
+        sim.add_enemy(enemy)
+    return sim
+
+
+def crowded(sim, enemies, towers, levels=(1, 2, 3), **fill):
+    """Партия с башнями вдоль пути, начатой волной и колонной врагов (fill_path)."""
+    sim.lives = 10 ** 6
+    game.auto_place_towers(sim, towers, levels)
+    sim.start_wave()
+    return fill_path(sim, enemies, **fill)
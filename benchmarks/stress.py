@@ -0,0 +1,204 @@
+"""Нагрузочные сценарии с замером времени по фазам тика и кадра.
+
+Работает без окна и звука (dummy-драйверы SDL). Для каждого сценария
+печатает тики в секунду и миллисекунды на тик по фазам симуляции (spawn,
+bullets, enemies, towers) и отрисовки (background, sprites, barrels, hud,
+present ...), а с --json сохраняет результаты для сравнения коммитов.
+
+    python benchmarks/stress.py --json after.json
+    python benchmarks/stress.py --baseline before.json --threshold 0.15
+
+С --baseline скрипт завершается с кодом 1, если какой-то сценарий стал
+медленнее базового больше чем на threshold (доля).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import игра as game
+from common import fill_path
+
+SEED = 12345
+LEVELS = (1, 2, 3, 4, 5)
+
+
+def wave_scenario(wave, towers=60):
+    # Пик поздней волны: вся волна wave (классы из compile_wave) сразу на поле,
+    # равномерно по пути и с запасом здоровья. Если выпускать её по
+    # расписанию, башни выбивают врагов на выходе, и за время замера на
+    # поле почти никого нет
+    def setup(sim):
+        sim.lives = 10 ** 9
+        game.auto_place_towers(sim, towers, LEVELS)
+        sim.wave = wave - 1
+        sim.start_wave()
+        kinds = [cls for _, _, cls, _ in sorted(sim.timeline)]
+        sim.timeline.clear()
+        sim.spawned_enemies = len(kinds)
+        fill_path(sim, len(kinds), kinds, 0.95, 10 ** 7)
+    return setup
+
+
+def towers_scenario(count, enemies=300):
+    # count башен и толпа врагов по всему пути, чтобы выбору целей было
+    # из кого выбирать: волна по расписанию выходит по одному врагу
+    def setup(sim):
+        sim.lives = 10 ** 9
+        game.auto_place_towers(sim, count, LEVELS)
+        sim.start_wave()
+        fill_path(sim, enemies, (game.Enemy, game.FastEnemy), 0.95, 10 ** 7)
+    return setup
+
+
+def horde_scenario(count, towers=60):
+    # count врагов одновременно, равномерно по пути, с запасом здоровья
+    def setup(sim):
+        sim.lives = 10 ** 9
+        game.auto_place_towers(sim, towers, LEVELS)
+        sim.start_wave()
+        fill_path(sim, count, (game.Enemy, game.FastEnemy, game.BossEnemy), 0.95, 10 ** 7)
+    return setup
+
+
+SCENARIOS = {
+    "wave_50": wave_scenario(50),
+    "wave_100": wave_scenario(100),
+    "wave_200": wave_scenario(200),
+    "towers_100": towers_scenario(100),
+    "towers_500": towers_scenario(500),
+    "enemies_1000": horde_scenario(1000),
+    "enemies_5000": horde_scenario(5000),
+}
+
+
+def run_scenario(setup, ticks, warmup, render):
+    sim = game.Simulation(seed=SEED)
+    setup(sim)
+    renderer = game.GameRenderer() if render else None
+    for _ in range(warmup):
+        sim.step(1)
+        if renderer is not None:
+            renderer.draw(game.screen, sim)
+            renderer.present()
+
+    timer = game.PhaseTimer()
+    sim.timer = timer
+    if renderer is not None:
+        renderer.timer = timer
+    sim_time = 0.0
+    frame_time = 0.0
+    done = 0
+    for _ in range(ticks):
+        started = time.perf_counter()
+        if sim.step(1) == 0:
+            break
+        drawn = time.perf_counter()
+        if renderer is not None:
+            renderer.draw(game.screen, sim)
+            renderer.present()
+        finished = time.perf_counter()
+        sim_time += drawn - started
+        frame_time += finished - started
+        done += 1
+
+    return {
+        "ticks": done,
+        "ticks_per_second": done / sim_time if sim_time else 0.0,
+        "frames_per_second": done / frame_time if render and frame_time else None,
+        "phases_ms": timer.report(per=max(done, 1)),
+        "enemies": sim.enemy_count(),
+        "bullets": sim.bullet_count(),
+        "towers": len(sim.towers),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    # Сравниваем по кадрам в секунду, если рисовали, иначе по тикам в секунду
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        metric = "frames_per_second" if result.get("frames_per_second") else "ticks_per_second"
+        if not old.get(metric):
+            continue
+        change = result[metric] / old[metric] - 1
+        marker = ""
+        if change < -threshold:
+            regressions.append(name)
+            marker = "  <-- REGRESSION"
+        print(f"  {name:14s} {metric}: {old[metric]:10.1f} -> {result[metric]:10.1f} "
+              f"({change * 100:+6.1f}%){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS),
+                        help=f"какие сценарии запускать (по умолчанию все: {', '.join(SCENARIOS)})")
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--no-render", action="store_true", help="только симуляция")
+    parser.add_argument("--json", metavar="FILE", help="куда сохранить результаты")
+    parser.add_argument("--baseline", metavar="FILE", help="результаты для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="допустимое замедление относительно baseline (доля)")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    game.init_display(headless=True)
+    game.load_assets()
+    render = not args.no_render
+
+    results = {}
+    for name in args.scenarios:
+        result = run_scenario(SCENARIOS[name], args.ticks, args.warmup, render)
+        results[name] = result
+        phases = ", ".join(f"{phase} {ms:.3f}" for phase, ms in result["phases_ms"].items())
+        fps = f", {result['frames_per_second']:8.1f} frames/s" if result["frames_per_second"] else ""
+        print(f"{name:14s} {result['ticks_per_second']:9.1f} ticks/s{fps} "
+              f"[{result['enemies']} enemies, {result['bullets']} bullets, {result['towers']} towers]")
+        print(f"{'':14s} ms/tick: {phases}")
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "ticks": args.ticks,
+        "render": render,
+        "scenarios": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"compared with {args.baseline} (revision {baseline.get('revision')}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"regressed past {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
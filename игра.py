@@ -3,15 +3,27 @@ import sys
 import os
 import math
 import random
-
-pygame.init()
-pygame.mixer.init()
-
-infoObject = pygame.display.Info()
-WIDTH, HEIGHT = infoObject.current_w, infoObject.current_h
-
-screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
-pygame.display.set_caption("Tower Defense")
+import time
+import bisect
+import heapq
+import struct
+import hashlib
+import itertools
+import threading
+import queue
+from array import array
+from collections import OrderedDict, deque, namedtuple
+import json
+import argparse
+
+TICKS_PER_SECOND = 60   # Один тик симуляции = один кадр при 60 FPS
+
+# Логический размер холста, на котором рисуется игра. init_display() берёт
+# его из текущей карты (столбцы и строки x CELL_SIZE) и больше не меняет:
+# размер окна на него не влияет
+WIDTH, HEIGHT = 1280, 720
+
+screen = None
 
 WHITE = (255, 255, 255)
 GRAY = (50, 50, 50)
@@ -21,29 +33,104 @@ BLACK = (0, 0, 0)
 BLUE = (0, 0, 255)
 YELLOW = (255, 255, 0)
 
-font = pygame.font.SysFont(None, 40)
-info_font = pygame.font.SysFont(None, 24)
+font = None
+info_font = None
 
 SOUNDS_DIR = os.path.join("sounds")
 TEXTURES_DIR = os.path.join("textures")
 
 CHANNELS_COUNT = 8
-pygame.mixer.set_num_channels(CHANNELS_COUNT)
-channels = [pygame.mixer.Channel(i) for i in range(CHANNELS_COUNT)]
-
-def play_sound(sound):
-    if sound is None:
-        return
-    for ch in channels:
-        if not ch.get_busy():
-            ch.play(sound)
+channels = []
+
+class SoundScheduler:
+    """Собирает запросы звуков за проход цикла и проигрывает их разом в flush().
+
+    Одинаковые звуки сливаются в одно воспроизведение, громкость которого
+    растёт как корень из числа запросов (так складываются некоррелированные
+    источники). У каждого звука свой предел одновременных голосов. Когда
+    свободных каналов нет, звук вытесняет менее важный: пауза > попадания >
+    выстрелы. Счётчики merged и dropped показывают, сколько запросов слито и
+    сколько отброшено.
+    """
+
+    # глобал звука -> (приоритет, максимум голосов, громкость одного звука)
+    VOICES = {
+        "pause_on_sound": (2, 1, 1.0),
+        "pause_off_sound": (2, 1, 1.0),
+        "hit_sound": (1, 3, 0.6),
+        "shoot_sound": (0, 2, 0.5),
+    }
+
+    def __init__(self):
+        self.pending = {}
+        self.requested = 0
+        self.merged = 0
+        self.dropped = 0
+        self.played = 0
+
+    def request(self, name):
+        pending = self.pending
+        pending[name] = pending.get(name, 0) + 1
+
+    def flush(self):
+        if not self.pending:
             return
-    channels[0].play(sound)
-
-def load_sound(filename):
+        pending = self.pending
+        self.pending = {}
+        assets = globals()
+        priorities = {}
+        for name, (priority, _, _) in self.VOICES.items():
+            if assets[name] is not None:
+                priorities[assets[name]] = priority
+        for name in sorted(pending, key=lambda name: -self.VOICES[name][0]):
+            count = pending[name]
+            self.requested += count
+            sound = assets[name]
+            if sound is None:
+                continue
+            priority, limit, volume = self.VOICES[name]
+            self.merged += count - 1
+            channel = self.pick_channel(sound, priority, limit, priorities)
+            if channel is None:
+                self.dropped += 1
+                continue
+            channel.set_volume(min(1.0, volume * math.sqrt(count)))
+            channel.play(sound)
+            self.played += 1
+
+    @staticmethod
+    def pick_channel(sound, priority, limit, priorities):
+        voices = 0
+        free = None
+        victim = None
+        victim_priority = priority
+        for channel in channels:
+            current = channel.get_sound() if channel.get_busy() else None
+            if current is None:
+                if free is None:
+                    free = channel
+            elif current is sound:
+                voices += 1
+            elif priorities.get(current, 0) < victim_priority:
+                victim = channel
+                victim_priority = priorities.get(current, 0)
+        if voices >= limit:
+            return None
+        return free if free is not None else victim
+
+    def report(self):
+        return {"requested": self.requested, "played": self.played,
+                "merged": self.merged, "dropped": self.dropped}
+
+sound_scheduler = SoundScheduler()
+
+def load_sound(filename, missing=None):
     path = os.path.join(SOUNDS_DIR, filename)
     if not os.path.isfile(path):
-        print(f"Warning: sound file '{path}' not found!")
+        if missing is None:
+            print(f"Warning: sound file '{path}' not found!")
+        else:
+            missing.append(path)
         return None
     try:
         return pygame.mixer.Sound(path)
@@ -51,10 +138,13 @@ def load_sound(filename):
         print(f"Error loading sound {filename}: {e}")
         return None
 
-def load_image(filename):
+def load_image(filename, missing=None):
     path = os.path.join(TEXTURES_DIR, filename)
     if not os.path.isfile(path):
-        print(f"Warning: image file '{path}' not found!")
+        if missing is None:
+            print(f"Warning: image file '{path}' not found!")
+        else:
+            missing.append(path)
         return None
     try:
         return pygame.image.load(path).convert_alpha()
@@ -62,18 +152,307 @@ def load_image(filename):
         print(f"Error loading image {filename}: {e}")
         return None
 
-shoot_sound = load_sound("shoot.wav")
-hit_sound = load_sound("hit.wav")
-pause_on_sound = load_sound("pause_on.wav")    # Звук постановки на паузу
-pause_off_sound = load_sound("pause_off.wav")  # Звук выхода из паузы
-
-enemy_image = load_image("enemy.png")
-fast_enemy_image = load_image("fast_enemy.png")  # для быстрого врага
-boss_image = load_image("boss.png")
-bullet_image = load_image("bullet.png")
-tower_base_image = load_image("tower_base.png")
-base_dulo_image = load_image("base_dulo.png")
-fast_boss_image = load_image("fast_boss.png")
+shoot_sound = None
+hit_sound = None
+pause_on_sound = None    # Звук постановки на паузу
+pause_off_sound = None   # Звук выхода из паузы
+
+enemy_image = None
+fast_enemy_image = None  # для быстрого врага
+boss_image = None
+bullet_image = None
+tower_base_image = None
+base_dulo_image = None
+fast_boss_image = None
+
+BARREL_ANGLE_STEPS = 128   # на сколько углов заранее повёрнут ствол башни (0 - поворот каждый кадр)
+barrel_atlas = None
+
+# Манифест ресурсов: глобальная переменная -> файл. У картинок ещё размер в
+# клетках (сторона = size * CELL_SIZE); None - оставить исходный размер
+SOUND_MANIFEST = {
+    "shoot_sound": "shoot.wav",
+    "hit_sound": "hit.wav",
+    "pause_on_sound": "pause_on.wav",
+    "pause_off_sound": "pause_off.wav",
+}
+IMAGE_MANIFEST = {
+    "enemy_image": ("enemy.png", None),
+    "fast_enemy_image": ("fast_enemy.png", None),
+    "boss_image": ("boss.png", None),
+    "bullet_image": ("bullet.png", None),
+    "tower_base_image": ("tower_base.png", None),
+    "base_dulo_image": ("base_dulo.png", None),
+    "fast_boss_image": ("fast_boss.png", None),
+}
+
+# Картинки из манифеста, уже отмасштабированные, в сыром RGBA: читаются без
+# распаковки PNG. Запись устаревает, если поменялся исходный файл, его
+# размер в манифесте или CELL_SIZE.
+ASSET_CACHE_FILE = os.path.join(TEXTURES_DIR, ".cache.bin")
+
+class ImageCache:
+    MAGIC = b"TDIC"
+    VERSION = 1
+    _HEADER = struct.Struct("<4sHI")
+    # длина имени, mtime_ns и размер исходника, CELL_SIZE, size*1000, ширина, высота
+    _ENTRY = struct.Struct("<HqQHiHH")
+
+    def __init__(self, filename=None):
+        self.filename = filename or ASSET_CACHE_FILE
+        self.entries = {}   # имя файла -> (ключ, (w, h), байты RGBA)
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+
+    def read(self):
+        try:
+            with open(self.filename, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        try:
+            self.entries = self._parse(data)
+        except (struct.error, ValueError, UnicodeDecodeError):
+            # Битый кэш (обрезанный, с мусором в конце) просто собирается заново
+            self.entries = {}
+
+    @classmethod
+    def _parse(cls, data):
+        magic, version, count = cls._HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            return {}
+        entries = {}
+        offset = cls._HEADER.size
+        for _ in range(count):
+            name_len, mtime, src_size, cell, scale, w, h = cls._ENTRY.unpack_from(data, offset)
+            offset += cls._ENTRY.size
+            end = offset + name_len + w * h * 4
+            if end > len(data):
+                raise ValueError("кэш картинок обрезан")
+            name = data[offset:offset + name_len].decode("utf-8")
+            entries[name] = ((mtime, src_size, cell, scale), (w, h), data[offset + name_len:end])
+            offset = end
+        if offset != len(data):
+            raise ValueError("лишние данные в конце кэша картинок")
+        return entries
+
+    def write(self):
+        if not self.changed:
+            return
+        parts = [self._HEADER.pack(self.MAGIC, self.VERSION, len(self.entries))]
+        for name, ((mtime, src_size, cell, scale), (w, h), pixels) in self.entries.items():
+            encoded = name.encode("utf-8")
+            parts.append(self._ENTRY.pack(len(encoded), mtime, src_size, cell, scale, w, h))
+            parts.append(encoded)
+            parts.append(pixels)
+        try:
+            with open(self.filename + ".tmp", "wb") as f:
+                f.write(b"".join(parts))
+            os.replace(self.filename + ".tmp", self.filename)
+        except OSError as e:
+            print(f"Warning: asset cache not written: {e}")
+        self.changed = False
+
+    def load(self, filename, size, missing=None):
+        path = os.path.join(TEXTURES_DIR, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.entries.pop(filename, None)
+            return load_image(filename, missing)
+        key = (stat.st_mtime_ns, stat.st_size, CELL_SIZE, -1 if size is None else int(size * 1000))
+        entry = self.entries.get(filename)
+        if entry is not None and entry[0] == key:
+            try:
+                image = pygame.image.frombytes(entry[2], entry[1], "RGBA").convert_alpha()
+            except ValueError:
+                # Размер записи не сходится с байтами: собрать её заново
+                image = None
+            if image is not None:
+                self.hits += 1
+                return image
+        self.misses += 1
+        image = load_image(filename, missing)
+        if image is None:
+            return None
+        if size is not None:
+            side = max(1, round(size * CELL_SIZE))
+            image = pygame.transform.smoothscale(image, (side, side))
+        self.entries[filename] = (key, image.get_size(), pygame.image.tobytes(image, "RGBA"))
+        self.changed = True
+        return image
+
+def init_audio():
+    global channels
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    pygame.mixer.set_num_channels(CHANNELS_COUNT)
+    channels = [pygame.mixer.Channel(i) for i in range(CHANNELS_COUNT)]
+
+def load_sounds():
+    # Микшер поднимается здесь, а не в init_display: открытие звукового
+    # устройства - одна из самых долгих частей запуска
+    try:
+        init_audio()
+    except pygame.error as e:
+        print(f"Warning: no audio: {e}")
+        return
+    missing = []
+    sounds = {name: load_sound(filename, missing) for name, filename in SOUND_MANIFEST.items()}
+    # Звуки публикуются только после того, как готовы каналы
+    globals().update(sounds)
+    if missing:
+        print(f"Warning: sound files not found: {', '.join(missing)}")
+
+def load_sounds_in_background():
+    """Грузит звуки в фоновом потоке, пока показывается меню.
+
+    До окончания загрузки звуковые глобалы остаются None, и запросы
+    звуков просто не делаются.
+    """
+    thread = threading.Thread(target=load_sounds, name="sound-loader", daemon=True)
+    thread.start()
+    return thread
+
+def load_images(use_cache=True):
+    global barrel_atlas
+    # convert_alpha() требует уже созданного окна, поэтому вызываем после init_display()
+    cache = ImageCache() if use_cache else None
+    if cache is not None:
+        cache.read()
+    missing = []
+    for name, (filename, size) in IMAGE_MANIFEST.items():
+        if cache is not None:
+            image = cache.load(filename, size, missing)
+        else:
+            image = load_image(filename, missing)
+            if image is not None and size is not None:
+                side = max(1, round(size * CELL_SIZE))
+                image = pygame.transform.smoothscale(image, (side, side))
+        globals()[name] = image
+    if cache is not None:
+        cache.write()
+    if missing:
+        print(f"Warning: image files not found: {', '.join(missing)}")
+
+    if base_dulo_image and BARREL_ANGLE_STEPS > 0:
+        barrel_atlas = RotationAtlas(base_dulo_image, BARREL_ANGLE_STEPS)
+    else:
+        barrel_atlas = None
+    return cache
+
+def load_assets(background_sounds=False, use_cache=True):
+    """Загружает картинки (через кэш) и звуки; звуки можно грузить в фоне.
+
+    Возвращает поток загрузки звуков или None, если они уже загружены.
+    """
+    load_images(use_cache)
+    if background_sounds:
+        return load_sounds_in_background()
+    load_sounds()
+    return None
+
+class RotationAtlas:
+    """Картинка, заранее повёрнутая на steps равных углов.
+
+    Повороты строятся лениво при первом запросе угла (или все сразу через
+    prebuild), а get() отдаёт ближайший готовый вместо pygame.transform.rotate
+    каждый кадр. Погрешность угла - не больше 180 / steps градусов.
+    """
+
+    def __init__(self, image, steps=BARREL_ANGLE_STEPS):
+        self.image = image
+        self.steps = steps
+        self.frames = [None] * steps
+
+    def index(self, angle):
+        return round(angle * self.steps / 360) % self.steps
+
+    def get(self, angle):
+        i = self.index(angle)
+        frame = self.frames[i]
+        if frame is None:
+            frame = pygame.transform.rotate(self.image, i * 360 / self.steps)
+            self.frames[i] = frame
+        return frame
+
+    def prebuild(self):
+        for i in range(self.steps):
+            self.get(i * 360 / self.steps)
+
+class HealthBarStrip:
+    """Заранее нарисованные полоски здоровья: по одной на каждый пиксель заливки.
+
+    Полоска целиком (рамка, красный фон, зелёная часть) выводится одним blit
+    вместо трёх pygame.draw.rect на врага.
+    """
+
+    def __init__(self, width, height):
+        self.width = int(width)
+        self.bars = []
+        for filled in range(self.width + 1):
+            bar = pygame.Surface((self.width + 2, height + 2))
+            bar.fill(BLACK)
+            bar.fill(RED, (1, 1, self.width, height))
+            bar.fill(GREEN, (1, 1, filled, height))
+            self.bars.append(bar.convert())
+
+    def get(self, fraction):
+        filled = int(self.width * fraction)
+        if filled < 0:
+            filled = 0
+        elif filled > self.width:
+            filled = self.width
+        return self.bars[filled]
+
+_circle_sprites = {}
+
+def circle_sprite(color, radius):
+    # Запасной спрайт для врагов и снарядов без текстуры
+    key = (color, radius)
+    sprite = _circle_sprites.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, color, (radius, radius), radius)
+        sprite = sprite.convert_alpha()
+        _circle_sprites[key] = sprite
+    return sprite
+
+class TextCache:
+    """LRU-кэш отрисованных строк: (шрифт, текст, цвет, сглаживание) -> Surface.
+
+    Надписи HUD, подсказки и кнопки почти не меняются, поэтому в
+    установившемся кадре font.render не вызывается вовсе.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+text_cache = TextCache()
+
+def render_text(font, text, color, antialias=True):
+    return text_cache.render(font, text, color, antialias)
 
 MENU = "menu"
 PLAYING = "playing"
@@ -84,20 +463,29 @@ CELL_SIZE = 50
 dev_console = False
 console_input = ""
 
-grid_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-grid_surface.fill((0, 0, 0, 0))
+grid_surface = None
 
-wave = 0
-wave_in_progress = False
-enemies_to_spawn = 0
-spawned_enemies = 0
 spawn_interval = 30
-spawn_timer = 0
-
-wave_break = 5 * 60
-wave_break_timer = 0
-
-paused = False  # Для паузы
+wave_break = 5 * TICKS_PER_SECOND
+
+# Числа баланса, которые перебирает batch_sim.py. Читаются по ходу игры,
+# так что их можно менять между партиями
+BALANCE = {
+    "upgrade_damage": 1.2,           # уровни 2-4: множители урона, дальности, перезарядки
+    "upgrade_range": 1.1,
+    "upgrade_reload": 0.9,
+    "max_upgrade_damage": 2.0,       # уровень 5
+    "max_upgrade_range": 1.5,
+    "max_upgrade_reload": 0.7,
+    "fast_chance_base": 0.1,         # вероятность быстрого врага: base + per_wave * волна, не больше max
+    "fast_chance_per_wave": 0.05,
+    "fast_chance_max": 0.5,
+    "tenth_wave_health": 1.7,        # здоровье обычных врагов на каждой 10-й волне
+    "boss_base_health": 800,         # здоровье босса: (base + step * (волна // 5)) * multiplier
+    "boss_health_step": 200,
+    "boss_health_multiplier": 1.2,
+    "fast_boss_health_multiplier": 0.8,
+}
 
 class Button:
     def __init__(self, text, x, y, w, h, color, hover_color):
@@ -112,9 +500,10 @@ class Button:
             pygame.draw.rect(surface, self.hover_color, self.rect)
         else:
             pygame.draw.rect(surface, self.color, self.rect)
-        text_surface = font.render(self.text, True, WHITE)
+        text_surface = render_text(font, self.text, WHITE)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
+        return self.rect.union(text_rect)
 
     def is_clicked(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -124,13 +513,53 @@ class Button:
 def get_start_button():
     return Button("Начать игру", WIDTH // 2 - 100, HEIGHT // 2 - 30, 200, 60, GRAY, BLUE)
 
-start_button = get_start_button()
+start_button = None
 
 def get_start_wave_button():
     # Смещено чуть ниже (примерно +40 пикселей)
     return Button("Начать волну сейчас", 10, 150, 300, 50, GRAY, BLUE)
 
-start_wave_button = get_start_wave_button()
+start_wave_button = None
+
+def init_display(headless=False):
+    """Создаёт окно и логический холст screen размером WIDTH x HEIGHT.
+
+    Размер холста задаёт текущая карта (см. use_map), так что повторный
+    вызов даёт тот же холст. Окно открывается с pygame.SCALED: SDL один раз
+    за кадр растягивает холст на окно (на видеокарте, если она есть) и сам
+    переводит координаты мыши обратно в пиксели холста. Изменение размера
+    окна холст не трогает.
+    """
+    global screen, WIDTH, HEIGHT, font, info_font
+    global start_button, start_wave_button
+
+    if headless:
+        # Без окна и звуковой карты: SDL рисует в память, звук уходит в никуда
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    # Только нужные подсистемы: pygame.init() заодно поднимает микшер,
+    # джойстики и прочее. Микшер запускается в load_sounds()
+    pygame.display.init()
+    pygame.font.init()
+
+    WIDTH, HEIGHT = current_map.cols * CELL_SIZE, current_map.rows * CELL_SIZE
+    if headless:
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    else:
+        try:
+            screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED | pygame.RESIZABLE)
+        except pygame.error:
+            # Нет рендерера SDL: окно размером с холст, без растяжения
+            screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Tower Defense")
+
+    # То же, что SysFont(None, ...), но без перебора системных шрифтов
+    font = pygame.font.Font(None, 40)
+    info_font = pygame.font.Font(None, 24)
+
+    start_button = get_start_button()
+    start_wave_button = get_start_wave_button()
 
 def cell_center(cx, cy):
     return cx * CELL_SIZE + CELL_SIZE // 2, cy * CELL_SIZE + CELL_SIZE // 2
@@ -147,28 +576,405 @@ path_cells = [
     (24, 18), (25, 18),
 ]
 
+class PathIndex:
+    """Ломаная пути с заранее посчитанной геометрией.
+
+    cumulative[i] - длина пути от начала до i-й точки, directions[i] - единичный
+    вектор i-го отрезка. Положение на пути задаётся одним числом - пройденным
+    расстоянием, и переводится в координаты без корней и тригонометрии.
+    """
+
+    def __init__(self, points):
+        self.points = list(points)
+        self.cumulative = [0.0]
+        self.directions = []
+        for (x0, y0), (x1, y1) in zip(self.points, self.points[1:]):
+            segment_len = math.hypot(x1 - x0, y1 - y0)
+            if segment_len:
+                self.directions.append(((x1 - x0) / segment_len, (y1 - y0) / segment_len))
+            else:
+                self.directions.append((0.0, 0.0))
+            self.cumulative.append(self.cumulative[-1] + segment_len)
+        self.length = self.cumulative[-1]
+
+    @classmethod
+    def from_arrays(cls, points, cumulative, directions):
+        # Готовая геометрия из скомпилированной карты, без пересчёта
+        index = cls.__new__(cls)
+        index.points = points
+        index.cumulative = cumulative
+        index.directions = directions
+        index.length = cumulative[-1]
+        return index
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, i):
+        return self.points[i]
+
+    def segment_at(self, distance):
+        # Номер отрезка, на котором лежит точка с данным расстоянием (O(log n))
+        if not self.directions:
+            return 0
+        i = bisect.bisect_right(self.cumulative, distance) - 1
+        return min(max(i, 0), len(self.directions) - 1)
+
+    def position_on_segment(self, i, distance):
+        if not self.directions:
+            return self.points[0]
+        x, y = self.points[i]
+        dx, dy = self.directions[i]
+        offset = distance - self.cumulative[i]
+        return x + dx * offset, y + dy * offset
+
+    def position_at(self, distance):
+        return self.position_on_segment(self.segment_at(distance), distance)
+
+    def coverage(self, cx, cy, radius):
+        """Отрезки пути [start, end] (в единицах расстояния), лежащие внутри круга.
+
+        Соседние и перекрывающиеся интервалы склеиваются, результат отсортирован.
+        """
+        intervals = []
+        r_sq = radius * radius
+        for i, (dx, dy) in enumerate(self.directions):
+            x0, y0 = self.points[i]
+            start = self.cumulative[i]
+            segment_len = self.cumulative[i + 1] - start
+            fx, fy = x0 - cx, y0 - cy
+            if segment_len == 0:
+                if fx * fx + fy * fy <= r_sq:
+                    intervals.append((start, start))
+                continue
+            # |f + d*t|^2 <= r^2  ->  t^2 + 2*b*t + c <= 0
+            b = fx * dx + fy * dy
+            disc = b * b - (fx * fx + fy * fy - r_sq)
+            if disc < 0:
+                continue
+            root = math.sqrt(disc)
+            t0 = max(-b - root, 0.0)
+            t1 = min(-b + root, segment_len)
+            if t0 > t1:
+                continue
+            intervals.append((start + t0, start + t1))
+
+        merged = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1] + 1e-9:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    def intercept(self, distance, target_speed, x, y, speed):
+        """Через сколько тиков снаряд из (x, y) со скоростью speed догонит
+        цель, идущую по пути от distance со скоростью target_speed.
+
+        На k-м тике полёта цель стоит на distance + target_speed * (k - 1)
+        (снаряды двигаются раньше врагов), а снаряд, летящий по прямой,
+        покрывает speed * k. Пока цель медленнее снаряда, условие попадания
+        монотонно по k, и k ищется бинарным поиском. None - не догонит.
+        """
+        if target_speed >= speed:
+            return None
+        length = self.length
+
+        def reached(k):
+            px, py = self.position_at(min(distance + target_speed * (k - 1), length))
+            reach = speed * k
+            return (px - x) ** 2 + (py - y) ** 2 <= reach * reach
+
+        px, py = self.position_at(distance)
+        # Путь не короче хорды, так что к этому тику снаряд точно успеет
+        lo, hi = 1, max(1, math.ceil((math.hypot(px - x, py - y) - target_speed) / (speed - target_speed)))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if reached(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
 def build_path_from_cells(cell_list):
     coords = []
     for cx, cy in cell_list:
         x, y = cell_center(cx, cy)
         coords.append((x, y))
-    return coords
+    return PathIndex(coords)
 
 path = build_path_from_cells(path_cells)
 
-lives = 10
-money = 100
-
-enemies = []
-towers = []
-bullets = []
+class Board:
+    """Занятость клеток поля в плоском массиве: пусто, путь или номер башни.
+
+    Номер башни - её индекс в Simulation.towers плюс один. Проверка
+    постановки, башня в клетке и соседи клетки - обращения по индексу, без
+    перебора пути и башен. У карты из файла (bounded) строить за краем поля
+    нельзя; у встроенной карты поле за краем массива считается пустым, и при
+    постановке туда массив расширяется.
+    """
+
+    EMPTY = 0
+    PATH = -1
+    BLOCKED = -2
+
+    def __init__(self, cols, rows, path_cells=(), blocked=(), bounded=False, mask=None):
+        self.cols = cols
+        self.rows = rows
+        self.bounded = bounded
+        self.path_cells = list(path_cells)
+        self.blocked = list(blocked)
+        if mask is not None:
+            # Готовая маска из скомпилированной карты
+            self.cells = array("i", mask)
+        else:
+            self.fill()
+
+    def fill(self):
+        self.cells = array("i", bytes(4 * self.cols * self.rows))
+        for cx, cy in self.blocked:
+            self.set(cx, cy, self.BLOCKED)
+        for cx, cy in self.path_cells:
+            self.set(cx, cy, self.PATH)
+
+    def get(self, cx, cy):
+        if 0 <= cx < self.cols and 0 <= cy < self.rows:
+            return self.cells[cy * self.cols + cx]
+        return self.EMPTY
+
+    def set(self, cx, cy, value):
+        if cx >= self.cols or cy >= self.rows:
+            self.grow(max(cx + 1, self.cols), max(cy + 1, self.rows))
+        self.cells[cy * self.cols + cx] = value
+
+    def grow(self, cols, rows):
+        cells = array("i", bytes(4 * cols * rows))
+        for cy in range(self.rows):
+            start = cy * self.cols
+            cells[cy * cols:cy * cols + self.cols] = self.cells[start:start + self.cols]
+        self.cols, self.rows, self.cells = cols, rows, cells
+
+    def is_buildable(self, cx, cy):
+        if self.bounded and not (cx < self.cols and cy < self.rows):
+            return False
+        return cx >= 0 and cy >= 0 and self.get(cx, cy) == self.EMPTY
+
+    def tower_id_at(self, cx, cy):
+        value = self.get(cx, cy)
+        return value if value > 0 else None
+
+    def place_tower(self, cx, cy, tower_id):
+        self.set(cx, cy, tower_id)
+
+    def neighbours(self, cx, cy, radius=1):
+        # (nx, ny, значение) клеток в квадрате radius вокруг (cx, cy), без неё самой
+        found = []
+        for ny in range(max(cy - radius, 0), min(cy + radius + 1, self.rows)):
+            row = ny * self.cols
+            for nx in range(max(cx - radius, 0), min(cx + radius + 1, self.cols)):
+                if nx != cx or ny != cy:
+                    found.append((nx, ny, self.cells[row + nx]))
+        return found
+
+    def reset(self):
+        # Убрать все башни, оставив путь и закрытые клетки
+        self.fill()
+
+class GameMap:
+    """Карта: размер поля и клетки, один или несколько путей, клетки без застройки.
+
+    Пути задаются клетками; враги волны выходят на пути по очереди.
+    """
+
+    def __init__(self, name, cols, rows, cell_size, path_cells, blocked=(), bounded=True,
+                 paths=None, mask=None):
+        self.name = name
+        self.cols = cols
+        self.rows = rows
+        self.cell_size = cell_size
+        self.path_cells = [[tuple(cell) for cell in cells] for cells in path_cells]
+        self.blocked = [tuple(cell) for cell in blocked]
+        self.bounded = bounded
+        if paths is None:
+            half = cell_size // 2
+            paths = [PathIndex([(cx * cell_size + half, cy * cell_size + half) for cx, cy in cells])
+                     for cells in self.path_cells]
+        self.paths = paths
+        if mask is None:
+            mask = Board(cols, rows, self.all_path_cells, self.blocked, bounded).cells
+        self.mask = mask
+
+    @property
+    def all_path_cells(self):
+        return [cell for cells in self.path_cells for cell in cells]
+
+    def make_board(self):
+        return Board(self.cols, self.rows, self.all_path_cells, self.blocked, self.bounded, self.mask)
+
+MAPS_DIR = os.path.join("maps")
+
+# Встроенная карта; --map заменяет её картой из файла (см. use_map)
+current_map = GameMap("classic", max(cx for cx, _ in path_cells) + 1,
+                      max(cy for _, cy in path_cells) + 1, CELL_SIZE, [path_cells],
+                      bounded=False, paths=[path])
+
+def parse_map(filename):
+    """Читает карту из JSON-файла:
+
+        {"name": "...", "grid": [столбцов, строк], "cell_size": 50,
+         "paths": [[[x, y], ...], ...], "blocked": [[x, y], ...]}
+    """
+    with open(filename, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{filename}: {e}") from None
+    if not isinstance(data, dict) or "grid" not in data or "paths" not in data:
+        raise ValueError(f"{filename}: нужны поля grid и paths")
+    try:
+        cols, rows = data["grid"]
+        paths = data["paths"]
+        if not paths or any(len(cells) < 2 for cells in paths):
+            raise ValueError("каждый путь - не меньше двух клеток")
+        blocked = data.get("blocked", [])
+        for cx, cy in [cell for cells in paths for cell in cells] + blocked:
+            if not (0 <= cx < cols and 0 <= cy < rows):
+                raise ValueError(f"клетка ({cx}, {cy}) за пределами поля {cols}x{rows}")
+    except (TypeError, ValueError) as e:
+        # Не те типы в grid/paths/blocked: "cols, rows = 5", сравнение строки с числом
+        raise ValueError(f"{filename}: {e}") from None
+    name = data.get("name", os.path.splitext(os.path.basename(filename))[0])
+    return GameMap(name, cols, rows, data.get("cell_size", CELL_SIZE), paths, blocked)
+
+class CompiledMap:
+    """Двоичная копия карты рядом с исходником (.tdmap): готовые точки пути,
+    длины отрезков, направления и маска занятости. Читается без разбора
+    текста; устаревает, когда у исходника меняется время или размер.
+    """
+
+    MAGIC = b"TDMP"
+    VERSION = 1
+    # magic, версия, mtime_ns и размер исходника, столбцы, строки, клетка,
+    # число путей, число закрытых клеток, длина имени
+    _HEADER = struct.Struct("<4sHqQHHHHIH")
+    _COUNT = struct.Struct("<I")
+
+    @staticmethod
+    def cache_name(filename):
+        return os.path.splitext(filename)[0] + ".tdmap"
+
+    @classmethod
+    def write(cls, game_map, filename, stat):
+        name = game_map.name.encode("utf-8")
+        parts = [cls._HEADER.pack(cls.MAGIC, cls.VERSION, stat.st_mtime_ns, stat.st_size,
+                                  game_map.cols, game_map.rows, game_map.cell_size,
+                                  len(game_map.paths), len(game_map.blocked), len(name)), name]
+        for cells, path_index in zip(game_map.path_cells, game_map.paths):
+            parts.append(cls._COUNT.pack(len(cells)))
+            parts.append(array("h", [v for cell in cells for v in cell]).tobytes())
+            parts.append(array("i", [int(v) for point in path_index.points for v in point]).tobytes())
+            parts.append(array("d", path_index.cumulative).tobytes())
+            parts.append(array("d", [v for d in path_index.directions for v in d]).tobytes())
+        parts.append(array("h", [v for cell in game_map.blocked for v in cell]).tobytes())
+        parts.append(array("i", game_map.mask).tobytes())
+        try:
+            with open(filename + ".tmp", "wb") as f:
+                f.write(b"".join(parts))
+            os.replace(filename + ".tmp", filename)
+        except OSError as e:
+            print(f"Warning: compiled map not written: {e}")
+
+    @classmethod
+    def read(cls, filename, stat):
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            (magic, version, mtime, size, cols, rows, cell_size,
+             n_paths, n_blocked, name_len) = cls._HEADER.unpack_from(data, 0)
+        except struct.error:
+            return None
+        if (magic != cls.MAGIC or version != cls.VERSION
+                or mtime != stat.st_mtime_ns or size != stat.st_size):
+            return None
+        try:
+            return cls._parse_body(data, name_len, cols, rows, cell_size, n_paths, n_blocked)
+        except (struct.error, ValueError, UnicodeDecodeError):
+            # Обрезанный или испорченный файл - карта просто компилируется заново
+            return None
+
+    @classmethod
+    def _parse_body(cls, data, name_len, cols, rows, cell_size, n_paths, n_blocked):
+        offset = cls._HEADER.size
+        name = data[offset:offset + name_len].decode("utf-8")
+        offset += name_len
+
+        def take(typecode, count):
+            nonlocal offset
+            values = array(typecode)
+            end = offset + count * values.itemsize
+            if count < 0 or end > len(data):
+                raise ValueError("файл карты обрезан")
+            values.frombytes(data[offset:end])
+            offset = end
+            return values
+
+        path_cells, paths = [], []
+        for _ in range(n_paths):
+            (n,) = cls._COUNT.unpack_from(data, offset)
+            offset += cls._COUNT.size
+            cells = take("h", 2 * n)
+            points = take("i", 2 * n)
+            cumulative = take("d", n).tolist()
+            directions = take("d", 2 * (n - 1))
+            path_cells.append(list(zip(cells[::2], cells[1::2])))
+            paths.append(PathIndex.from_arrays(list(zip(points[::2], points[1::2])), cumulative,
+                                               list(zip(directions[::2], directions[1::2]))))
+        blocked = take("h", 2 * n_blocked)
+        mask = take("i", cols * rows)
+        if offset != len(data):
+            raise ValueError("лишние данные в конце файла карты")
+        return GameMap(name, cols, rows, cell_size, path_cells, list(zip(blocked[::2], blocked[1::2])),
+                       paths=paths, mask=mask)
+
+def load_map(filename):
+    """Карта из файла; разбирается и компилируется, только если исходник изменился."""
+    stat = os.stat(filename)
+    compiled = CompiledMap.cache_name(filename)
+    game_map = CompiledMap.read(compiled, stat)
+    if game_map is None:
+        game_map = parse_map(filename)
+        CompiledMap.write(game_map, compiled, stat)
+    return game_map
+
+def use_map(game_map):
+    """Делает карту текущей: новые партии строятся на ней. Вызывать до init_display()."""
+    global current_map, CELL_SIZE, path_cells, path
+    current_map = game_map
+    CELL_SIZE = game_map.cell_size
+    path_cells = game_map.path_cells[0]
+    path = game_map.paths[0]
+    GameRenderer.HEALTH_BAR_WIDTH = CELL_SIZE * 0.6
 
 selected_tower_for_info = None
 
+# Номер "жизни" врага: новый при каждом __init__, в том числе из EntityPool.
+# Попадание из очереди запоминает номер цели и не достаётся её двойнику из пула
+_enemy_generations = itertools.count()
+
 class Enemy:
+    # __slots__ вместо __dict__: врагов и снарядов на поздних волнах тысячи
+    __slots__ = ("path", "pos_index", "distance", "x", "y", "speed", "health",
+                 "max_health", "radius", "alive", "image", "generation")
+
     def __init__(self, path):
         self.path = path
-        self.pos_index = 0
+        self.pos_index = 0      # номер текущего отрезка пути
+        self.distance = 0.0     # пройденное по пути расстояние
         self.x, self.y = path[0]
         self.speed = 1
         self.health = 100
@@ -176,25 +982,30 @@ class Enemy:
         self.radius = CELL_SIZE // 3
         self.alive = True
         self.image = enemy_image
+        self.generation = next(_enemy_generations)
+
+    @classmethod
+    def wave_health(cls, wave):
+        # Здоровье при выходе на волне wave, до множителя группы волны
+        return 100
+
+    def place_at(self, distance):
+        # Поставить врага на distance от начала его пути (бенчмарки, сценарии)
+        self.distance = distance
+        self.pos_index = self.path.segment_at(distance)
+        self.x, self.y = self.path.position_at(distance)
 
     def move(self):
-        if self.pos_index + 1 >= len(self.path):
+        path = self.path
+        if self.distance >= path.length:
             return False
-        target_x, target_y = self.path[self.pos_index + 1]
-        vector_x = target_x - self.x
-        vector_y = target_y - self.y
-        distance = (vector_x ** 2 + vector_y ** 2) ** 0.5
-        if distance == 0:
+        self.distance = min(self.distance + self.speed, path.length)
+        # Враг идёт только вперёд, поэтому номер отрезка лишь растёт
+        cumulative = path.cumulative
+        last_segment = len(path.directions) - 1
+        while self.pos_index < last_segment and self.distance >= cumulative[self.pos_index + 1]:
             self.pos_index += 1
-            return True
-        dx = (vector_x / distance) * self.speed
-        dy = (vector_y / distance) * self.speed
-        if abs(dx) > abs(vector_x) and abs(dy) > abs(vector_y):
-            self.x, self.y = target_x, target_y
-            self.pos_index += 1
-        else:
-            self.x += dx
-            self.y += dy
+        self.x, self.y = path.position_on_segment(self.pos_index, self.distance)
         return True
 
     def draw(self, surface):
@@ -202,21 +1013,24 @@ class Enemy:
             rect = self.image.get_rect(center=(int(self.x), int(self.y)))
             surface.blit(self.image, rect)
         else:
-            pygame.draw.circle(surface, RED, (int(self.x), int(self.y)), self.radius)
+            rect = pygame.draw.circle(surface, RED, (int(self.x), int(self.y)), self.radius)
         hbw = CELL_SIZE * 0.6
         hbh = 6
         x = self.x - hbw / 2
         y = self.y - self.radius - 15
         # Рисуем контур (рамку)
-        pygame.draw.rect(surface, BLACK, (x - 1, y - 1, hbw + 2, hbh + 2), 1)
+        bar_rect = pygame.draw.rect(surface, BLACK, (x - 1, y - 1, hbw + 2, hbh + 2), 1)
         # Рисуем красный фон полоски
         pygame.draw.rect(surface, RED, (x, y, hbw, hbh))
         # Рисуем зелёную часть (здоровье)
         health_percent = self.health / self.max_health
         pygame.draw.rect(surface, GREEN, (x, y, hbw * health_percent, hbh))
-    
+        return rect.union(bar_rect)
+
 
 class FastEnemy(Enemy):
+    __slots__ = ()
+
     def __init__(self, path):
         super().__init__(path)
         self.speed = 2.0
@@ -226,43 +1040,62 @@ class FastEnemy(Enemy):
         self.image = fast_enemy_image if fast_enemy_image else enemy_image
 
 class BossEnemy(Enemy):
-    def __init__(self, path):
+    __slots__ = ()
+
+    def __init__(self, path, wave):
         super().__init__(path)
         self.speed = 1.0
-        base_health = 800 + 200 * (wave // 5)
-        # Сделаем босса примерно в 2 раза слабее, уменьшив множитель с 2.5 на 1.2
-        self.health = int(base_health * 1.2)
+        self.health = self.wave_health(wave)
         self.max_health = self.health
         self.radius = CELL_SIZE
         self.image = boss_image
 
+    @classmethod
+    def wave_health(cls, wave):
+        base_health = BALANCE["boss_base_health"] + BALANCE["boss_health_step"] * (wave // 5)
+        # Сделаем босса примерно в 2 раза слабее, уменьшив множитель с 2.5 на 1.2
+        return int(base_health * BALANCE["boss_health_multiplier"])
+
     def move(self):
         return super().move()
-    
+
 class FastBossEnemy(Enemy):
+    __slots__ = ()
+
     def __init__(self, path, wave):
         super().__init__(path)
         self.speed = 2.0
-        base_health = 800 + 200 * (wave // 5)
-        self.health = int(base_health * 0.8)
+        self.health = self.wave_health(wave)
         self.max_health = self.health
         self.radius = CELL_SIZE
         self.image = fast_boss_image
-        if wave % 5 == 0 and spawned_enemies == enemies_to_spawn - 1:
-            if wave >= 10:  # быстрый босс только с 10-й волны
-                # 80% шанс создать быстрого босса
-                if random.random() < 0.8:
-                    enemies.append(FastBossEnemy(path))
-                else:
-                    enemies.append(BossEnemy(path))
-            else:
-                # На 5-й волне только обычный босс
-                enemies.append(BossEnemy(path))
-        
+
+    @classmethod
+    def wave_health(cls, wave):
+        base_health = BALANCE["boss_base_health"] + BALANCE["boss_health_step"] * (wave // 5)
+        return int(base_health * BALANCE["fast_boss_health_multiplier"])
+
+ENEMY_CLASSES = {
+    "enemy": Enemy,
+    "fast": FastEnemy,
+    "boss": BossEnemy,
+    "fastboss": FastBossEnemy,
+}
+
+def make_enemy(cls, path, wave=1, pool=None):
+    # Боссам нужен номер волны (от него зависит здоровье), остальным - нет
+    args = (path, wave) if cls in (BossEnemy, FastBossEnemy) else (path,)
+    return pool.acquire(cls, *args) if pool is not None else cls(*args)
+
 class Tower:
-    def __init__(self, x, y):
+    __slots__ = ("x", "y", "path", "size", "range", "damage", "reload_time", "reload_counter",
+                 "level", "upgrade_cost", "upgrade_increment", "first_upgrade_done",
+                 "current_target", "coverage", "damage_dealt")
+
+    def __init__(self, x, y, path=None):
         self.x = x
         self.y = y
+        self.path = path
         self.size = CELL_SIZE
         self.range = CELL_SIZE * 3   # Дальность 3 клетки
         self.damage = 15             # Урон 15
@@ -273,6 +1106,15 @@ class Tower:
         self.upgrade_increment = 25
         self.first_upgrade_done = False
         self.current_target = None
+        self.coverage = []
+        self.damage_dealt = 0        # урон всех попавших снарядов башни
+        self.update_coverage()
+
+    def update_coverage(self):
+        # Путь статичен, поэтому участки пути в радиусе башни считаются
+        # только при постановке и улучшении, а не каждый кадр
+        if self.path is not None:
+            self.coverage = self.path.coverage(self.x, self.y, self.range)
 
     def draw(self, surface, highlight=False):
         rect = pygame.Rect(0, 0, self.size, self.size)
@@ -283,60 +1125,79 @@ class Tower:
         if tower_base_image:
             img_rect = tower_base_image.get_rect(center=(self.x, self.y))
             surface.blit(tower_base_image, img_rect)
+            border_rect.union_ip(img_rect)
         else:
             pygame.draw.rect(surface, BLUE, rect)
 
         if highlight:
-            pygame.draw.rect(surface, YELLOW, rect, 3)
+            self.draw_highlight(surface)
+        return border_rect
+
+    def draw_highlight(self, surface):
+        rect = pygame.Rect(0, 0, self.size, self.size)
+        rect.center = (self.x, self.y)
+        return pygame.draw.rect(surface, YELLOW, rect, 3)
+
+    def barrel_angle(self):
+        # Угол ствола в градусах для pygame.transform.rotate: на текущую цель
+        if self.current_target and self.current_target.alive:
+            dx = self.current_target.x - self.x
+            dy = self.current_target.y - self.y
+            return -math.degrees(math.atan2(dy, dx))
+        return 0
 
     def draw_turret_barrel(self, surface):
         if base_dulo_image:
             image = base_dulo_image
-            angle = 0
-            if self.current_target and self.current_target.alive:
-                dx = self.current_target.x - self.x
-                dy = self.current_target.y - self.y
-                angle = -math.degrees(math.atan2(dy, dx))
-            rotated_image = pygame.transform.rotate(image, angle)
+            angle = self.barrel_angle()
+            if barrel_atlas is not None:
+                rotated_image = barrel_atlas.get(angle)
+            else:
+                rotated_image = pygame.transform.rotate(image, angle)
             rotated_rect = rotated_image.get_rect(center=(self.x, self.y))
             surface.blit(rotated_image, rotated_rect)
+            return rotated_rect
+        return None
 
     def can_shoot(self):
         return self.reload_counter == 0
 
-    def shoot(self, enemies, bullets):
+    def find_target(self, enemies):
+        # Полный перебор: самый продвинувшийся враг в радиусе,
+        # при равном продвижении - ближайший к башне
         target = None
         max_progress = -1
-        max_progress_dist = -1
+        max_progress_dist_sq = -1
+        range_sq = self.range * self.range
 
+        # Сравниваем квадраты расстояний - корень для выбора цели не нужен
         for enemy in enemies:
-            dist = math.hypot(enemy.x - self.x, enemy.y - self.y)
-            if dist <= self.range:
-                if enemy.pos_index + 1 < len(enemy.path):
-                    next_pt = enemy.path[enemy.pos_index + 1]
-                    cur_pt = enemy.path[enemy.pos_index]
-                    segment_len = math.hypot(next_pt[0] - cur_pt[0], next_pt[1] - cur_pt[1])
-                    if segment_len != 0:
-                        dist_to_next = math.hypot(next_pt[0] - enemy.x, next_pt[1] - enemy.y)
-                        progress_frac = 1 - (dist_to_next / segment_len)
-                    else:
-                        progress_frac = 0
-                else:
-                    progress_frac = 0
-
-                progress = enemy.pos_index + progress_frac
-
-                if progress > max_progress or (math.isclose(progress, max_progress) and dist < max_progress_dist):
+            dx = enemy.x - self.x
+            dy = enemy.y - self.y
+            dist_sq = dx * dx + dy * dy
+            if dist_sq <= range_sq:
+                progress = enemy.distance
+                if progress > max_progress or (math.isclose(progress, max_progress) and dist_sq < max_progress_dist_sq):
                     max_progress = progress
-                    max_progress_dist = dist
+                    max_progress_dist_sq = dist_sq
                     target = enemy
+        return target
+
+    def shoot(self, enemies, bullets, targeting=None, pool=None):
+        if targeting is not None:
+            target = targeting.find_target(self)
+        else:
+            target = self.find_target(enemies)
 
         if target:
             self.current_target = target
             if self.can_shoot():
                 if shoot_sound:
-                    play_sound(shoot_sound)
-                bullet = Bullet(self.x, self.y, target)
+                    sound_scheduler.request("shoot_sound")
+                if pool is not None:
+                    bullet = pool.acquire(Bullet, self.x, self.y, target, self)
+                else:
+                    bullet = Bullet(self.x, self.y, target, self)
                 bullet.damage = self.damage
                 bullets.append(bullet)
                 self.reload_counter = self.reload_time
@@ -351,22 +1212,201 @@ class Tower:
         if self.level < 5:
             self.level += 1
             if self.level < 5:
-                self.damage = int(self.damage * 1.2)
-                self.range = int(self.range * 1.1)
-                self.reload_time = max(5, int(self.reload_time * 0.9))
+                self.damage = int(self.damage * BALANCE["upgrade_damage"])
+                self.range = int(self.range * BALANCE["upgrade_range"])
+                self.reload_time = max(5, int(self.reload_time * BALANCE["upgrade_reload"]))
             else:
-                self.damage = int(self.damage * 2.0)
-                self.range = int(self.range * 1.5)
-                self.reload_time = max(3, int(self.reload_time * 0.7))
+                self.damage = int(self.damage * BALANCE["max_upgrade_damage"])
+                self.range = int(self.range * BALANCE["max_upgrade_range"])
+                self.reload_time = max(3, int(self.reload_time * BALANCE["max_upgrade_reload"]))
+            self.update_coverage()
             return True
         return False
 
+class TargetingEngine:
+    """Выбор цели для башен через интервалы покрытия пути.
+
+    Раз в тик враги сортируются по пройденному расстоянию; после этого цель
+    башни ищется бинарным поиском внутри её интервалов покрытия, начиная с
+    самого дальнего. Правило выбора то же, что у Tower.find_target.
+    """
+
+    EPSILON = 1e-6   # запас на погрешность округления у краёв интервалов
+
+    def __init__(self):
+        self.enemies = []
+        self.ranked = []
+        self.keys = []
+        self.indices = []   # номер врага из ranked в списке enemies
+
+    def update(self, enemies):
+        self.enemies = enemies
+        distances = [enemy.distance for enemy in enemies]
+        # Порядок почти не меняется между тиками, так что сортировка близка к O(n)
+        order = sorted(range(len(enemies)), key=distances.__getitem__)
+        self.indices = order
+        self.ranked = [enemies[i] for i in order]
+        self.keys = [distances[i] for i in order]
+
+    def find_target(self, tower):
+        ranked = self.keys
+        if not ranked:
+            return None
+        eps = self.EPSILON
+        range_sq = tower.range * tower.range
+        tx, ty = tower.x, tower.y
+        for start, end in reversed(tower.coverage):
+            j = bisect.bisect_right(ranked, end + eps) - 1
+            while j >= 0 and ranked[j] >= start - eps:
+                enemy = self.ranked[j]
+                dx = enemy.x - tx
+                dy = enemy.y - ty
+                if dx * dx + dy * dy <= range_sq:
+                    return self._break_tie(tower, j, range_sq)
+                j -= 1
+        return None
+
+    def _break_tie(self, tower, j, range_sq):
+        # Враги с почти тем же продвижением, что и лучший найденный, разбираются
+        # так же, как при полном переборе: в порядке списка врагов
+        keys = self.keys
+        k = j
+        while k > 0 and math.isclose(keys[k - 1], keys[j]):
+            k -= 1
+        if k == j:
+            return self.ranked[j]
+        # Номера в списке запомнены в update(): пачка врагов, вышедших вместе,
+        # идёт вровень весь путь, и поиск каждого в списке стоил бы O(n)
+        ranked = self.ranked
+        tied = [ranked[m] for m in sorted(range(k, j + 1), key=self.indices.__getitem__)]
+        return tower.find_target(tied)
+
+class SpatialHash:
+    """Равномерная сетка врагов с ячейкой CELL_SIZE, перестраивается раз в тик.
+
+    В ячейках лежат номера врагов в списке, поэтому ответы идут в порядке
+    списка - том же, в каком их видит полный перебор. Подходит и как
+    targeting для Simulation (update/find_target, как у TargetingEngine):
+    цель выбирается Tower.find_target среди врагов в радиусе, так что
+    результат совпадает с перебором, в том числе на картах с несколькими путями.
+    """
+
+    def __init__(self, cell_size=None):
+        self.cell_size = cell_size or CELL_SIZE
+        self.cells = {}
+        self.enemies = []
+        self.max_radius = 0
+        self.bounds = (0, 0, 0, 0)   # крайние занятые ячейки
+
+    def update(self, enemies):
+        cells = {}
+        size = self.cell_size
+        max_radius = 0
+        for i, enemy in enumerate(enemies):
+            key = (int(enemy.x // size), int(enemy.y // size))
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [i]
+            else:
+                bucket.append(i)
+            if enemy.radius > max_radius:
+                max_radius = enemy.radius
+        self.cells = cells
+        self.enemies = enemies
+        self.max_radius = max_radius
+        if cells:
+            xs = [gx for gx, _ in cells]
+            ys = [gy for _, gy in cells]
+            self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def _candidates(self, x, y, radius):
+        size = self.cell_size
+        cells = self.cells
+        found = []
+        for gy in range(int((y - radius) // size), int((y + radius) // size) + 1):
+            for gx in range(int((x - radius) // size), int((x + radius) // size) + 1):
+                bucket = cells.get((gx, gy))
+                if bucket is not None:
+                    found.extend(bucket)
+        return found
+
+    def query_radius(self, x, y, radius):
+        """Враги, чей центр не дальше radius от (x, y), в порядке списка."""
+        enemies = self.enemies
+        r_sq = radius * radius
+        result = []
+        for i in sorted(self._candidates(x, y, radius)):
+            enemy = enemies[i]
+            dx = enemy.x - x
+            dy = enemy.y - y
+            if dx * dx + dy * dy <= r_sq:
+                result.append(enemy)
+        return result
+
+    def nearest(self, x, y, max_distance=None):
+        """Ближайший к (x, y) враг (при равенстве - раньше в списке) или None."""
+        if not self.cells:
+            return None
+        size = self.cell_size
+        enemies = self.enemies
+        cells = self.cells
+        cx, cy = int(x // size), int(y // size)
+        min_gx, min_gy, max_gx, max_gy = self.bounds
+        last_ring = max(cx - min_gx, max_gx - cx, cy - min_gy, max_gy - cy)
+        best = None
+        best_sq = math.inf if max_distance is None else max_distance * max_distance
+        for ring in range(last_ring + 1):
+            # Любая точка кольца ring не ближе (ring - 1) ячеек
+            edge = max(ring - 1, 0) * size
+            if edge * edge > best_sq:
+                break
+            for key in self._ring(cx, cy, ring):
+                for i in cells.get(key, ()):
+                    enemy = enemies[i]
+                    dx = enemy.x - x
+                    dy = enemy.y - y
+                    d_sq = dx * dx + dy * dy
+                    if d_sq < best_sq or (d_sq == best_sq and (best is None or i < best)):
+                        best_sq = d_sq
+                        best = i
+        return enemies[best] if best is not None else None
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for gx in range(cx - ring, cx + ring + 1):
+            yield gx, cy - ring
+            yield gx, cy + ring
+        for gy in range(cy - ring + 1, cy + ring):
+            yield cx - ring, gy
+            yield cx + ring, gy
+
+    def at_point(self, x, y):
+        """Враги, в круг которых попадает точка (x, y) - например, под курсором."""
+        enemies = self.enemies
+        result = []
+        for i in sorted(self._candidates(x, y, self.max_radius)):
+            enemy = enemies[i]
+            dx = enemy.x - x
+            dy = enemy.y - y
+            if dx * dx + dy * dy <= enemy.radius * enemy.radius:
+                result.append(enemy)
+        return result
+
+    def find_target(self, tower):
+        return tower.find_target(self.query_radius(tower.x, tower.y, tower.range))
+
 class Bullet:
-    def __init__(self, x, y, target):
+    __slots__ = ("x", "y", "speed", "target", "radius", "damage", "alive", "image", "source")
+
+    def __init__(self, x, y, target, source=None):
         self.x = x
         self.y = y
         self.speed = 6
         self.target = target
+        self.source = source    # башня-стрелок, для счёта урона
         self.radius = 5
         self.damage = 20
         self.alive = True
@@ -379,28 +1419,35 @@ class Bullet:
 
         vector_x = self.target.x - self.x
         vector_y = self.target.y - self.y
-        distance = math.hypot(vector_x, vector_y)
+        # sqrt, а не hypot: результат побитно совпадает с векторным движком
+        distance = math.sqrt(vector_x * vector_x + vector_y * vector_y)
         if distance <= self.speed:
-            self.target.health -= self.damage
-            if hit_sound:
-                play_sound(hit_sound)
-            if self.target.health <= 0:
-                self.target.alive = False
-            self.alive = False
+            self.hit()
         else:
             self.x += (vector_x / distance) * self.speed
             self.y += (vector_y / distance) * self.speed
 
+    def hit(self):
+        target = self.target
+        target.health -= self.damage
+        if self.source is not None:
+            self.source.damage_dealt += self.damage
+        if hit_sound:
+            sound_scheduler.request("hit_sound")
+        if target.health <= 0:
+            target.alive = False
+        self.alive = False
+
     def draw(self, surface):
         if self.image:
             rect = self.image.get_rect(center=(int(self.x), int(self.y)))
             surface.blit(self.image, rect)
-        else:
-            pygame.draw.circle(surface, BLACK, (int(self.x), int(self.y)), self.radius)
+            return rect
+        return pygame.draw.circle(surface, BLACK, (int(self.x), int(self.y)), self.radius)
 
 def draw_grid(surface):
     global grid_surface
-    if grid_surface.get_size() != (WIDTH, HEIGHT):
+    if grid_surface is None or grid_surface.get_size() != (WIDTH, HEIGHT):
         grid_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
     grid_surface.fill((0,0,0,0))
     color = (200, 200, 200, 80)
@@ -412,15 +1459,20 @@ def draw_grid(surface):
 
     surface.blit(grid_surface, (0, 0))
 
+def draw_blocked(surface, cells):
+    # Клетки карты, на которых нельзя строить
+    for cx, cy in cells:
+        surface.fill((225, 225, 225), (cx * CELL_SIZE, cy * CELL_SIZE, CELL_SIZE, CELL_SIZE))
+
 def draw_path(surface, path):
     if len(path) > 1:
-        pygame.draw.lines(surface, BLACK, False, path, 5)
+        pygame.draw.lines(surface, BLACK, False, path.points, 5)
 
 def draw_tower_info(surface, tower):
     radius = tower.range
     alpha_surf = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
     pygame.draw.circle(alpha_surf, (0, 0, 255, 70), (radius, radius), radius)
-    surface.blit(alpha_surf, (tower.x - radius, tower.y - radius))
+    range_rect = surface.blit(alpha_surf, (tower.x - radius, tower.y - radius))
 
     info_width, info_height = 240, 140
     offset_x = radius + 15
@@ -445,263 +1497,2039 @@ def draw_tower_info(surface, tower):
         lines.append("Максимальный уровень")
 
     for i, line in enumerate(lines):
-        text_surf = info_font.render(line, True, WHITE)
-        surface.blit(text_surf, (x + 10, y + 10 + i * 25))
+        text_surf = render_text(info_font, line, WHITE)
+        rect.union_ip(surface.blit(text_surf, (x + 10, y + 10 + i * 25)))
+    return rect.union(range_rect)
 
 def main_menu():
     screen.fill(WHITE)
-    title_text = font.render("Tower Defense", True, BLACK)
+    title_text = render_text(font, "Tower Defense", BLACK)
     screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, HEIGHT // 4))
     start_button.draw(screen)
     pygame.display.flip()
 
-def start_wave():
-    global wave, wave_in_progress, enemies_to_spawn, spawned_enemies, spawn_timer
-    wave += 1
-    wave_in_progress = True
-    enemies_to_spawn = 3 + wave * 2
-    if wave % 5 == 0:
-        enemies_to_spawn += 1
-    spawned_enemies = 0
-    spawn_timer = 0
-
-def spawn_enemy_for_wave(wave, path):
-    chance_fast_enemy = min(0.1 + 0.05 * wave, 0.5)
-    if random.random() < chance_fast_enemy:
-        enemy = FastEnemy(path)
-    else:
-        enemy = Enemy(path)
+class EntityPool:
+    """Свободные списки отработавших врагов и снарядов для повторного использования.
+
+    Объект из пула заново инициализируется вызовом __init__, поэтому
+    переиспользованный враг неотличим от только что созданного.
+    """
+
+    def __init__(self):
+        self.free = {}
+        self.pending = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, cls, *args):
+        free = self.free.get(cls)
+        if free:
+            obj = free.pop()
+            obj.__init__(*args)
+            self.reused += 1
+            return obj
+        self.created += 1
+        return cls(*args)
+
+    def release(self, obj):
+        self.free.setdefault(type(obj), []).append(obj)
+
+    def release_later(self, obj):
+        # Для врагов: на убранного врага ещё могут ссылаться летящие снаряды.
+        # Они заметят alive == False в следующей фазе снарядов, после неё
+        # врага можно отдавать заново (см. recycle)
+        self.pending.append(obj)
+
+    def recycle(self):
+        for obj in self.pending:
+            self.release(obj)
+        self.pending.clear()
+
+# Волна задаётся списком групп врагов (словари, как в JSON):
+#   enemy    - класс из ENEMY_CLASSES или "mixed": быстрый враг с
+#              вероятностью из BALANCE, иначе обычный
+#   count    - число врагов
+#   interval - тиков между выходами (по умолчанию spawn_interval)
+#   burst    - врагов за один выход (по умолчанию 1)
+#   health   - множитель здоровья (по умолчанию 1)
+#   at       - тик начала группы от начала волны; без него группа идёт
+#              сразу за предыдущей, с at группы могут идти одновременно
+# Волны без описания в wave_definitions строятся по default_wave.
+wave_definitions = {}
+
+WAVE_GROUP_KEYS = ("enemy", "count", "interval", "burst", "health", "at")
+
+def default_wave(wave):
+    groups = [{"enemy": "mixed", "count": 3 + wave * 2}]
     # Увеличиваем здоровье обычных и быстрых врагов на 1.7 раза на каждой 10-й волне
     if wave % 10 == 0:
-        enemy.health = int(enemy.health * 1.7)
-        enemy.max_health = enemy.health
-    return enemy
-
-def game_loop():
-    global lives, money, selected_tower_for_info
-    global wave_in_progress, enemies_to_spawn, spawned_enemies, spawn_timer, wave_break_timer
-    global paused
-
-    screen.fill(WHITE)
-
-    draw_path(screen, path)
-    draw_grid(screen)
-
-    if paused:
-        dark_overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        dark_overlay.fill((0, 0, 0, 150))
-        screen.blit(dark_overlay, (0, 0))
+        groups[0]["health"] = BALANCE["tenth_wave_health"]
+    # Каждая 5-я волна заканчивается боссом
+    if wave % 5 == 0:
+        groups.append({"enemy": "boss", "count": 1})
+    return groups
+
+def _is_int(value):
+    # bool - тоже int, но в описании волны это ошибка
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def validate_wave(groups):
+    if not isinstance(groups, list):
+        raise ValueError("волна - список групп врагов")
+    for i, group in enumerate(groups):
+        if not isinstance(group, dict):
+            raise ValueError(f"группа {i}: ожидается объект с полями {', '.join(WAVE_GROUP_KEYS)}")
+        unknown = set(group) - set(WAVE_GROUP_KEYS)
+        if unknown:
+            raise ValueError(f"группа {i}: неизвестные поля {', '.join(sorted(unknown))}")
+        enemy = group.get("enemy")
+        if enemy != "mixed" and enemy not in ENEMY_CLASSES:
+            raise ValueError(f"группа {i}: враг {enemy!r}, а не mixed или {', '.join(ENEMY_CLASSES)}")
+        if not _is_int(group.get("count")) or group["count"] < 0:
+            raise ValueError(f"группа {i}: count - целое число не меньше 0")
+        for key in ("interval", "at"):
+            value = group.get(key, 0)
+            if not _is_int(value) or value < 0:
+                raise ValueError(f"группа {i}: {key} - целое число тиков не меньше 0")
+        burst = group.get("burst", 1)
+        if not _is_int(burst) or burst < 1:
+            raise ValueError(f"группа {i}: burst - целое число не меньше 1")
+        health = group.get("health", 1)
+        if not isinstance(health, (int, float)) or isinstance(health, bool) or not health > 0:
+            raise ValueError(f"группа {i}: множитель health - число больше 0")
+
+def compile_wave(wave, start_tick=0, rng=random, groups=None):
+    """События волны (тик, номер, класс врага, здоровье) в виде кучи heapq.
+
+    Тип каждого врага "mixed" разыгрывается здесь же, по порядку групп,
+    поэтому вся случайность волны тратится при её старте.
+    """
+    if groups is None:
+        groups = wave_definitions.get(wave) or default_wave(wave)
+    validate_wave(groups)
+    chance_fast_enemy = min(BALANCE["fast_chance_base"] + BALANCE["fast_chance_per_wave"] * wave,
+                            BALANCE["fast_chance_max"])
+    events = []
+    group_end = start_tick
+    for group in groups:
+        kind = group["enemy"]
+        interval = group.get("interval", spawn_interval)
+        burst = group.get("burst", 1)
+        multiplier = group.get("health", 1)
+        tick = start_tick + group["at"] if "at" in group else group_end
+        for i in range(group["count"]):
+            if i % burst == 0:
+                tick += interval
+            if kind == "mixed":
+                cls = FastEnemy if rng.random() < chance_fast_enemy else Enemy
+            else:
+                cls = ENEMY_CLASSES[kind]
+            events.append((tick, len(events), cls, int(cls.wave_health(wave) * multiplier)))
+        group_end = max(group_end, tick)
+    # Группы без at идут подряд, и события уже по порядку; с at - перемешиваются
+    heapq.heapify(events)
+    return events
+
+def wave_summary(events):
+    """Число врагов, суммарное здоровье, врагов по классам и тики первого и последнего выхода."""
+    kinds = {}
+    for _, _, cls, _ in events:
+        kinds[cls.__name__] = kinds.get(cls.__name__, 0) + 1
+    ticks = [event[0] for event in events]
+    return {
+        "count": len(events),
+        "health": sum(event[3] for event in events),
+        "kinds": kinds,
+        "first_tick": min(ticks, default=None),
+        "last_tick": max(ticks, default=None),
+    }
+
+def load_waves(filename):
+    """Описания волн из JSON: {"waves": {"номер волны": [группы], ...}}."""
+    with open(filename, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("waves", {}), dict):
+        raise ValueError(f"{filename}: ожидается {{\"waves\": {{\"номер волны\": [группы]}}}}")
+    waves = {}
+    for number, groups in data.get("waves", {}).items():
+        try:
+            if not number.isdigit():
+                raise ValueError("номер волны - целое число")
+            validate_wave(groups)
+            waves[int(number)] = groups
+        except ValueError as e:
+            raise ValueError(f"{filename}: волна {number}: {e}") from None
+    return waves
+
+class PhaseTimer:
+    """Накапливает время по фазам тика и кадра (для бенчмарков и профилирования).
+
+    Симуляция и рендерер держат ссылку на таймер в атрибуте timer; пока он
+    None, замеров нет и цена - одна проверка на фазу.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+        # Список (фаза, начало, конец), пока идёт запись трассы (см. PerfOverlay)
+        self.trace = None
+
+    def lap(self, name, started):
+        # Добавляет время с момента started к фазе name и возвращает "сейчас"
+        now = time.perf_counter()
+        self.totals[name] = self.totals.get(name, 0.0) + (now - started)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if self.trace is not None:
+            self.trace.append((name, started, now))
+        return now
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+
+    def report(self, per=1):
+        # Миллисекунды по фазам, делённые на число тиков/кадров per
+        return {name: total * 1000 / per for name, total in sorted(self.totals.items())}
+
+class Simulation:
+    """Состояние одной партии и её пошаговое обновление.
+
+    Ничего не рисует и не обращается к окну, поэтому может работать без дисплея.
+    Один тик соответствует одному кадру исходной игры (1/60 секунды).
+    Все случайные решения берутся из собственного генератора с seed, так что
+    партия с тем же seed и теми же командами игрока повторяется точно.
+    """
+
+    PROJECTILE_MODES = ("homing", "analytic")
+
+    def __init__(self, path=None, targeting=True, pooling=True, seed=None, game_map=None,
+                 projectiles="homing"):
+        """targeting: True - интервалы покрытия пути (TargetingEngine), а на
+        картах с несколькими путями сетка врагов; "spatial" - всегда сетка
+        врагов (SpatialHash); False - полный перебор врагов каждой башней.
+
+        projectiles: "homing" - снаряд каждый тик доворачивает на цель;
+        "analytic" - тик попадания считается при выстреле (PathIndex.intercept),
+        урон ждёт в очереди impacts, а снаряд рисуется на прямой до точки встречи.
+        """
+        if projectiles not in self.PROJECTILE_MODES:
+            raise ValueError(f"projectiles: {', '.join(self.PROJECTILE_MODES)}")
+        game_map = game_map if game_map is not None else current_map
+        self.game_map = game_map
+        # Враги волны выходят на пути карты по очереди
+        self.paths = [path] if path is not None else list(game_map.paths)
+        self.path = self.paths[0]
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Запись команд игрока (Replay), если партию записываем
+        self.replay = None
+        # PhaseTimer для замеров времени по фазам тика
+        self.timer = None
+        # Интервалы покрытия считаются вдоль одного пути, поэтому на картах
+        # с несколькими путями вместо них сетка врагов
+        if targeting == "spatial" or (targeting and len(self.paths) > 1):
+            self.targeting = SpatialHash()
+        elif targeting:
+            self.targeting = TargetingEngine()
+        else:
+            self.targeting = None
+        # pooling=False - каждый враг и снаряд создаётся заново
+        self.pool = EntityPool() if pooling else None
+        self.money = 100
+        self.lives = 10
+        self.wave = 0
+        self.wave_in_progress = False
+        self.enemies_to_spawn = 0
+        self.spawned_enemies = 0
+        # Невышедшие враги текущей волны: куча событий compile_wave
+        self.timeline = []
+        self.wave_break_timer = 0
+        self.paused = False
+        self.tick_count = 0
+        self.layout_version = 0   # растёт при каждой постановке башни
+        self.board = game_map.make_board()
+
+        self.enemies = []
+        self.towers = []
+        self.bullets = []
+        # Куча (тик попадания, номер, снаряд, тик выстрела, x0, y0, x1, y1,
+        # generation цели)
+        self.projectiles = projectiles
+        self.impacts = []
+        self.impact_seq = 0
+
+    @property
+    def game_over(self):
+        return self.lives <= 0
+
+    def start_wave(self):
+        self.wave += 1
+        self.wave_in_progress = True
+        # Волна раскладывается по тикам сразу; невышедшие враги прошлой
+        # волны (если её прервали) пропадают
+        self.timeline = compile_wave(self.wave, self.tick_count, self.rng)
+        self.enemies_to_spawn = len(self.timeline)
+        self.spawned_enemies = 0
+
+    def preview_wave(self, wave=None):
+        """wave_summary волны (по умолчанию следующей) без траты случайности партии."""
+        rng = random.Random()
+        rng.setstate(self.rng.getstate())
+        return wave_summary(compile_wave(self.wave + 1 if wave is None else wave, 0, rng))
+
+    def start_wave_now(self):
+        # Кнопка "Начать волну сейчас"
+        if self.wave_in_progress:
+            return False
+        if self.replay is not None:
+            self.replay.record(self.tick_count, CMD_START_WAVE)
+        self.start_wave()
+        self.wave_break_timer = 0
+        return True
 
-        pause_text = font.render("пауза", True, WHITE)
-        screen.blit(pause_text, (WIDTH // 2 - pause_text.get_width() // 2,
-                                 HEIGHT // 2 - pause_text.get_height() // 2))
-        pygame.display.flip()
-        return
+    def toggle_pause(self):
+        if self.replay is not None:
+            self.replay.record(self.tick_count, CMD_PAUSE)
+        self.paused = not self.paused
+        return self.paused
+
+    def can_place_tower(self, cx, cy):
+        # Нельзя ставить на путь и на занятую клетку
+        return self.board.is_buildable(cx, cy)
+
+    def place_tower(self, cx, cy, cost=50):
+        if not self.can_place_tower(cx, cy) or self.money < cost:
+            return None
+        if self.replay is not None:
+            self.replay.record(self.tick_count, CMD_PLACE, cx, cy, cost)
+        tower = Tower(*cell_center(cx, cy), path=self.path)
+        self.towers.append(tower)
+        self.board.place_tower(cx, cy, len(self.towers))
+        self.layout_version += 1
+        self.money -= cost
+        return tower
+
+    def tower_at(self, x, y):
+        # Башня занимает ровно свою клетку (size == CELL_SIZE)
+        tower_id = self.board.tower_id_at(int(x // CELL_SIZE), int(y // CELL_SIZE))
+        return self.towers[tower_id - 1] if tower_id is not None else None
+
+    def enemy_at(self, x, y):
+        # Враг под курсором; сетка строится заново, если её нет в targeting
+        spatial = self.targeting
+        if not isinstance(spatial, SpatialHash):
+            spatial = SpatialHash()
+            spatial.update(self.enemies)
+        found = spatial.at_point(x, y)
+        return found[-1] if found else None
+
+    def upgrade_tower(self, tower):
+        upgrade_price = 200 if tower.level == 4 else tower.upgrade_cost
+        if self.money < upgrade_price:
+            return False
+        index = self.towers.index(tower)
+        if not tower.upgrade():
+            return False
+        if self.replay is not None:
+            self.replay.record(self.tick_count, CMD_UPGRADE, index)
+        self.money -= upgrade_price
+        if not tower.first_upgrade_done:
+            tower.first_upgrade_done = True
+        elif tower.level < 4:
+            tower.upgrade_cost = min(200, tower.upgrade_cost + 25)
+        return True
 
-    if wave_in_progress:
-        spawn_timer += 1
-        if spawn_timer >= spawn_interval and spawned_enemies < enemies_to_spawn:
-            if wave % 5 == 0 and spawned_enemies == enemies_to_spawn - 1:
-                enemies.append(BossEnemy(path))
+    def state_digest(self):
+        """Отпечаток полного состояния партии - для сверки записи и воспроизведения."""
+        state = (
+            self.tick_count, self.wave, self.lives, self.money, self.wave_in_progress,
+            self.enemies_to_spawn, self.spawned_enemies,
+            [(tick, cls.__name__, health) for tick, _, cls, health in sorted(self.timeline)],
+            self.wave_break_timer, self.paused, self.rng.getstate(),
+            [(type(e).__name__, e.distance, e.health, e.max_health) for e in self.enemies],
+            [(b.x, b.y, b.damage) for b in self.bullets],
+            [(t.x, t.y, t.level, t.damage, t.range, t.reload_counter) for t in self.towers],
+        )
+        if self.impacts:
+            # Только если очередь не пуста: отпечатки партий с наведением прежние
+            state += ([(impact[0], impact[3], impact[2].damage) for impact in sorted(self.impacts)],)
+        return hashlib.md5(repr(state).encode()).digest()
+
+    def step(self, n_ticks=1):
+        """Прогоняет до n_ticks тиков; останавливается на паузе или при проигрыше.
+
+        Возвращает число реально выполненных тиков.
+        """
+        done = 0
+        while done < n_ticks and not self.paused and not self.game_over:
+            self.tick()
+            done += 1
+        return done
+
+    def tick(self):
+        self.tick_count += 1
+        timer = self.timer
+        if timer is None:
+            self.update_waves()
+            self.update_bullets()
+            self.update_enemies()
+            self.update_towers()
+            return
+        t = time.perf_counter()
+        self.update_waves()
+        t = timer.lap("spawn", t)
+        self.update_bullets()
+        t = timer.lap("bullets", t)
+        self.update_enemies()
+        t = timer.lap("enemies", t)
+        self.update_towers()
+        timer.lap("towers", t)
+
+    # Фазы тика. NumpySimulation (numpy_engine.py) переопределяет всё,
+    # что касается хранения врагов и снарядов, и переиспользует остальное.
+
+    def add_enemy(self, enemy):
+        self.enemies.append(enemy)
+
+    def enemy_count(self):
+        return len(self.enemies)
+
+    def bullet_count(self):
+        # Снаряд в очереди с уже мёртвой целью погас бы, как Bullet с alive == False
+        return len(self.bullets) + sum(1 for impact in self.impacts if self.impact_pending(impact))
+
+    @staticmethod
+    def impact_pending(impact):
+        # Цель попадания из очереди жива и это всё ещё она, а не новый враг
+        # из пула в том же объекте
+        target = impact[2].target
+        return target.alive and target.generation == impact[8]
+
+    def visible_bullets(self):
+        """Снаряды для отрисовки; снаряды из очереди - BulletView на их прямой полёта.
+
+        Сами снаряды из очереди не трогаются: отрисовка только читает состояние.
+        """
+        if not self.impacts:
+            return self.bullets
+        now = self.tick_count
+        shown = list(self.bullets)
+        for impact in self.impacts:
+            if self.impact_pending(impact):
+                impact_tick, _, bullet, fired, x0, y0, x1, y1, _ = impact
+                part = (now - fired) / (impact_tick - fired)
+                shown.append(BulletView(x0 + (x1 - x0) * part, y0 + (y1 - y0) * part,
+                                        bullet.radius, bullet.image))
+        return shown
+
+    def schedule_impact(self, bullet):
+        # Снаряд, выпущенный башней на этом тике: попадание по расписанию, а
+        # если цель быстрее снаряда - обычное наведение
+        target = bullet.target
+        path = target.path
+        flight = path.intercept(target.distance, target.speed, bullet.x, bullet.y, bullet.speed)
+        if flight is None:
+            self.bullets.append(bullet)
+            return
+        aim_x, aim_y = path.position_at(min(target.distance + target.speed * (flight - 1), path.length))
+        heapq.heappush(self.impacts, (self.tick_count + flight, self.impact_seq, bullet,
+                                      self.tick_count, bullet.x, bullet.y, aim_x, aim_y,
+                                      target.generation))
+        self.impact_seq += 1
+
+    def pack_entities(self):
+        # Столбцы врагов и снарядов и цели башен для Snapshot
+        enemies, bullets = self.enemies, self.bullets
+        enemy_index = {enemy: i for i, enemy in enumerate(enemies)}
+        tower_index = {tower: i for i, tower in enumerate(self.towers)}
+        kinds = {cls: i for i, cls in enumerate(Snapshot.ENEMY_KINDS)}
+        path_index = {path: i for i, path in enumerate(self.paths)}
+        enemy_columns = {
+            "kind": [kinds[type(e)] for e in enemies],
+            "path": [path_index[e.path] for e in enemies],
+            "segment": [e.pos_index for e in enemies],
+            "distance": [e.distance for e in enemies],
+            "x": [e.x for e in enemies],
+            "y": [e.y for e in enemies],
+            "speed": [e.speed for e in enemies],
+            "health": [e.health for e in enemies],
+            "max_health": [e.max_health for e in enemies],
+            "alive": [e.alive for e in enemies],
+        }
+        bullet_columns = {
+            "x": [b.x for b in bullets],
+            "y": [b.y for b in bullets],
+            "speed": [b.speed for b in bullets],
+            "damage": [b.damage for b in bullets],
+            "target": [enemy_index.get(b.target, -1) for b in bullets],
+            "source": [tower_index.get(b.source, -1) for b in bullets],
+        }
+        # Отсортированная очередь - тоже куча; номера событий перенумеруются
+        impacts = sorted(self.impacts)
+        impact_columns = {
+            "tick": [impact[0] for impact in impacts],
+            "fired": [impact[3] for impact in impacts],
+            "x0": [impact[4] for impact in impacts],
+            "y0": [impact[5] for impact in impacts],
+            "x1": [impact[6] for impact in impacts],
+            "y1": [impact[7] for impact in impacts],
+            "damage": [impact[2].damage for impact in impacts],
+            "target": [enemy_index.get(impact[2].target, -1) if self.impact_pending(impact) else -1
+                       for impact in impacts],
+            "source": [tower_index.get(impact[2].source, -1) for impact in impacts],
+        }
+        tower_targets = [enemy_index.get(t.current_target, -1) for t in self.towers]
+        return enemy_columns, bullet_columns, impact_columns, tower_targets
+
+    def restore_entities(self, enemy_columns, bullet_columns, impact_columns, tower_targets):
+        # Обратное к pack_entities: объекты создаются без __init__, радиус и
+        # картинка берутся у образца своего класса
+        paths = self.paths
+        looks = []
+        for cls in Snapshot.ENEMY_KINDS:
+            sample = cls(self.path, 1) if cls in (BossEnemy, FastBossEnemy) else cls(self.path)
+            looks.append((cls, sample.radius, sample.image))
+        enemies = []
+        append = enemies.append
+        for kind, path, segment, distance, x, y, speed, health, max_health, alive in zip(
+                *(enemy_columns[name] for name, _ in Snapshot.ENEMY_COLUMNS)):
+            cls, radius, image = looks[kind]
+            enemy = cls.__new__(cls)
+            enemy.generation = next(_enemy_generations)
+            enemy.path = paths[path]
+            enemy.pos_index = segment
+            enemy.distance = distance
+            enemy.x = x
+            enemy.y = y
+            enemy.speed = speed
+            enemy.health = health
+            enemy.max_health = max_health
+            enemy.radius = radius
+            enemy.alive = bool(alive)
+            enemy.image = image
+            append(enemy)
+
+        # Цель, уже убранная из партии, мертва: снаряд в неё просто погаснет
+        gone = Enemy(self.path)
+        gone.alive = False
+        towers = self.towers
+        sample = Bullet(0, 0, gone)
+        bullets = []
+        append = bullets.append
+        for x, y, speed, damage, target, source in zip(
+                *(bullet_columns[name] for name, _ in Snapshot.BULLET_COLUMNS)):
+            bullet = Bullet.__new__(Bullet)
+            bullet.x = x
+            bullet.y = y
+            bullet.speed = speed
+            bullet.target = enemies[target] if target >= 0 else gone
+            bullet.source = towers[source] if source >= 0 else None
+            bullet.radius = sample.radius
+            bullet.damage = damage
+            bullet.alive = True
+            bullet.image = sample.image
+            append(bullet)
+
+        impacts = []
+        for seq, (tick, fired, x0, y0, x1, y1, damage, target, source) in enumerate(zip(
+                *(impact_columns[name] for name, _ in Snapshot.IMPACT_COLUMNS))):
+            bullet = Bullet(x0, y0, enemies[target] if target >= 0 else gone,
+                            towers[source] if source >= 0 else None)
+            bullet.damage = damage
+            impacts.append((tick, seq, bullet, fired, x0, y0, x1, y1, bullet.target.generation))
+
+        for tower, target in zip(towers, tower_targets):
+            tower.current_target = enemies[target] if target >= 0 else None
+        self.enemies[:] = enemies
+        self.bullets[:] = bullets
+        self.impacts = impacts
+        self.impact_seq = len(impacts)
+        if self.targeting is not None:
+            self.targeting.update(self.enemies)
+
+    def update_waves(self):
+        if self.wave_in_progress:
+            # Из кучи берутся только наступившие события, сколько бы их ни
+            # пришлось на этот тик
+            timeline = self.timeline
+            paths = self.paths
+            while timeline and timeline[0][0] <= self.tick_count:
+                _, _, cls, health = heapq.heappop(timeline)
+                enemy = make_enemy(cls, paths[self.spawned_enemies % len(paths)], self.wave, self.pool)
+                enemy.health = enemy.max_health = health
+                self.add_enemy(enemy)
+                self.spawned_enemies += 1
+
+            if not timeline and self.enemy_count() == 0:
+                self.wave_in_progress = False
+                self.wave_break_timer = 0
+        else:
+            self.wave_break_timer += 1
+            if self.wave_break_timer >= wave_break:
+                self.start_wave()
+
+    # Списки уплотняются за один проход на месте: живые сдвигаются к началу,
+    # хвост отрезается. Порядок сохраняется, копий списка и remove() нет.
+
+    def update_bullets(self):
+        pool = self.pool
+        impacts = self.impacts
+        # Попадания по расписанию: только наступившие, в порядке выстрелов.
+        # Цель, убитая раньше (или уже отданная пулом новому врагу), отменяет
+        # попадание, как alive у Bullet.move
+        while impacts and impacts[0][0] <= self.tick_count:
+            impact = heapq.heappop(impacts)
+            bullet = impact[2]
+            if self.impact_pending(impact):
+                bullet.hit()
+            if pool is not None:
+                pool.release(bullet)
+        bullets = self.bullets
+        kept = 0
+        for bullet in bullets:
+            bullet.move()
+            if bullet.alive:
+                bullets[kept] = bullet
+                kept += 1
+            elif pool is not None:
+                pool.release(bullet)
+        del bullets[kept:]
+        if pool is not None:
+            pool.recycle()
+
+    def update_enemies(self):
+        enemies = self.enemies
+        # Попадания из очереди сверяют generation цели, так что убранного
+        # врага можно отдавать в пул и при непустой очереди
+        pool = self.pool
+        kept = 0
+        for enemy in enemies:
+            if enemy.health <= 0 or not enemy.alive:
+                self.money += 10
+            elif not enemy.move():
+                self.lives -= 1
+                # Дошедший до конца враг больше не цель: летящие в него снаряды гаснут
+                enemy.alive = False
             else:
-                enemies.append(spawn_enemy_for_wave(wave, path))
-            spawned_enemies += 1
-            spawn_timer = 0
+                enemies[kept] = enemy
+                kept += 1
+                continue
+            if pool is not None:
+                pool.release_later(enemy)
+        del enemies[kept:]
+
+    def update_towers(self):
+        enemies = self.enemies
+        targeting = self.targeting
+        if targeting is not None:
+            targeting.update(enemies)
+        bullets = self.bullets if self.projectiles == "homing" else []
+        pool = self.pool
+        for tower in self.towers:
+            tower.update()
+            tower.shoot(enemies, bullets, targeting, pool)
+        if bullets is not self.bullets:
+            for bullet in bullets:
+                self.schedule_impact(bullet)
+
+CMD_PLACE = 1        # поставить башню: клетка x, клетка y, цена
+CMD_UPGRADE = 2      # улучшить башню: номер башни в sim.towers
+CMD_START_WAVE = 3   # кнопка "Начать волну сейчас"
+CMD_PAUSE = 4        # переключить паузу
+
+class Replay:
+    """Запись партии: seed и команды игрока с номерами тиков.
+
+    Файл: заголовок (магия, версия, seed, число команд, отпечатки карты,
+    описаний волн и BALANCE, имя карты), команды по 11 байт и в конце
+    номер последнего тика с отпечатком состояния, по которому
+    воспроизведение проверяет, что партия прошла так же. Карта и волны в
+    файл не пишутся: при воспроизведении нужны те же --map и --waves, а
+    иначе play() сразу говорит, что не так.
+    """
+
+    MAGIC = b"TDRP"
+    # 2: враги волны разыгрываются при её старте (compile_wave), так что
+    # состояние генератора в отпечатке у записей версии 1 другое.
+    # 3: отпечатки карты, волн и BALANCE в заголовке
+    VERSION = 3
+    _HEADER = struct.Struct("<4sHQI8s8s8sH")
+    _EVENT = struct.Struct("<IBhhh")
+    _FOOTER = struct.Struct("<I16s")
+
+    def __init__(self, seed, setup=None):
+        self.seed = seed
+        # (имя карты, отпечаток карты, отпечаток волн, отпечаток BALANCE)
+        self.setup = setup if setup is not None else self.current_setup(current_map)
+        self.events = []
+        self.final_tick = 0
+        self.final_digest = b""
+
+    @staticmethod
+    def current_setup(game_map):
+        def digest(value):
+            return hashlib.md5(repr(value).encode("utf-8")).digest()[:8]
+        map_key = (game_map.cols, game_map.rows, game_map.cell_size, game_map.path_cells,
+                   game_map.blocked, game_map.bounded)
+        waves = sorted(wave_definitions.items())
+        return game_map.name, digest(map_key), digest(waves), digest(sorted(BALANCE.items()))
+
+    @classmethod
+    def attach(cls, sim):
+        replay = cls(sim.seed, cls.current_setup(sim.game_map))
+        sim.replay = replay
+        return replay
+
+    def check_setup(self, game_map):
+        # Та же ли карта, волны и баланс, что при записи
+        map_name, map_digest, waves_digest, balance_digest = self.setup
+        current_name, current_map_digest, current_waves, current_balance = self.current_setup(game_map)
+        if map_digest != current_map_digest:
+            raise ValueError(f"запись сделана на карте {map_name!r}, а сейчас карта "
+                             f"{current_name!r} (нужен тот же --map)")
+        if waves_digest != current_waves:
+            raise ValueError("описания волн отличаются от записанных (нужен тот же --waves)")
+        if balance_digest != current_balance:
+            raise ValueError("BALANCE отличается от того, с которым сделана запись")
+
+    def record(self, tick, command, a=0, b=0, c=0):
+        self.events.append((tick, command, a, b, c))
+
+    def finish(self, sim):
+        self.final_tick = sim.tick_count
+        self.final_digest = sim.state_digest()
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            map_name, map_digest, waves_digest, balance_digest = self.setup
+            name = map_name.encode("utf-8")
+            f.write(self._HEADER.pack(self.MAGIC, self.VERSION, self.seed, len(self.events),
+                                      map_digest, waves_digest, balance_digest, len(name)))
+            f.write(name)
+            for event in self.events:
+                f.write(self._EVENT.pack(*event))
+            f.write(self._FOOTER.pack(self.final_tick, self.final_digest))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            data = f.read()
+        magic, version = struct.unpack_from("<4sH", data, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{filename}: не файл записи или неизвестная версия {version}")
+        (_, _, seed, count, map_digest, waves_digest, balance_digest,
+         name_len) = cls._HEADER.unpack_from(data, 0)
+        offset = cls._HEADER.size
+        map_name = data[offset:offset + name_len].decode("utf-8")
+        offset += name_len
+        replay = cls(seed, (map_name, map_digest, waves_digest, balance_digest))
+        for _ in range(count):
+            replay.events.append(cls._EVENT.unpack_from(data, offset))
+            offset += cls._EVENT.size
+        replay.final_tick, replay.final_digest = cls._FOOTER.unpack_from(data, offset)
+        return replay
+
+    def play(self, sim=None):
+        """Повторяет команды на новой (или переданной) партии; возвращает её.
+
+        ValueError - если карта, волны или BALANCE не те, что при записи.
+        """
+        if sim is None:
+            sim = Simulation(seed=self.seed)
+        self.check_setup(sim.game_map)
+        for tick, command, a, b, c in self.events:
+            self._advance(sim, tick)
+            if command == CMD_PLACE:
+                sim.place_tower(a, b, c)
+            elif command == CMD_UPGRADE:
+                sim.upgrade_tower(sim.towers[a])
+            elif command == CMD_START_WAVE:
+                sim.start_wave_now()
+            elif command == CMD_PAUSE:
+                sim.toggle_pause()
+        self._advance(sim, self.final_tick)
+        return sim
+
+    @staticmethod
+    def _advance(sim, tick):
+        while sim.tick_count < tick:
+            if sim.step(tick - sim.tick_count) == 0:
+                break   # пауза или конец игры - дальше двигает только команда
+
+    def matches(self, sim):
+        return sim.tick_count == self.final_tick and sim.state_digest() == self.final_digest
+
+# Автосейв в начале каждой волны; путь меняется через --autosave
+AUTOSAVE_FILE = "autosave.tdsave"
+
+class Snapshot:
+    """Снимок партии в компактном двоичном виде: сохранение, продолжение, развилки.
+
+    Файл: заголовок (магия, версия, числа партии, размеры таблиц), состояние
+    генератора случайных чисел, длины путей карты и таблицы башен, врагов,
+    снарядов, попаданий по расписанию и ещё не вышедших врагов волны по
+    столбцам - каждый столбец одним куском array. Ссылки между
+    объектами хранятся номерами строк: цель снаряда и башни - номер в
+    таблице врагов, стрелок - номер в таблице башен, -1 - ссылки нет
+    (цель уже убрана из партии и снаряд погаснет на следующем тике).
+    Столбцы в порядке байт машины (little-endian на x86 и ARM).
+
+    Снимок не зависит от движка: NumpySimulation пишет и читает те же
+    столбцы прямо из своих массивов (pack_entities/restore_entities).
+    """
+
+    MAGIC = b"TDSV"
+    VERSION = 3
+    # магия, версия, seed, тик, волна, жизни, деньги, волна идёт, врагов в
+    # волне, выпущено, таймер перерыва, пауза, есть ли gauss_next,
+    # gauss_next, снаряды по расписанию, число путей, башен, врагов,
+    # снарядов, попаданий в очереди, событий волны
+    _HEADER = struct.Struct("<4sHQIIqqBIIIBBdBHIIIII")
+    RNG_WORDS = 625
+
+    ENEMY_KINDS = (Enemy, FastEnemy, BossEnemy, FastBossEnemy)
+    TOWER_COLUMNS = (("x", "q"), ("y", "q"), ("level", "q"), ("damage", "q"), ("range", "q"),
+                     ("reload_time", "q"), ("reload_counter", "q"), ("upgrade_cost", "q"),
+                     ("upgrade_increment", "q"), ("first_upgrade_done", "q"),
+                     ("damage_dealt", "q"), ("target", "q"))
+    ENEMY_COLUMNS = (("kind", "b"), ("path", "b"), ("segment", "i"), ("distance", "d"),
+                     ("x", "d"), ("y", "d"), ("speed", "d"), ("health", "q"),
+                     ("max_health", "q"), ("alive", "b"))
+    BULLET_COLUMNS = (("x", "d"), ("y", "d"), ("speed", "d"), ("damage", "q"),
+                      ("target", "q"), ("source", "i"))
+    IMPACT_COLUMNS = (("tick", "q"), ("fired", "q"), ("x0", "d"), ("y0", "d"), ("x1", "d"),
+                      ("y1", "d"), ("damage", "q"), ("target", "q"), ("source", "i"))
+    TIMELINE_COLUMNS = (("tick", "q"), ("kind", "b"), ("health", "q"))
+
+    @classmethod
+    def capture(cls, sim):
+        """Состояние партии sim в bytes."""
+        enemies, bullets, impacts, tower_targets = sim.pack_entities()
+        impact_count = len(impacts["tick"])
+        towers = sim.towers
+        version, rng_state, gauss_next = sim.rng.getstate()
+        header = cls._HEADER.pack(
+            cls.MAGIC, cls.VERSION, sim.seed, sim.tick_count, sim.wave, sim.lives, sim.money,
+            sim.wave_in_progress, sim.enemies_to_spawn, sim.spawned_enemies,
+            sim.wave_break_timer, sim.paused, gauss_next is not None,
+            gauss_next if gauss_next is not None else 0.0, sim.projectiles == "analytic",
+            len(sim.paths), len(towers), sim.enemy_count(), len(bullets["x"]), impact_count,
+            len(sim.timeline))
+        parts = [header, array("I", rng_state).tobytes(),
+                 array("d", [path.length for path in sim.paths]).tobytes()]
+        tower_columns = {name: [getattr(tower, name) for tower in towers]
+                         for name, _ in cls.TOWER_COLUMNS[:-1]}
+        tower_columns["target"] = tower_targets
+        cls._pack_columns(parts, cls.TOWER_COLUMNS, tower_columns, len(towers))
+        cls._pack_columns(parts, cls.ENEMY_COLUMNS, enemies, sim.enemy_count())
+        cls._pack_columns(parts, cls.BULLET_COLUMNS, bullets, len(bullets["x"]))
+        cls._pack_columns(parts, cls.IMPACT_COLUMNS, impacts, impact_count)
+        # Отсортированный список - тоже куча, порядок номеров событий сохраняется
+        events = sorted(sim.timeline)
+        kinds = {kind: i for i, kind in enumerate(cls.ENEMY_KINDS)}
+        cls._pack_columns(parts, cls.TIMELINE_COLUMNS, {
+            "tick": [event[0] for event in events],
+            "kind": [kinds[event[2]] for event in events],
+            "health": [event[3] for event in events],
+        }, len(events))
+        return b"".join(parts)
+
+    @staticmethod
+    def _pack_columns(parts, spec, columns, count):
+        for name, code in spec:
+            column = columns[name]
+            if isinstance(column, list):
+                column = array(code, column)
+            data = column.tobytes()
+            if len(data) != count * array(code).itemsize:
+                raise ValueError(f"столбец {name}: ожидалось {count} значений типа {code}")
+            parts.append(data)
+
+    @staticmethod
+    def _unpack_columns(data, offset, spec, count):
+        columns = {}
+        for name, code in spec:
+            column = array(code)
+            end = offset + count * column.itemsize
+            column.frombytes(data[offset:end])
+            columns[name] = column
+            offset = end
+        return columns, offset
+
+    @classmethod
+    def restore(cls, sim, data):
+        """Переводит партию sim в состояние из снимка data; возвращает sim.
+
+        Карта (пути) должна быть той же, на которой снимок сделан.
+        """
+        data = memoryview(data)
+        if len(data) < cls._HEADER.size:
+            raise ValueError("не снимок партии: данных меньше заголовка")
+        (magic, version, seed, tick, wave, lives, money, wave_in_progress, enemies_to_spawn,
+         spawned, break_timer, paused, has_gauss, gauss_next, analytic, path_count,
+         tower_count, enemy_count, bullet_count, impact_count,
+         event_count) = cls._HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"не снимок партии или неизвестная версия {version}")
+        offset = cls._HEADER.size
+        rng_state, offset = cls._unpack_columns(data, offset, (("state", "I"),), cls.RNG_WORDS)
+        lengths, offset = cls._unpack_columns(data, offset, (("length", "d"),), path_count)
+        if list(lengths["length"]) != [path.length for path in sim.paths]:
+            raise ValueError("снимок сделан на другой карте")
+        towers, offset = cls._unpack_columns(data, offset, cls.TOWER_COLUMNS, tower_count)
+        enemies, offset = cls._unpack_columns(data, offset, cls.ENEMY_COLUMNS, enemy_count)
+        bullets, offset = cls._unpack_columns(data, offset, cls.BULLET_COLUMNS, bullet_count)
+        impacts, offset = cls._unpack_columns(data, offset, cls.IMPACT_COLUMNS, impact_count)
+        events, offset = cls._unpack_columns(data, offset, cls.TIMELINE_COLUMNS, event_count)
+        if offset != len(data):
+            raise ValueError("снимок партии повреждён: неверная длина")
+
+        sim.seed = seed
+        sim.rng.setstate((3, tuple(rng_state["state"]), gauss_next if has_gauss else None))
+        sim.tick_count = tick
+        sim.wave = wave
+        sim.lives = lives
+        sim.money = money
+        sim.wave_in_progress = bool(wave_in_progress)
+        sim.enemies_to_spawn = enemies_to_spawn
+        sim.spawned_enemies = spawned
+        sim.timeline = [(event_tick, i, cls.ENEMY_KINDS[kind], health)
+                        for i, (event_tick, kind, health) in enumerate(zip(*events.values()))]
+        sim.wave_break_timer = break_timer
+        sim.paused = bool(paused)
+        sim.projectiles = "analytic" if analytic else "homing"
+        # Партия пошла не так, как записывалась: повтор уже не воспроизвести
+        sim.replay = None
+
+        # Интервалы покрытия зависят только от клетки и дальности: у башен,
+        # которые уже стоят так же (загрузка в ту же партию), они не пересчитываются
+        coverage = {(t.x, t.y, t.range): t.coverage for t in sim.towers}
+        sim.towers.clear()
+        sim.board.reset()
+        names = [name for name, _ in cls.TOWER_COLUMNS[:-1]]
+        for row in zip(*(towers[name] for name in names)):
+            tower = Tower(row[0], row[1])
+            for name, value in zip(names, row):
+                setattr(tower, name, value)
+            tower.first_upgrade_done = bool(tower.first_upgrade_done)
+            tower.path = sim.path
+            tower.coverage = coverage.get((tower.x, tower.y, tower.range))
+            if tower.coverage is None:
+                tower.update_coverage()
+            sim.towers.append(tower)
+            sim.board.place_tower(tower.x // CELL_SIZE, tower.y // CELL_SIZE, len(sim.towers))
+        # Кэш фона рендерера привязан к версии расстановки
+        sim.layout_version += 1
+        sim.restore_entities(enemies, bullets, impacts, towers["target"])
+        return sim
+
+    @classmethod
+    def save(cls, sim, filename):
+        data = cls.capture(sim)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, filename, sim=None):
+        """Читает снимок в переданную или новую партию и возвращает её."""
+        with open(filename, "rb") as f:
+            data = f.read()
+        return cls.restore(sim if sim is not None else Simulation(), data)
+
+class SimClock:
+    """Сколько тиков симуляции прогнать за проход главного цикла при скорости 1x/2x/4x/max.
+
+    Симуляция всегда идёт тиками по 1/60 с и зависит только от их числа и
+    команд игрока, поэтому исход партии не зависит ни от скорости, ни от
+    частоты кадров. Тики копятся как долг от реального времени. Если машина
+    не успевает, кадр не рисуется (ввод всё равно опрашивается на каждом
+    проходе), а после MAX_FRAME_SKIP пропусков подряд остаток долга
+    сбрасывается: игра замедляется, но продолжает отвечать.
+    """
+
+    SCALES = (1, 2, 4, None)   # None - так быстро, как получается
+    # Сколько секунд за проход цикла можно отдать симуляции
+    FRAME_BUDGET = 1 / TICKS_PER_SECOND
+    MAX_FRAME_SKIP = 4
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.debt = 0.0
+        self.skipped = 0
+        self.dropped = 0   # тиков, от которых пришлось отказаться
+
+    @property
+    def label(self):
+        return "max" if self.scale is None else f"{self.scale}x"
+
+    def cycle(self):
+        i = self.SCALES.index(self.scale) if self.scale in self.SCALES else -1
+        self.set_scale(self.SCALES[(i + 1) % len(self.SCALES)])
+
+    def set_scale(self, scale):
+        self.scale = scale
+        self.reset()
+
+    def reset(self):
+        self.debt = 0.0
+        self.skipped = 0
+
+    def advance(self, sim, elapsed):
+        """Прогоняет тики за elapsed секунд реального времени.
+
+        Возвращает False, если кадр лучше пропустить, чтобы догнать время.
+        """
+        deadline = time.perf_counter() + self.FRAME_BUDGET
+        if self.scale is None:
+            while time.perf_counter() < deadline:
+                if sim.step(1) == 0:
+                    break
+            return True
 
-        if spawned_enemies == enemies_to_spawn and len(enemies) == 0:
-            wave_in_progress = False
-            wave_break_timer = 0
-    else:
-        wave_break_timer += 1
-        if wave_break_timer >= wave_break:
-            start_wave()
-
-    for bullet in bullets[:]:
-        bullet.move()
-        if not bullet.alive:
-            bullets.remove(bullet)
-
-    for enemy in enemies[:]:
-        if enemy.health <= 0 or not enemy.alive:
-            enemies.remove(enemy)
-            money += 10
-        else:
-            if not enemy.move():
-                lives -= 1
-                enemies.remove(enemy)
-
-    for tower in towers:
-        tower.update()
-        tower.shoot(enemies, bullets)
-
-    for enemy in enemies:
-        enemy.draw(screen)
-    for tower in towers:
-        highlight = (tower == selected_tower_for_info)
-        tower.draw(screen, highlight=highlight)
-
-    for bullet in bullets:
-        bullet.draw(screen)
-
-    for tower in towers:
-        tower.draw_turret_barrel(screen)
-
-    # Отрисовка жизней, денег и волны
-    lives_text = font.render(f"Жизни: {lives}", True, BLACK)
-    money_text = font.render(f"Деньги: {money}", True, BLACK)
-    wave_text = font.render(f"Волна: {wave}", True, BLACK)
-    screen.blit(lives_text, (10, 10))
-    screen.blit(money_text, (10, 50))
-    screen.blit(wave_text, (10, 90))
-
-    # Таймер до следующей волны (если волна не в процессе), смещён ниже надписей
-    if not wave_in_progress:
-        remaining_frames = max(wave_break - wave_break_timer, 0)
-        remaining_seconds = remaining_frames // 60
-        timer_text = font.render(f"Следующая волна через: {remaining_seconds} сек", True, BLACK)
-        screen.blit(timer_text, (10, 113.5))
-
-    # Кнопка "Начать волну сейчас" под надписями, чуть ниже таймера
-    if not wave_in_progress and not paused:
-        start_wave_button.draw(screen)
+        self.debt += elapsed * TICKS_PER_SECOND * self.scale
+        owed = int(self.debt)
+        done = 0
+        while done < owed:
+            if sim.step(1) == 0:
+                # Пауза или конец партии: время не копится
+                self.reset()
+                return True
+            done += 1
+            if time.perf_counter() >= deadline:
+                break
+        self.debt -= done
+        if self.debt >= 1:
+            if self.skipped < self.MAX_FRAME_SKIP:
+                self.skipped += 1
+                return False
+            behind = int(self.debt)
+            self.dropped += behind
+            self.debt -= behind
+        self.skipped = 0
+        return True
 
+class GameRenderer:
+    """Рисует состояние Simulation; само состояние никогда не меняет.
+
+    mode="full" - каждый кадр перерисовывается и выводится целиком.
+    mode="dirty" - сетка, путь и основания башен запечены в фоновую
+    поверхность, которая пересобирается только при смене размера окна или
+    постановке башни; каждый кадр фон восстанавливается лишь под прошлыми
+    спрайтами, и на экран уходят только изменённые прямоугольники.
+    """
 
     hints = [
         "ЛКМ: поставить башню (-50)",
         "ПКМ: инфо по башне",
         "Двойной ПКМ: улучшить башню",
         "Рост цены на улучшение, max уровень 5",
-        "P: пауза"
+        "P: пауза, F: скорость 1x/2x/4x/max, F9: к началу волны",
+        "F3: производительность, F4: запись трассы, `: консоль"
     ]
 
-    padding = 10
-    line_height = info_font.get_height()
+    # Если изменённых прямоугольников больше, дешевле отдать экран целиком
+    MAX_DIRTY_RECTS = 400
+
+    HEALTH_BAR_WIDTH = CELL_SIZE * 0.6
+    HEALTH_BAR_HEIGHT = 6
+
+    # Слои, которые можно отключать из консоли разработчика (layer ...)
+    LAYERS = ("grid", "path", "towers", "enemies", "health", "bullets", "barrels", "hud")
+
+    def __init__(self, mode="dirty", batched=True):
+        self.mode = mode
+        # batched=False - старая отрисовка: по несколько вызовов на каждого врага
+        self.batched = batched
+        self.health_bars = None
+        # PhaseTimer для замеров времени по проходам отрисовки
+        self.timer = None
+        self.background = None
+        self.background_key = None
+        self.prev_rects = []
+        self.dirty = None        # None - обновить весь экран
+        self.full_redraw = True
+        self.paused_drawn = False
+        self.layers = set(self.LAYERS)
+        self.layers_version = 0
+        # Надпись о скорости игры ("4x"); None - обычная скорость
+        self.speed_label = None
+
+    def set_layer(self, name, visible):
+        if visible:
+            self.layers.add(name)
+        else:
+            self.layers.discard(name)
+        # Сетка, путь и основания башен запечены в фон
+        self.layers_version += 1
+        self.invalidate()
+
+    def invalidate(self):
+        # Следующий кадр нарисовать и вывести целиком (новая партия, выход из меню)
+        self.full_redraw = True
+
+    def draw(self, surface, sim, selected_tower=None):
+        if self.mode == "full":
+            self.draw_full(surface, sim, selected_tower)
+        else:
+            self.draw_dirty(surface, sim, selected_tower)
+
+    def present(self):
+        timer = self.timer
+        if timer is not None:
+            t = time.perf_counter()
+        if self.dirty is None:
+            pygame.display.flip()
+        elif self.dirty:
+            pygame.display.update(self.dirty)
+        if timer is not None:
+            timer.lap("present", t)
+
+    def draw_full(self, surface, sim, selected_tower=None):
+        timer = self.timer
+        if timer is not None:
+            t = time.perf_counter()
+        self.dirty = None
+        layers = self.layers
+        surface.fill(WHITE)
+
+        if "grid" in layers:
+            draw_blocked(surface, sim.board.blocked)
+        if "path" in layers:
+            for sim_path in sim.paths:
+                draw_path(surface, sim_path)
+        if "grid" in layers:
+            draw_grid(surface)
+
+        if sim.paused:
+            self.draw_pause(surface)
+            return
+        if timer is not None:
+            t = timer.lap("background", t)
+
+        if self.batched:
+            surface.blits(self.enemy_sprites(sim.enemies), False)
+        elif "enemies" in layers:
+            for enemy in sim.enemies:
+                enemy.draw(surface)
+        if timer is not None:
+            t = timer.lap("sprites", t)
+        if "towers" in layers:
+            for tower in sim.towers:
+                highlight = (tower == selected_tower)
+                tower.draw(surface, highlight=highlight)
+        if timer is not None:
+            t = timer.lap("tower_bases", t)
+
+        if self.batched:
+            surface.blits(self.bullet_sprites(sim.visible_bullets()), False)
+        elif "bullets" in layers:
+            for bullet in sim.visible_bullets():
+                bullet.draw(surface)
+        if timer is not None:
+            t = timer.lap("sprites", t)
+
+        if "barrels" in layers:
+            for tower in sim.towers:
+                tower.draw_turret_barrel(surface)
+        if timer is not None:
+            t = timer.lap("barrels", t)
+
+        if "hud" in layers:
+            self.draw_hud(surface, sim)
+        if timer is not None:
+            t = timer.lap("hud", t)
+
+        if selected_tower is not None:
+            draw_tower_info(surface, selected_tower)
+            if timer is not None:
+                timer.lap("tower_info", t)
+
+    def enemy_sprites(self, enemies):
+        # Те же картинки и координаты, что у Enemy.draw, в виде списка для blits()
+        bars = self.health_bars
+        if bars is None:
+            bars = self.health_bars = HealthBarStrip(self.HEALTH_BAR_WIDTH, self.HEALTH_BAR_HEIGHT)
+        half_bar = self.HEALTH_BAR_WIDTH / 2
+        sprites = []
+        add = sprites.append
+        bodies = "enemies" in self.layers
+        health = "health" in self.layers
+        if not bodies and not health:
+            return sprites
+        for enemy in enemies:
+            if bodies:
+                image = enemy.image or circle_sprite(RED, enemy.radius)
+                x, y = int(enemy.x), int(enemy.y)
+                add((image, (x - image.get_width() // 2, y - image.get_height() // 2)))
+            if health:
+                add((bars.get(enemy.health / enemy.max_health),
+                     (int(enemy.x - half_bar - 1), int(enemy.y - enemy.radius - 16))))
+        return sprites
+
+    def bullet_sprites(self, bullets):
+        sprites = []
+        if "bullets" not in self.layers:
+            return sprites
+        add = sprites.append
+        for bullet in bullets:
+            image = bullet.image or circle_sprite(BLACK, bullet.radius)
+            add((image, (int(bullet.x) - image.get_width() // 2,
+                         int(bullet.y) - image.get_height() // 2)))
+        return sprites
+
+    def draw_pause(self, surface):
+        dark_overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        dark_overlay.fill((0, 0, 0, 150))
+        surface.blit(dark_overlay, (0, 0))
+
+        pause_text = render_text(font, "пауза", WHITE)
+        surface.blit(pause_text, (WIDTH // 2 - pause_text.get_width() // 2,
+                                  HEIGHT // 2 - pause_text.get_height() // 2))
+
+    def build_background(self, surface, sim):
+        background = pygame.Surface(surface.get_size()).convert()
+        background.fill(WHITE)
+        layers = self.layers
+        if "grid" in layers:
+            draw_blocked(background, sim.board.blocked)
+        if "path" in layers:
+            for sim_path in sim.paths:
+                draw_path(background, sim_path)
+        if "grid" in layers:
+            draw_grid(background)
+        if "towers" in layers:
+            for tower in sim.towers:
+                tower.draw(background)
+        self.background = background
+
+    def draw_dirty(self, surface, sim, selected_tower=None):
+        timer = self.timer
+        if timer is not None:
+            t = time.perf_counter()
+        # Флаг забирается в начале кадра: invalidate() из главного потока,
+        # пока кадр рисуется в RenderPipeline, относится к следующему кадру
+        full = self.full_redraw
+        self.full_redraw = False
+        # Доска своя у каждой партии, в том числе у её снимков RenderFrame
+        key = (surface.get_size(), sim.board, sim.layout_version, self.layers_version)
+        if key != self.background_key:
+            self.build_background(surface, sim)
+            self.background_key = key
+            full = True
+        background = self.background
+
+        if sim.paused:
+            # Картинка паузы статична: рисуем её один раз
+            if not self.paused_drawn:
+                surface.blit(background, (0, 0))
+                self.draw_pause(surface)
+                self.paused_drawn = True
+                self.dirty = None
+            else:
+                self.dirty = []
+            # После паузы кадр всё равно рисуется целиком
+            self.full_redraw = True
+            self.prev_rects = []
+            return
+        self.paused_drawn = False
 
-    for i, hint in enumerate(hints):
-        text_surf = info_font.render(hint, True, BLACK)
-        x = 10
-        y = HEIGHT - padding - line_height * (len(hints) - i)
-        screen.blit(text_surf, (x, y))
+        if full or len(self.prev_rects) > self.MAX_DIRTY_RECTS:
+            # При тысячах спрайтов один большой blit дешевле тысяч маленьких
+            surface.blit(background, (0, 0))
+            full = True
+        else:
+            for rect in self.prev_rects:
+                surface.blit(background, rect, rect)
+        if timer is not None:
+            t = timer.lap("background", t)
+
+        if self.batched:
+            # Все враги, их полоски здоровья и снаряды - одним вызовом blits()
+            sprites = self.enemy_sprites(sim.enemies)
+            sprites.extend(self.bullet_sprites(sim.visible_bullets()))
+            rects = surface.blits(sprites)
+        else:
+            rects = []
+            if "enemies" in self.layers:
+                for enemy in sim.enemies:
+                    rects.append(enemy.draw(surface))
+            if "bullets" in self.layers:
+                for bullet in sim.visible_bullets():
+                    rects.append(bullet.draw(surface))
+        add = rects.append
+        if selected_tower is not None:
+            add(selected_tower.draw_highlight(surface))
+        if timer is not None:
+            t = timer.lap("sprites", t)
+        if "barrels" in self.layers:
+            for tower in sim.towers:
+                rect = tower.draw_turret_barrel(surface)
+                if rect is not None:
+                    add(rect)
+        if timer is not None:
+            t = timer.lap("barrels", t)
+        if "hud" in self.layers:
+            rects.extend(self.draw_hud(surface, sim))
+        if timer is not None:
+            t = timer.lap("hud", t)
+        if selected_tower is not None:
+            add(draw_tower_info(surface, selected_tower))
+            if timer is not None:
+                timer.lap("tower_info", t)
+
+        if full or len(rects) + len(self.prev_rects) > self.MAX_DIRTY_RECTS:
+            self.dirty = None
+        else:
+            self.dirty = self.prev_rects + rects
+        self.prev_rects = rects
 
-    if selected_tower_for_info is not None:
-        draw_tower_info(screen, selected_tower_for_info)
+    def add_overlay_rect(self, rect):
+        # Область, нарисованная поверх кадра после draw() (оверлей, консоль):
+        # её нужно вывести сейчас и стереть фоном в следующем кадре
+        if self.mode == "full":
+            return
+        self.prev_rects.append(rect)
+        if self.dirty is not None:
+            self.dirty.append(rect)
+
+    def draw_hud(self, surface, sim):
+        rects = []
+        # Отрисовка жизней, денег и волны
+        lives_text = render_text(font, f"Жизни: {sim.lives}", BLACK)
+        money_text = render_text(font, f"Деньги: {sim.money}", BLACK)
+        wave_text = render_text(font, f"Волна: {sim.wave}", BLACK)
+        rects.append(surface.blit(lives_text, (10, 10)))
+        rects.append(surface.blit(money_text, (10, 50)))
+        rects.append(surface.blit(wave_text, (10, 90)))
+        if self.speed_label is not None:
+            speed_text = render_text(font, self.speed_label, BLUE)
+            rects.append(surface.blit(speed_text, (WIDTH // 2 - speed_text.get_width() // 2, 10)))
+
+        # Таймер до следующей волны (если волна не в процессе), смещён ниже надписей
+        if not sim.wave_in_progress:
+            remaining_frames = max(wave_break - sim.wave_break_timer, 0)
+            remaining_seconds = remaining_frames // TICKS_PER_SECOND
+            timer_text = render_text(font, f"Следующая волна через: {remaining_seconds} сек", BLACK)
+            rects.append(surface.blit(timer_text, (10, 113.5)))
+
+        # Кнопка "Начать волну сейчас" под надписями, чуть ниже таймера
+        if not sim.wave_in_progress and not sim.paused:
+            rects.append(start_wave_button.draw(surface))
+
+        padding = 10
+        line_height = info_font.get_height()
+
+        for i, hint in enumerate(self.hints):
+            text_surf = render_text(info_font, hint, BLACK)
+            x = 10
+            y = HEIGHT - padding - line_height * (len(self.hints) - i)
+            rects.append(surface.blit(text_surf, (x, y)))
+        return rects
+
+class EnemyView(namedtuple("EnemyView", "x y radius health max_health image")):
+    # Что GameRenderer.enemy_sprites читает у врага
+    __slots__ = ()
+
+class BulletView(namedtuple("BulletView", "x y radius image")):
+    # Снаряд для отрисовки: из RenderFrame и из очереди попаданий (visible_bullets)
+    __slots__ = ()
+
+    draw = Bullet.draw
+
+class TowerView(namedtuple("TowerView", "x y size range damage reload_time level upgrade_cost angle")):
+    # Рисуется теми же методами, что и Tower; угол ствола посчитан при снимке
+    __slots__ = ()
+
+    draw = Tower.draw
+    draw_highlight = Tower.draw_highlight
+    draw_turret_barrel = Tower.draw_turret_barrel
+
+    def barrel_angle(self):
+        return self.angle
+
+    @classmethod
+    def of(cls, tower):
+        return cls(tower.x, tower.y, tower.size, tower.range, tower.damage, tower.reload_time,
+                   tower.level, tower.upgrade_cost, tower.barrel_angle())
+
+class RenderFrame(namedtuple("RenderFrame", (
+        "tick", "board", "paths", "layout_version", "enemies", "bullets", "towers", "selected",
+        "lives", "money", "wave", "wave_in_progress", "wave_break_timer", "paused",
+        "speed_label"))):
+    """Неизменяемый снимок партии на один тик - всё, что читает GameRenderer.
+
+    Рисуется вместо Simulation (renderer.draw(surface, frame, frame.selected))
+    в потоке RenderPipeline, пока главный поток считает следующий тик. Враги,
+    снаряды и башни скопированы в кортежи EnemyView/BulletView/TowerView;
+    доска и пути - ссылки: клетки без застройки и пути за партию не меняются,
+    а расстановку башен фон берёт из towers.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def capture(cls, sim, selected_tower=None, speed_label=None):
+        enemies = tuple([EnemyView(e.x, e.y, e.radius, e.health, e.max_health, e.image)
+                         for e in sim.enemies])
+        bullets = tuple([BulletView(b.x, b.y, b.radius, b.image) for b in sim.visible_bullets()])
+        towers = tuple([TowerView.of(tower) for tower in sim.towers])
+        selected = TowerView.of(selected_tower) if selected_tower is not None else None
+        return cls(sim.tick_count, sim.board, sim.paths, sim.layout_version, enemies, bullets,
+                   towers, selected, sim.lives, sim.money, sim.wave, sim.wave_in_progress,
+                   sim.wave_break_timer, sim.paused, speed_label)
+
+    def visible_bullets(self):
+        return self.bullets
+
+class RenderPipeline:
+    """Отрисовка кадра N в отдельном потоке, пока главный поток считает тик N+1.
+
+    Главный поток снимает RenderFrame и отдаёт его в submit(); поток рисует
+    его в холст тем же GameRenderer. Перед следующим submit() главный поток
+    ждёт готовый кадр в finish(), дорисовывает поверх оверлей и консоль и
+    выводит кадр (renderer.present()): с pygame.SCALED вывод идёт через
+    рендерер SDL окна, и его лучше не трогать из другого потока. В работе
+    не больше двух снимков - рисуемый и собираемый, так что симуляция не
+    убегает от отрисовки больше чем на кадр. Пока кадр рисуется, главный
+    поток не рисует в холст и не выводит его.
+
+    Выигрыш есть, пока blit и fill в потоке отрисовки отпускают GIL; замер -
+    benchmarks/bench_pipeline.py. Ошибка в потоке отрисовки остаётся в
+    error, finish() возвращает False, и main() закрывает конвейер и рисует
+    по-старому, в одном потоке.
+    """
+
+    def __init__(self, renderer, surface):
+        self.renderer = renderer
+        self.surface = surface
+        self.frames = queue.Queue(maxsize=1)
+        self.drawn = queue.Queue(maxsize=1)
+        self.pending = False     # кадр отдан в поток и ещё не забран finish()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="render", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def available():
+        # На одном ядре потокам нечего перекрывать. Считаются ядра, доступные
+        # процессу, а не все ядра машины
+        try:
+            cores = len(os.sched_getaffinity(0))
+        except AttributeError:
+            cores = os.cpu_count() or 1
+        return cores > 1
+
+    def run(self):
+        renderer = self.renderer
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            try:
+                renderer.speed_label = frame.speed_label
+                renderer.draw(self.surface, frame, frame.selected)
+                error = None
+            except Exception as e:
+                error = e
+            self.drawn.put(error)
+
+    def submit(self, frame):
+        if self.pending:
+            raise RuntimeError("предыдущий кадр не забран finish()")
+        self.pending = True
+        self.frames.put(frame)
+
+    def finish(self):
+        # Дождаться кадра в работе; True, если он был и нарисован без ошибок
+        if not self.pending:
+            return False
+        self.pending = False
+        error = self.drawn.get()
+        if error is not None:
+            self.error = error
+            return False
+        return True
 
-    pygame.display.flip()
+    def close(self):
+        # Остановить поток; нарисованный, но не выведенный кадр пропадает
+        self.finish()
+        self.frames.put(None)
+        self.thread.join()
+
+class PerfOverlay:
+    """Оверлей производительности (F3) и запись трассы таймингов (F4).
+
+    Пока оверлей выключен, симуляция и рендерер работают без таймера, и
+    замеров нет вовсе. Включённый показывает перцентили времени кадра,
+    долю симуляции и отрисовки, время подсистем, число сущностей и занятость
+    звуковых каналов. Трасса сохраняется в формате Chrome Trace Event
+    (открывается в chrome://tracing или Perfetto).
+    """
+
+    HISTORY = 300          # кадров для перцентилей
+    REFRESH_FRAMES = 30    # как часто пересчитывать текст оверлея
+
+    # Фаза PhaseTimer -> подпись в оверлее
+    SUBSYSTEMS = (
+        ("towers", "Tower.shoot"),
+        ("bullets", "Bullet.move"),
+        ("enemies", "Enemy.move"),
+        ("spawn", "спавн"),
+        ("background", "draw_grid/фон"),
+        ("sprites", "спрайты"),
+        ("barrels", "стволы"),
+        ("hud", "HUD текст"),
+        ("present", "flip"),
+    )
+
+    def __init__(self):
+        self.enabled = False
+        self.timer = PhaseTimer()
+        self.frame_times = deque(maxlen=self.HISTORY)
+        self.work_times = deque(maxlen=self.HISTORY)
+        self.sim_total = 0.0
+        self.render_total = 0.0
+        self.frames = 0
+        self.last_frame_start = None
+        self.lines = []
+        self.trace = None
+        self.trace_frames = None
+
+    def toggle(self, sim, renderer):
+        self.enabled = not self.enabled
+        self.attach(sim, renderer)
+        return self.enabled
+
+    def attach(self, sim, renderer):
+        # Таймер нужен, пока оверлей включён или пишется трасса
+        timer = self.timer if self.enabled or self.trace is not None else None
+        if sim is not None:
+            sim.timer = timer
+        renderer.timer = timer
+        self.timer.reset()
+        self.frame_times.clear()
+        self.work_times.clear()
+        self.sim_total = self.render_total = 0.0
+        self.frames = 0
+        self.last_frame_start = None
+
+    @property
+    def active(self):
+        return self.enabled or self.trace is not None
+
+    def end_frame(self, frame_start, sim_done, render_done, sim):
+        if self.last_frame_start is not None:
+            self.frame_times.append(frame_start - self.last_frame_start)
+        self.last_frame_start = frame_start
+        self.work_times.append(render_done - frame_start)
+        self.sim_total += sim_done - frame_start
+        self.render_total += render_done - sim_done
+        self.frames += 1
+        if self.trace_frames is not None:
+            self.trace_frames.append(("frame", frame_start, render_done))
+        if self.enabled and self.frames >= self.REFRESH_FRAMES:
+            self.lines = self.build_lines(sim)
+            self.timer.reset()
+            self.sim_total = self.render_total = 0.0
+            self.frames = 0
+
+    @staticmethod
+    def percentile(values, p):
+        ordered = sorted(values)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def build_lines(self, sim):
+        ms = 1000
+        frames = self.frames or 1
+        lines = []
+        if self.frame_times:
+            lines.append("кадр мс p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+                self.percentile(self.frame_times, 50) * ms, self.percentile(self.frame_times, 95) * ms,
+                self.percentile(self.frame_times, 99) * ms, max(self.frame_times) * ms))
+        lines.append("работа мс p50 {:.2f}  p95 {:.2f}  p99 {:.2f}".format(
+            self.percentile(self.work_times, 50) * ms, self.percentile(self.work_times, 95) * ms,
+            self.percentile(self.work_times, 99) * ms))
+        lines.append("симуляция {:.2f} мс  отрисовка {:.2f} мс".format(
+            self.sim_total * ms / frames, self.render_total * ms / frames))
+        totals = self.timer.totals
+        for phase, label in self.SUBSYSTEMS:
+            if phase in totals:
+                lines.append(f"  {label}: {totals[phase] * ms / frames:.3f} мс")
+        if sim is not None:
+            lines.append(f"врагов {sim.enemy_count()}  снарядов {sim.bullet_count()}  "
+                         f"башен {len(sim.towers)}")
+        busy = sum(1 for ch in channels if ch.get_busy())
+        lines.append(f"звук: занято каналов {busy}/{len(channels)}, "
+                     f"слито {sound_scheduler.merged}, отброшено {sound_scheduler.dropped}")
+        if self.trace is not None:
+            lines.append(f"запись трассы: {len(self.trace)} событий")
+        return lines
 
-def main():
-    global game_state, money, lives, towers, enemies, bullets
-    global wave, wave_in_progress, enemies_to_spawn, spawned_enemies, spawn_timer, wave_break_timer
-    global WIDTH, HEIGHT, screen, start_button, selected_tower_for_info, paused
-    global start_wave_button
+    def draw(self, surface):
+        if not self.lines:
+            return None
+        line_height = info_font.get_height()
+        width = 360
+        rect = pygame.Rect(surface.get_width() - width - 10, 10, width,
+                           line_height * len(self.lines) + 10)
+        surface.fill((20, 20, 20), rect)
+        for i, line in enumerate(self.lines):
+            surface.blit(render_text(info_font, line, WHITE), (rect.x + 6, rect.y + 5 + i * line_height))
+        return rect
+
+    def start_capture(self, sim, renderer):
+        self.trace = []
+        self.trace_frames = []
+        self.timer.trace = self.trace
+        self.attach(sim, renderer)
+
+    def stop_capture(self, sim, renderer, filename=None):
+        if self.trace is None:
+            return None
+        if filename is None:
+            filename = time.strftime("trace-%Y%m%d-%H%M%S.json")
+        events = self.trace + self.trace_frames
+        origin = min((start for _, start, _ in events), default=0.0)
+        trace_events = [
+            {"name": name, "ph": "X", "pid": 1, "tid": 1,
+             "ts": (start - origin) * 1e6, "dur": (end - start) * 1e6}
+            for name, start, end in events
+        ]
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+        self.trace = None
+        self.trace_frames = None
+        self.timer.trace = None
+        self.attach(sim, renderer)
+        return filename
+
+def auto_place_towers(sim, count, level=1):
+    """Бесплатно ставит count башен на свободные клетки вокруг пути (для нагрузочных прогонов).
+
+    Сначала занимаются клетки вплотную к пути, затем следующие кольца вокруг него.
+    level может быть числом или последовательностью уровней, которая повторяется по кругу.
+    """
+    levels = [level] if isinstance(level, int) else list(level)
+    placed = []
+    ring = 1
+    while len(placed) < count and ring <= 50:
+        for cx, cy in sim.board.path_cells:
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    if max(abs(dx), abs(dy)) != ring:
+                        continue
+                    if len(placed) >= count:
+                        return placed
+                    nx, ny = cx + dx, cy + dy
+                    if nx < 0 or ny < 0 or not sim.can_place_tower(nx, ny):
+                        continue
+                    tower = sim.place_tower(nx, ny, cost=0)
+                    for _ in range(levels[len(placed) % len(levels)] - 1):
+                        tower.upgrade()
+                    placed.append(tower)
+        ring += 1
+    return placed
+
+class DevConsole:
+    """Консоль разработчика (клавиша `) для создания нагрузки прямо в игре.
+
+    Открыта ли консоль и что в ней набрано, хранится в глобальных
+    dev_console и console_input. Команды, меняющие партию, останавливают
+    запись повтора: такой повтор уже не воспроизвести.
+    """
+
+    LOG_LINES = 8
+
+    def __init__(self, renderer, overlay, sim_clock):
+        self.renderer = renderer
+        self.overlay = overlay
+        self.sim_clock = sim_clock
+        self.sim = None
+        self.log = []
+
+    def print(self, text):
+        self.log.append(text)
+        del self.log[:-self.LOG_LINES]
+
+    def handle_key(self, event):
+        # Возвращает True, если клавиша ушла в консоль
+        global dev_console, console_input
+        if event.key == pygame.K_BACKQUOTE:
+            dev_console = not dev_console
+            console_input = ""
+            self.renderer.invalidate()
+            return True
+        if not dev_console:
+            return False
+        if event.key == pygame.K_RETURN:
+            line = console_input.strip()
+            console_input = ""
+            if line:
+                self.print("> " + line)
+                self.execute(line)
+        elif event.key == pygame.K_BACKSPACE:
+            console_input = console_input[:-1]
+        elif event.key == pygame.K_ESCAPE:
+            dev_console = False
+            self.renderer.invalidate()
+        elif event.unicode and event.unicode.isprintable():
+            console_input += event.unicode
+        return True
+
+    def execute(self, line):
+        name, *args = line.split()
+        command = getattr(self, "cmd_" + name.lower(), None)
+        if command is None:
+            self.print(f"неизвестная команда: {name} (help - список)")
+            return
+        try:
+            command(*args)
+        except (TypeError, ValueError) as e:
+            self.print(f"ошибка: {e}")
+
+    def require_sim(self):
+        if self.sim is None:
+            raise ValueError("партия не начата")
+        if self.sim.replay is not None:
+            self.sim.replay = None
+            self.print("запись повтора остановлена")
+        return self.sim
+
+    def cmd_help(self):
+        self.print("spawn N [enemy|fast|boss|fastboss], wave N, preview [N], towers N [уровень],")
+        self.print("speed 1|2|4|max|N, layer [имя on|off], profile start|stop [файл],")
+        self.print("inspect - враг под курсором, save|load [файл] - снимок партии")
+
+    def cmd_spawn(self, count, kind="enemy"):
+        cls = ENEMY_CLASSES.get(kind)
+        if cls is None:
+            raise ValueError(f"класс врага: {', '.join(ENEMY_CLASSES)}")
+        sim = self.require_sim()
+        for _ in range(int(count)):
+            sim.add_enemy(make_enemy(cls, sim.path, max(sim.wave, 1), sim.pool))
+        self.print(f"добавлено {count} x {kind}, врагов: {sim.enemy_count()}")
+
+    def cmd_wave(self, number):
+        number = int(number)
+        if number < 1:
+            raise ValueError("номер волны с 1")
+        sim = self.require_sim()
+        sim.wave = number - 1
+        sim.start_wave()
+        sim.wave_break_timer = 0
+        self.print(f"волна {sim.wave}: {sim.enemies_to_spawn} врагов")
+
+    def cmd_preview(self, number=None):
+        if self.sim is None:
+            raise ValueError("партия не начата")
+        wave = self.sim.wave + 1 if number is None else int(number)
+        summary = self.sim.preview_wave(wave)
+        kinds = ", ".join(f"{name} {count}" for name, count in sorted(summary["kinds"].items()))
+        seconds = (summary["last_tick"] or 0) / TICKS_PER_SECOND
+        self.print(f"волна {wave}: {summary['count']} врагов ({kinds}), "
+                   f"здоровье {summary['health']}, выход за {seconds:.1f} с")
+
+    def cmd_towers(self, count, level="1"):
+        level = int(level)
+        if not 1 <= level <= 5:
+            raise ValueError("уровень от 1 до 5")
+        placed = auto_place_towers(self.require_sim(), int(count), level)
+        self.print(f"поставлено {len(placed)} башен уровня {level}")
+
+    def cmd_speed(self, scale):
+        if scale == "max":
+            scale = None
+        else:
+            scale = int(scale.rstrip("x"))
+            if scale < 1:
+                raise ValueError("скорость - не меньше 1x")
+        self.sim_clock.set_scale(scale)
+        self.print(f"скорость: {self.sim_clock.label}")
+
+    def cmd_layer(self, name=None, state=None):
+        layers = self.renderer.layers
+        if name is None:
+            self.print(" ".join(layer if layer in layers else f"-{layer}"
+                                for layer in GameRenderer.LAYERS))
+            return
+        if name not in GameRenderer.LAYERS:
+            raise ValueError(f"слои: {', '.join(GameRenderer.LAYERS)}")
+        visible = name not in layers if state is None else state == "on"
+        self.renderer.set_layer(name, visible)
+        self.print(f"{name}: {'on' if visible else 'off'}")
+
+    def cmd_inspect(self):
+        if self.sim is None:
+            raise ValueError("партия не начата")
+        enemy = self.sim.enemy_at(*pygame.mouse.get_pos())
+        if enemy is None:
+            self.print("под курсором врагов нет")
+        else:
+            self.print(f"{type(enemy).__name__}: здоровье {enemy.health}/{enemy.max_health}, "
+                       f"пройдено {enemy.distance:.0f} из {enemy.path.length:.0f}")
+
+    def cmd_save(self, filename=None):
+        if self.sim is None:
+            raise ValueError("партия не начата")
+        filename = filename or AUTOSAVE_FILE
+        try:
+            size = Snapshot.save(self.sim, filename)
+        except OSError as e:
+            raise ValueError(e.strerror or str(e))
+        self.print(f"снимок {filename}: {size} байт")
+
+    def cmd_load(self, filename=None):
+        global selected_tower_for_info
+        sim = self.require_sim()
+        filename = filename or AUTOSAVE_FILE
+        try:
+            Snapshot.load(filename, sim)
+        except OSError as e:
+            raise ValueError(e.strerror or str(e))
+        except struct.error as e:
+            raise ValueError(f"снимок партии повреждён: {e}")
+        selected_tower_for_info = None
+        self.renderer.invalidate()
+        self.print(f"загружен снимок {filename}: волна {sim.wave}, тик {sim.tick_count}")
+
+    def cmd_profile(self, action, filename=None):
+        if action == "start":
+            if self.overlay.trace is None:
+                self.overlay.start_capture(self.sim, self.renderer)
+            self.print("запись трассы идёт")
+        elif action == "stop":
+            saved = self.overlay.stop_capture(self.sim, self.renderer, filename)
+            self.print(f"трасса сохранена: {saved}" if saved else "запись не шла")
+        else:
+            raise ValueError("profile start|stop [файл]")
+
+    def draw(self, surface):
+        line_height = info_font.get_height()
+        lines = self.log + ["> " + console_input + "_"]
+        height = line_height * len(lines) + 10
+        rect = pygame.Rect(0, surface.get_height() - height, surface.get_width(), height)
+        surface.fill((20, 20, 20), rect)
+        for i, line in enumerate(lines):
+            surface.blit(render_text(info_font, line, WHITE), (rect.x + 6, rect.y + 5 + i * line_height))
+        return rect
+
+def make_simulation(engine="objects", seed=None, projectiles="homing"):
+    if engine == "numpy":
+        if projectiles != "homing":
+            raise ValueError("векторный движок считает только снаряды с наведением")
+        # NumPy нужен только векторному движку, поэтому импорт здесь
+        from numpy_engine import NumpySimulation
+        return NumpySimulation(seed=seed)
+    return Simulation(seed=seed, projectiles=projectiles)
+
+def run_headless(ticks, towers=0, tower_level=1, lives=None, render_every=0, engine="objects",
+                 render_mode="dirty", seed=None, projectiles="homing", pipelined=False):
+    """Гоняет симуляцию без окна так быстро, как получается.
+
+    render_every > 0 дополнительно отрисовывает каждый N-й тик в память
+    (через dummy-драйвер SDL), чтобы нагрузить и рендер; pipelined - рисовать в
+    потоке RenderPipeline параллельно следующим тикам. Векторный движок
+    (engine="numpy") не рисуется.
+    """
+    init_display(headless=True)
+    sim = make_simulation(engine, seed, projectiles)
+    if engine == "numpy":
+        render_every = 0
+    if lives is not None:
+        sim.lives = lives
+    auto_place_towers(sim, towers, tower_level)
+    sim.start_wave()
+
+    renderer = GameRenderer(render_mode) if render_every > 0 else None
+    pipeline = None
+    if renderer is not None and pipelined and RenderPipeline.available():
+        pipeline = RenderPipeline(renderer, screen)
+    started = time.perf_counter()
+    done = 0
+    while done < ticks and not sim.game_over:
+        chunk = min(render_every or ticks, ticks - done)
+        done += sim.step(chunk)
+        if pipeline is not None:
+            frame = RenderFrame.capture(sim)
+            if pipeline.finish():
+                renderer.present()
+            if pipeline.error is not None:
+                raise pipeline.error
+            pipeline.submit(frame)
+        elif renderer is not None:
+            renderer.draw(screen, sim)
+            renderer.present()
+    if pipeline is not None:
+        if pipeline.finish():
+            renderer.present()
+        pipeline.close()
+    elapsed = time.perf_counter() - started
+
+    rate = done / elapsed if elapsed > 0 else float("inf")
+    print(f"Тиков: {done} за {elapsed:.2f} с ({rate:.0f} тиков/с), seed {sim.seed}")
+    print(f"Волна: {sim.wave}, жизни: {sim.lives}, деньги: {sim.money}, "
+          f"врагов: {sim.enemy_count()}, снарядов: {sim.bullet_count()}")
+    if renderer is not None:
+        print(f"Кэш текста: попаданий {text_cache.hits}, промахов {text_cache.misses}")
+    pygame.quit()
+    return sim
+
+def run_replay(filename):
+    """Воспроизводит запись без окна на максимальной скорости и сверяет итог."""
+    try:
+        replay = Replay.load(filename)
+        started = time.perf_counter()
+        sim = replay.play()
+    except ValueError as e:
+        print(f"Запись {filename} не воспроизведена: {e}")
+        return False
+    elapsed = time.perf_counter() - started
+    rate = sim.tick_count / elapsed if elapsed > 0 else float("inf")
+    print(f"Запись {filename}: seed {replay.seed}, команд {len(replay.events)}, "
+          f"тиков {sim.tick_count} за {elapsed:.2f} с ({rate:.0f} тиков/с)")
+    print(f"Волна: {sim.wave}, жизни: {sim.lives}, деньги: {sim.money}")
+    if not replay.matches(sim):
+        print("Итоговое состояние НЕ совпало с записанным")
+        return False
+    print("Итоговое состояние совпало с записанным")
+    return True
+
+def finish_frame(renderer, overlay, console):
+    # Оверлей и консоль поверх нарисованного кадра, затем вывод на экран
+    if overlay.enabled:
+        rect = overlay.draw(screen)
+        if rect is not None:
+            renderer.add_overlay_rect(rect)
+    if dev_console:
+        renderer.add_overlay_rect(console.draw(screen))
+    renderer.present()
+
+def main(render_mode="dirty", seed=None, record_path=None, projectiles="homing",
+         pipelined=False):
+    global game_state, selected_tower_for_info
+
+    init_display()
+    # Звуки догружаются в фоне, пока показывается меню
+    load_assets(background_sounds=True)
 
     clock = pygame.time.Clock()
     running = True
-
-    wave = 0
-    wave_in_progress = False
-    enemies_to_spawn = 0
-    spawned_enemies = 0
-    spawn_timer = 0
-    wave_break_timer = 0
+    sim = None
+    replay = None
+    renderer = GameRenderer(render_mode)
+    pipeline = None
+    if pipelined:
+        if RenderPipeline.available():
+            pipeline = RenderPipeline(renderer, screen)
+        else:
+            print("одно ядро процессора: отрисовка в главном потоке")
+    overlay = PerfOverlay()
+    sim_clock = SimClock()
+    console = DevConsole(renderer, overlay, sim_clock)
+    elapsed = 1 / TICKS_PER_SECOND
+    autosaved_wave = 0   # волна, в начале которой сделан автосейв
 
     last_right_click_time = 0
     last_clicked_tower = None
     double_click_interval = 400
-    prev_paused_state = paused  # Для отслеживания смены паузы и звука
 
     while running:
+        if overlay.active:
+            frame_start = time.perf_counter()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             
             if event.type == pygame.VIDEORESIZE:
-                WIDTH, HEIGHT = event.w, event.h
-                screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
-                start_button = get_start_button()
-                start_wave_button = get_start_wave_button()
+                # Холст и кнопки прежние, SDL растягивает холст на новое окно
+                renderer.invalidate()
 
             if event.type == pygame.KEYDOWN:
+                if console.handle_key(event):
+                    if replay is not None and sim.replay is None:
+                        replay = None
+                    if overlay.active:
+                        frame_start = time.perf_counter()
+                    continue
+                if event.key == pygame.K_F3:
+                    overlay.toggle(sim, renderer)
+                    renderer.invalidate()
+                    if overlay.active:
+                        frame_start = time.perf_counter()
+                elif event.key == pygame.K_F4:
+                    if overlay.trace is None:
+                        overlay.start_capture(sim, renderer)
+                        frame_start = time.perf_counter()
+                    else:
+                        print("трасса сохранена:", overlay.stop_capture(sim, renderer))
+                        renderer.invalidate()
+                if event.key == pygame.K_f and game_state == PLAYING:
+                    sim_clock.cycle()
+                if event.key == pygame.K_F9 and game_state == PLAYING and os.path.exists(AUTOSAVE_FILE):
+                    # Вернуться к началу последней волны
+                    try:
+                        Snapshot.load(AUTOSAVE_FILE, sim)
+                    except (OSError, struct.error, ValueError) as e:
+                        print("автосейв не загружен:", e)
+                        continue
+                    autosaved_wave = sim.wave
+                    replay = None
+                    selected_tower_for_info = None
+                    last_clicked_tower = None
+                    sim_clock.reset()
+                    renderer.invalidate()
                 if event.key == pygame.K_p and game_state == PLAYING:
-                    paused = not paused
-                    if paused:
-                        play_sound(pause_on_sound)
+                    if sim.toggle_pause():
+                        sound_scheduler.request("pause_on_sound")
                     else:
-                        play_sound(pause_off_sound)
+                        sound_scheduler.request("pause_off_sound")
 
             if game_state == MENU:
                 if start_button.is_clicked(event):
                     game_state = PLAYING
-                    money = 100
-                    lives = 10
-                    towers = []
-                    enemies = []
-                    bullets = []
-                    wave = 0
-                    wave_in_progress = False
-                    enemies_to_spawn = 0
-                    spawned_enemies = 0
-                    spawn_timer = 0
-                    wave_break_timer = 0
+                    sim = Simulation(seed=seed, projectiles=projectiles)
+                    console.sim = sim
+                    sim_clock.reset()
+                    if record_path:
+                        replay = Replay.attach(sim)
+                    renderer.invalidate()
+                    if overlay.active:
+                        overlay.attach(sim, renderer)
                     selected_tower_for_info = None
                     last_right_click_time = 0
                     last_clicked_tower = None
-                    paused = False
-                    start_wave()
-                    
+                    sim.start_wave_now()
+                    autosaved_wave = 0
+
             elif game_state == PLAYING:
-                if not paused:
+                if not sim.paused:
                     if event.type == pygame.MOUSEBUTTONDOWN:
-                        mx, my = pygame.mouse.get_pos()
+                        # Координаты события уже в пикселях холста (pygame.SCALED)
+                        mx, my = event.pos
                         grid_x_index = mx // CELL_SIZE
                         grid_y_index = my // CELL_SIZE
 
                         # Проверка кнопки "Начать волну сейчас"
-                        if not wave_in_progress:
+                        if not sim.wave_in_progress:
                             if start_wave_button.is_clicked(event):
-                                start_wave()
-                                wave_break_timer = 0
+                                sim.start_wave_now()
                                 continue
 
                         if event.button == 1:  # ЛКМ - установка башни
-                            if (grid_x_index, grid_y_index) in path_cells:
-                                continue  # Нельзя ставить на путь
-
-                            grid_x = grid_x_index * CELL_SIZE + CELL_SIZE // 2
-                            grid_y = grid_y_index * CELL_SIZE + CELL_SIZE // 2
-
-                            can_place = True
-                            for tower in towers:
-                                if tower.x == grid_x and tower.y == grid_y:
-                                    can_place = False
-                                    break
-                            if can_place and money >= 50:
-                                towers.append(Tower(grid_x, grid_y))
-                                money -= 50
+                            if sim.place_tower(grid_x_index, grid_y_index) is not None:
                                 selected_tower_for_info = None
 
                         elif event.button == 3:  # ПКМ - инфо / улучшение
-                            clicked_tower = None
-                            for tower in towers:
-                                rect = pygame.Rect(0, 0, tower.size, tower.size)
-                                rect.center = (tower.x, tower.y)
-                                if rect.collidepoint(mx, my):
-                                    clicked_tower = tower
-                                    break
-
+                            clicked_tower = sim.tower_at(mx, my)
                             current_time = pygame.time.get_ticks()
 
                             if clicked_tower is not None:
                                 if clicked_tower == last_clicked_tower and (current_time - last_right_click_time) <= double_click_interval:
-                                    upgrade_price = 200 if clicked_tower.level == 4 else clicked_tower.upgrade_cost
-                                    if money >= upgrade_price:
-                                        success = clicked_tower.upgrade()
-                                        if success:
-                                            money -= upgrade_price
-                                            if not clicked_tower.first_upgrade_done:
-                                                clicked_tower.first_upgrade_done = True
-                                            else:
-                                                if clicked_tower.level < 4:
-                                                    clicked_tower.upgrade_cost = min(200, clicked_tower.upgrade_cost + 25)
+                                    sim.upgrade_tower(clicked_tower)
                                 selected_tower_for_info = clicked_tower
                             else:
                                 selected_tower_for_info = None
@@ -710,18 +3538,137 @@ def main():
                             last_clicked_tower = clicked_tower
 
         if game_state == MENU:
+            if pipeline is not None:
+                # Последний кадр закончившейся партии уже не нужен
+                pipeline.finish()
             main_menu()
         elif game_state == PLAYING:
-            game_loop()
-            if lives <= 0:
+            render = sim_clock.advance(sim, elapsed)
+            if sim.wave != autosaved_wave and not sim.game_over:
+                try:
+                    Snapshot.save(sim, AUTOSAVE_FILE)
+                except OSError as e:
+                    # Каталог только для чтения (киоск): игра идёт без автосейва
+                    print(f"Warning: autosave not written: {e}")
+                autosaved_wave = sim.wave
+            if overlay.active:
+                sim_done = time.perf_counter()
+            if render:
+                speed_label = None if sim_clock.scale == 1 else sim_clock.label
+                if pipeline is not None:
+                    # Кадр прошлого тика выводится, этот уходит в поток отрисовки
+                    frame = RenderFrame.capture(sim, selected_tower_for_info, speed_label)
+                    if pipeline.finish():
+                        finish_frame(renderer, overlay, console)
+                    if pipeline.error is None:
+                        pipeline.submit(frame)
+                    else:
+                        print("ошибка в потоке отрисовки, дальше в главном потоке:", pipeline.error)
+                        pipeline.close()
+                        pipeline = None
+                        renderer.invalidate()
+                if pipeline is None:
+                    renderer.speed_label = speed_label
+                    renderer.draw(screen, sim, selected_tower_for_info)
+                    finish_frame(renderer, overlay, console)
+            if overlay.active:
+                overlay.end_frame(frame_start, sim_done, time.perf_counter(), sim)
+            if sim.game_over:
                 game_state = MENU
                 selected_tower_for_info = None
-                paused = False
-
-        clock.tick(60)
-
+                if replay is not None:
+                    replay.finish(sim)
+                    replay.save(record_path)
+                    replay = None
+
+        sound_scheduler.flush()
+
+        # На скорости max кадры не ждут таймера
+        fps = TICKS_PER_SECOND if game_state != PLAYING or sim_clock.scale is not None else 0
+        elapsed = clock.tick(fps) / 1000
+
+    if pipeline is not None:
+        pipeline.close()
+    if replay is not None:
+        replay.finish(sim)
+        replay.save(record_path)
+    if overlay.trace is not None:
+        print("трасса сохранена:", overlay.stop_capture(sim, renderer))
     pygame.quit()
     sys.exit()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tower Defense")
+    parser.add_argument("--headless", action="store_true",
+                        help="симуляция без окна на максимальной скорости")
+    parser.add_argument("--ticks", type=int, default=60 * 60 * 10,
+                        help="сколько тиков прогнать в режиме --headless")
+    parser.add_argument("--towers", type=int, default=0,
+                        help="сколько башен бесплатно расставить вдоль пути")
+    parser.add_argument("--tower-level", type=int, default=1)
+    parser.add_argument("--lives", type=int, default=None)
+    parser.add_argument("--render-every", type=int, default=0,
+                        help="рисовать каждый N-й тик в память (0 - не рисовать)")
+    parser.add_argument("--engine", choices=("objects", "numpy"), default="objects",
+                        help="реализация врагов и снарядов для --headless")
+    parser.add_argument("--render", choices=("dirty", "full"), default="dirty",
+                        help="dirty - кэш фона и вывод только изменённых областей, "
+                             "full - перерисовка всего кадра")
+    parser.add_argument("--barrel-angles", type=int, default=BARREL_ANGLE_STEPS,
+                        help="число заранее повёрнутых положений ствола (0 - поворот каждый кадр)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed генератора случайных чисел партии")
+    parser.add_argument("--record", metavar="FILE",
+                        help="записать команды игрока в файл для воспроизведения")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="воспроизвести запись без окна и сверить итоговое состояние")
+    parser.add_argument("--map", metavar="FILE",
+                        help=f"карта из файла (см. {MAPS_DIR}/) вместо встроенной")
+    parser.add_argument("--projectiles", choices=Simulation.PROJECTILE_MODES, default="homing",
+                        help="homing - снаряды доворачивают на цель каждый тик, analytic - "
+                             "попадание рассчитывается при выстреле")
+    parser.add_argument("--waves", metavar="FILE",
+                        help="описания волн из JSON (см. wave_definitions)")
+    parser.add_argument("--autosave", metavar="FILE", default=AUTOSAVE_FILE,
+                        help="файл автосейва в начале волны (F9 - загрузить)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="рисовать кадр в отдельном потоке, пока считается следующий тик "
+                             "(с --headless - вместе с --render-every)")
+    args = parser.parse_args(argv)
+    if args.projectiles != "homing" and (args.record or args.engine == "numpy"):
+        # В записи повтора режима снарядов нет, векторный движок его не знает
+        parser.error("--projectiles analytic несовместим с --record и --engine numpy")
+    if args.engine == "numpy" and args.map:
+        try:
+            multi_path = len(load_map(args.map).paths) > 1
+        except (OSError, ValueError):
+            multi_path = False   # о битой карте скажет загрузка в __main__
+        if multi_path:
+            parser.error("--engine numpy поддерживает только карты с одним путём")
+    return args
+
 if __name__ == "__main__":
-    main()
+    # Модули, которые делают "import игра", должны получить этот же модуль, а не вторую копию
+    sys.modules.setdefault("игра", sys.modules[__name__])
+    args = parse_args()
+    BARREL_ANGLE_STEPS = args.barrel_angles
+    AUTOSAVE_FILE = args.autosave
+    if args.map:
+        try:
+            use_map(load_map(args.map))
+        except (OSError, ValueError) as e:
+            sys.exit(f"карта не загружена: {e}")
+    if args.waves:
+        try:
+            wave_definitions.update(load_waves(args.waves))
+        except ValueError as e:
+            sys.exit(f"волны не загружены: {e}")
+    if args.replay:
+        sys.exit(0 if run_replay(args.replay) else 1)
+    elif args.headless:
+        run_headless(args.ticks, args.towers, args.tower_level, args.lives,
+                     render_every=args.render_every, engine=args.engine,
+                     render_mode=args.render, seed=args.seed, projectiles=args.projectiles,
+                     pipelined=args.pipeline)
+    else:
+        main(args.render, args.seed, args.record, args.projectiles, args.pipeline)